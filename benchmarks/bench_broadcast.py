@@ -0,0 +1,85 @@
+"""
+Micro-benchmark: CPU cost of encoding one room broadcast.
+
+Compares the old path (every consumer in the group json.dumps-ing the full
+game_state for its own socket) against the encode-once path in game.wire,
+for both full snapshots and game_patch deltas. The per-socket wire.dumps
+case separates the two changes: the JSON backend (stdlib json against
+game.wire's, orjson when installed) and encoding once per broadcast.
+
+    python benchmarks/bench_broadcast.py [--recipients 12] [--number 2000]
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game import wire
+from game.deltas import diff
+
+COLORS = ['RED', 'GREEN', 'YELLOW', 'BLUE', 'ORANGE', 'PURPLE', 'CYAN', 'PINK']
+
+
+def session_key():
+    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=32))
+
+
+def ludo_state(players=8, spectators=4):
+    state = {
+        'players': {}, 'turn': 'RED', 'dice_value': 4, 'phase': 'MOVE',
+        'winner': None, 'consecutive_sixes': 0, 'last_moved_piece': None,
+    }
+    for color in COLORS[:players]:
+        state['players'][session_key()] = {
+            'side': color, 'name': f'Player {color.title()}',
+            'pieces': [random.randint(-1, 57) for _ in range(4)],
+            'finished_pieces': 0, 'is_bot': False,
+        }
+    for i in range(spectators):
+        state['players'][session_key()] = {'side': 'SPECTATOR', 'name': f'Viewer {i}'}
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recipients', type=int, default=12)
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    before = ludo_state()
+    after = json.loads(json.dumps(before))
+    mover = next(iter(after['players'].values()))
+    mover['pieces'][0] += 4
+    after['turn'], after['phase'], after['dice_value'] = 'GREEN', 'ROLL', 0
+    ops = diff(before, after)
+
+    full_event = {'type': 'game_update', 'game_state': after}
+    patch_event = {'type': 'game_patch', 'version': 42, 'ops': ops}
+
+    cases = [
+        ('per-socket json, full state', lambda: [json.dumps(full_event) for _ in range(args.recipients)]),
+        ('per-socket wire, full state', lambda: [wire.dumps(full_event) for _ in range(args.recipients)]),
+        ('encode-once, full state', lambda: wire.dumps(full_event)),
+        ('encode-once, patch', lambda: wire.dumps(patch_event)),
+    ]
+
+    print(f"backend: {'orjson' if wire.orjson else 'json'}; recipients: {args.recipients}")
+    print(f"full frame: {len(json.dumps(full_event))} bytes, patch frame: {len(wire.dumps(patch_event))} bytes")
+    timings = {}
+    for name, fn in cases:
+        per_update = timings[name] = min(timeit.repeat(fn, number=args.number, repeat=5)) / args.number * 1e6
+        baseline = timings[cases[0][0]]
+        print(f"{name:32s} {per_update:9.2f} us/update  ({baseline / per_update:5.1f}x)")
+    backend = timings['per-socket json, full state'] / timings['per-socket wire, full state']
+    once = timings['per-socket wire, full state'] / timings['encode-once, full state']
+    print(f"backend switch alone: {backend:.1f}x; encode-once alone: {once:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Room saves per second under each database profile (boardgames/database.py).
+
+Every profile runs in its own process against a fresh database. Worker
+threads then write ``Room.game_state`` for random rooms, the way
+``RoomStateManager.flush`` does. Each write is wrapped in
+``close_old_connections`` exactly like ``database_sync_to_async``, so
+connection reuse (``CONN_MAX_AGE``) counts too. Reports saves/s, p99
+latency and the writes that failed with "database is locked".
+
+    python benchmarks/bench_db_profiles.py [--threads 8] [--seconds 5] [--rooms 200]
+
+Set DATABASE_URL (a scratch database) to add a PostgreSQL run; it needs
+psycopg installed.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+
+def run_profile(threads, seconds, rooms):
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'boardgames.settings')
+    django.setup()
+
+    import random
+    from django.core.management import call_command
+    from django.db import OperationalError, close_old_connections, connection
+    from game.engines import get_engine
+    from game.models import Room
+
+    call_command('migrate', verbosity=0)
+    state = get_engine('LUDO').initial_state('ONLINE', 4)
+    pks = [Room.objects.create(game_type='LUDO', player_count=4, game_state=state).pk for _ in range(rooms)]
+    connection.close()
+
+    latencies, locked = [], [0]
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        rng = random.Random()
+        while time.perf_counter() < deadline:
+            state['dice_value'] = rng.randint(1, 6)
+            start = time.perf_counter()
+            close_old_connections()
+            try:
+                Room.objects.filter(pk=rng.choice(pks)).update(game_state=state)
+            except OperationalError:
+                locked[0] += 1
+            finally:
+                close_old_connections()
+            latencies.append(time.perf_counter() - start)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    latencies.sort()
+    saved = len(latencies) - locked[0]
+    return {
+        'saves_per_s': round(saved / seconds),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else None,
+        'locked': locked[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rooms', type=int, default=200)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_profile(args.threads, args.seconds, args.rooms)))
+        return
+
+    profiles = [('sqlite default', {'DB_PROFILE': 'default'}), ('sqlite wal', {'DB_PROFILE': 'wal'})]
+    if os.environ.get('DATABASE_URL'):
+        profiles.append(('postgres', {'DB_PROFILE': 'postgres'}))
+
+    for name, env in profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, SQLITE_PATH=os.path.join(tmp, 'bench.sqlite3'), **env)
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', '--threads', str(args.threads),
+                 '--seconds', str(args.seconds), '--rooms', str(args.rooms)],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{name:15} {result['saves_per_s']:7} saves/s  p99 {result['p99_ms']} ms  locked {result['locked']}")
+
+
+if __name__ == '__main__':
+    main()
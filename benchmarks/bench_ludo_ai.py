@@ -0,0 +1,64 @@
+"""
+Ludo bot strength and think time: RED plays at the given search level
+against greedy single-ply opponents; reports RED's win rate (a random seat
+would win 1/players) and the per-move search time.
+
+    python benchmarks/bench_ludo_ai.py [--games 40] [--players 4] [--level MEDIUM]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game.engines.ludo import LudoEngine
+from game.engines.ludo_ai import DIFFICULTIES, choose_move
+
+
+def play(engine, players, level, rng, think_times):
+    state = engine.initial_state('COMPUTER', players)
+    state, _ = engine.apply(state, {
+        'type': 'join', 'player_id': 'human', 'name': 'Human',
+        'mode': 'COMPUTER', 'player_count': players, 'preferred_color': 'RED',
+    })
+    while not state.get('winner'):
+        side = state['turn']
+        state, _ = engine.apply(state, {'type': 'roll', 'player': side, 'value': rng.randint(1, 6)})
+        if state['phase'] == 'AUTO_PASS':
+            state, _ = engine.apply(state, {'type': 'pass', 'player': side})
+            continue
+        if side == 'RED':
+            start = time.perf_counter()
+            index = choose_move(state, side, state['dice_value'], level, rng)
+            think_times.append(time.perf_counter() - start)
+        else:
+            index = engine.greedy_move(state, side, state['dice_value'])
+        state, _ = engine.apply(state, {'type': 'move', 'player': side, 'index': index})
+    return state['winner']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=40)
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--level', choices=list(DIFFICULTIES), default='MEDIUM')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    engine = LudoEngine()
+    rng = random.Random(args.seed)
+    think_times = []
+    wins = sum(play(engine, args.players, args.level, rng, think_times) == 'RED' for _ in range(args.games))
+
+    think_times.sort()
+    p50 = think_times[len(think_times) // 2] * 1000
+    p99 = think_times[int(len(think_times) * 0.99)] * 1000
+    print(f"{args.level} vs greedy, {args.players} players: RED won {wins}/{args.games} "
+          f"({wins / args.games:.0%}, random seat {1 / args.players:.0%})")
+    print(f"think time over {len(think_times)} moves: p50 {p50:.1f} ms  p99 {p99:.1f} ms  max {think_times[-1] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+@ai meme replies against a local stub meme API (no network): latency of
+the first, cold reply and of replies served from the prefetched buffer,
+plus how many requests the stub saw.
+
+    python benchmarks/bench_media.py [--replies 2000] [--interval 0.01] [--stub-delay 0.05]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'boardgames.settings')
+
+import django
+
+django.setup()
+
+from aiohttp import web
+
+from game.media import MediaService, MemeApiBackend
+
+
+async def run(replies, interval, stub_delay):
+    requests = []
+
+    async def gimme(request):
+        count = int(request.match_info['count'])
+        requests.append(count)
+        await asyncio.sleep(stub_delay)
+        return web.json_response({'count': count, 'memes': [
+            {'url': f'https://example.invalid/meme/{len(requests)}/{i}.jpg'} for i in range(count)
+        ]})
+
+    app = web.Application()
+    app.router.add_get('/gimme/{count}', gimme)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    service = MediaService(MemeApiBackend(f'http://127.0.0.1:{port}/gimme'))
+    start = time.perf_counter()
+    await service.reply('@ai meme')
+    cold = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(replies):
+        start = time.perf_counter()
+        await service.reply('@ai meme')
+        latencies.append(time.perf_counter() - start)
+        # @ai requests from all rooms together, one every ``interval`` seconds.
+        await asyncio.sleep(interval)
+    latencies.sort()
+
+    print(f"cold reply {cold * 1000:.1f} ms")
+    print(f"warm replies: p50 {latencies[len(latencies) // 2] * 1e6:.1f} us  "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} us  max {latencies[-1] * 1000:.2f} ms")
+    print(f"{len(requests)} requests to the meme API for {replies + 1} replies")
+    await service.close()
+    await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replies', type=int, default=2000)
+    parser.add_argument('--interval', type=float, default=0.01)
+    parser.add_argument('--stub-delay', type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(run(args.replies, args.interval, args.stub_delay))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Room scheduler under load: park a bot turn for N rooms (plus duplicate
+requests for each), then report how many asyncio tasks exist while they
+wait, how many jobs were deduplicated and how late the jobs fired.
+
+    python benchmarks/bench_scheduler.py [--rooms 10000] [--delay 1.0]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game.scheduler import Scheduler
+
+
+async def run(rooms, delay, duplicates):
+    scheduler = Scheduler()
+    loop = asyncio.get_running_loop()
+    lateness = []
+    done = asyncio.Event()
+
+    async def bot_turn(due):
+        lateness.append(loop.time() - due)
+        if len(lateness) == rooms:
+            done.set()
+
+    baseline = len(asyncio.all_tasks())
+    start = time.perf_counter()
+    scheduled = 0
+    for i in range(rooms):
+        d = delay * random.uniform(0.5, 1.5)
+        for _ in range(1 + duplicates):
+            # Several sockets in the room asking for the same bot turn.
+            scheduled += scheduler.schedule(f'room{i}', 'bot', d, bot_turn, loop.time() + d)
+    elapsed = time.perf_counter() - start
+
+    print(f"scheduled {scheduled} jobs from {rooms * (1 + duplicates)} requests "
+          f"in {elapsed * 1000:.1f} ms ({elapsed / rooms * 1e6:.2f} us/room)")
+    print(f"pending {scheduler.pending_count()}, extra tasks while waiting: {len(asyncio.all_tasks()) - baseline}")
+
+    await done.wait()
+    lateness.sort()
+    print(f"fire lateness: p50 {lateness[len(lateness) // 2] * 1000:.2f} ms  "
+          f"p99 {lateness[int(len(lateness) * 0.99)] * 1000:.2f} ms  max {lateness[-1] * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rooms', type=int, default=10000)
+    parser.add_argument('--delay', type=float, default=1.0)
+    parser.add_argument('--duplicates', type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(run(args.rooms, args.delay, args.duplicates))
+
+
+if __name__ == '__main__':
+    main()
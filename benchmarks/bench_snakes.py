@@ -0,0 +1,35 @@
+"""
+Snakes & Ladders layout balancing: play many games per built-in layout on
+the engine's precomputed move table and report game length, seat balance
+and simulation throughput.
+
+    python benchmarks/bench_snakes.py [--games 200000] [--players 2]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game.engines.snakes import LAYOUTS, simulate
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=200000)
+    parser.add_argument('--players', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for name, layout in LAYOUTS.items():
+        start = time.perf_counter()
+        stats = simulate(layout, args.games, players=args.players, seed=args.seed)
+        elapsed = time.perf_counter() - start
+        shares = ' '.join(f'{s:.3f}' for s in stats['win_share'])
+        print(f"{name:8s} mean turns {stats['mean_turns']:6.1f}  max {stats['max_turns']:4d}  "
+              f"seat wins [{shares}]  {args.games / elapsed:,.0f} games/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+JSON text frames against MessagePack binary frames (game/wire.py) for
+typical server messages: the game_update snapshot a joining or resyncing
+player gets, and the game_patch broadcast after each action, for
+Tic-Tac-Toe and for 4- and 8-player Ludo part way through a game.
+
+Reports bytes on the wire and encode/decode time per message.
+
+    python benchmarks/bench_wire.py [--moves 120] [--number 20000]
+"""
+import argparse
+import copy
+import os
+import random
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'boardgames.settings')
+
+import django
+
+django.setup()
+
+from game import wire
+from game.deltas import diff
+from game.engines import get_engine
+
+
+def session_key(rng):
+    # Player ids are session keys, as in real rooms.
+    return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(32))
+
+
+def play(game_type, players, moves, rng):
+    """A state ``moves`` actions into a game, and the patch for the last action."""
+    engine = get_engine(game_type)
+    state = engine.initial_state('ONLINE', players)
+    for i in range(players):
+        state, _ = engine.apply(state, {
+            'type': 'join', 'player_id': session_key(rng), 'name': f'Player {i + 1}',
+            'mode': 'ONLINE', 'player_count': players, 'preferred_color': None,
+        })
+    previous = state
+    for _ in range(moves):
+        previous = copy.deepcopy(state)
+        side = state['turn']
+        if game_type == 'TIC_TAC_TOE':
+            free = [i for i, cell in enumerate(state['board']) if cell is None]
+            if state.get('game_over') or not free:
+                state, _ = engine.apply(state, {'type': 'reset'})
+            else:
+                state, _ = engine.apply(state, {'type': 'move', 'player': side, 'index': rng.choice(free)})
+            continue
+        if state.get('winner'):
+            break
+        state, _ = engine.apply(state, {'type': 'roll', 'player': side, 'value': rng.randint(1, 6)})
+        if state['phase'] == 'AUTO_PASS':
+            state, _ = engine.apply(state, {'type': 'pass', 'player': side})
+            continue
+        previous = copy.deepcopy(state)
+        index = engine.greedy_move(state, side, state['dice_value'])
+        state, _ = engine.apply(state, {'type': 'move', 'player': side, 'index': index})
+    return state, diff(previous, state)
+
+
+def per_call(fn, arg, number):
+    return timeit.timeit(lambda: fn(arg), number=number) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--moves', type=int, default=120)
+    parser.add_argument('--number', type=int, default=20000, help='encodes/decodes timed per message')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if wire.msgpack is None:
+        sys.exit("msgpack is not installed")
+
+    rng = random.Random(args.seed)
+    messages = []
+    for label, game_type, players in (('TTT', 'TIC_TAC_TOE', 2), ('Ludo 4p', 'LUDO', 4), ('Ludo 8p', 'LUDO', 8)):
+        state, ops = play(game_type, players, args.moves, rng)
+        messages.append((f'{label} game_update', {'type': 'game_update', 'version': args.moves, 'game_state': state}))
+        messages.append((f'{label} game_patch', {'type': 'game_patch', 'version': args.moves, 'ops': ops}))
+
+    json_backend = 'orjson' if wire.orjson is not None else 'json'
+    print(f"JSON via {json_backend}, MessagePack via msgpack {'.'.join(map(str, wire.msgpack.version))}")
+    print(f"{'message':22} {'json B':>7} {'mpack B':>7} {'saved':>6}   "
+          f"{'json enc':>8} {'mpack enc':>9}   {'json dec':>8} {'mpack dec':>9}  (us)")
+    for label, payload in messages:
+        text, packed = wire.dumps(payload), wire.pack(payload)
+        assert wire.unpack(packed) == wire.loads(text)
+        size = len(text.encode())
+        print(f"{label:22} {size:7} {len(packed):7} {1 - len(packed) / size:6.0%}   "
+              f"{per_call(wire.dumps, payload, args.number):8.2f} {per_call(wire.pack, payload, args.number):9.2f}   "
+              f"{per_call(wire.loads, text, args.number):8.2f} {per_call(wire.unpack, packed, args.number):9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""
+End-to-end WebSocket load test: N rooms x M players play scripted games
+through the real ASGI application (``channels.testing.WebsocketCommunicator``,
+in-process, InMemoryChannelLayer) against a scratch SQLite database.
+
+All rooms connect and join first, then play concurrently: whoever's turn
+it is sends the next action (a random free cell in Tic-Tac-Toe, a roll or
+the greedy piece move in Ludo). Latency is measured from sending an action
+until the acting client has the broadcast patch for it. Reported per game:
+
+* p50/p99/max move-to-broadcast latency and actions per second;
+* database queries per action (every query on any connection while the
+  games run, write-behind flushes included);
+* memory per room over the connect/join phase (tracemalloc; includes the
+  test clients, so an upper bound).
+
+Ludo rolls without a legal move wait for the server's auto-pass timer;
+that wait is not counted as latency.
+
+    python benchmarks/bench_ws_load.py [--rooms 50] [--players 2] [--moves 40] [--output results.json]
+
+Settings come from the environment (DB_PROFILE, ROOM_STATE_FLUSH_INTERVAL,
+...), so runs can be compared profile against profile. Scripted players
+move far faster than people, so the per-connection message limits are
+raised unless WS_MESSAGE_RATE / WS_MESSAGE_LIMITS are set.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ACTION_TIMEOUT = 10
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+def apply_patch(state, ops):
+    """Python twin of applyPatch in game.js (see game/deltas.py for the format)."""
+    for op in ops:
+        path = op[0]
+        if not path:
+            state = op[1]
+            continue
+        target = state
+        for key in path[:-1]:
+            target = target[key]
+        if len(op) == 1:
+            del target[path[-1]]
+        else:
+            target[path[-1]] = op[1]
+    return state
+
+
+class Player:
+    def __init__(self, communicator):
+        self.communicator = communicator
+        self.side = None
+        self.state = None
+        self.version = None
+        self.errors = 0
+        # Bumped on every state change or error reply.
+        self.seq = 0
+        self.changed = asyncio.Event()
+        self.reader = asyncio.ensure_future(self.read())
+
+    async def read(self):
+        while True:
+            message = await self.communicator.receive_output(timeout=3600)
+            if message['type'] == 'websocket.close':
+                return
+            data = json.loads(message['text'])
+            if data['type'] in ('game_start', 'game_update'):
+                self.side = data.get('side', self.side)
+                self.state, self.version = data['game_state'], data['version']
+            elif data['type'] == 'game_patch' and self.state is not None and data['version'] == self.version + 1:
+                self.state, self.version = apply_patch(self.state, data['ops']), data['version']
+            elif data['type'] in ('error', 'rate_limited'):
+                self.errors += 1
+            else:
+                continue
+            self.seq += 1
+            self.changed.set()
+
+    async def wait_change(self, seq):
+        while self.seq == seq:
+            self.changed.clear()
+            await asyncio.wait_for(self.changed.wait(), ACTION_TIMEOUT)
+
+
+def next_action(game_type, state, engine, rng):
+    """What the player to move sends next, or None while a server timer has the turn."""
+    if game_type == 'TIC_TAC_TOE':
+        if state.get('game_over'):
+            return {'type': 'reset_game'}
+        free = [i for i, cell in enumerate(state['board']) if cell is None]
+        return {'type': 'make_move', 'index': rng.choice(free), 'player': state['turn']}
+    if state.get('winner'):
+        return {'type': 'reset_game'}
+    phase = state.get('phase', 'ROLL')
+    if phase == 'ROLL':
+        return {'type': 'roll_dice', 'player': state['turn']}
+    if phase == 'MOVE':
+        index = engine.greedy_move(state, state['turn'], state['dice_value'])
+        return {'type': 'make_move', 'index': index, 'player': state['turn']}
+    return None
+
+
+async def join_room(application, code, session_keys):
+    from channels.testing import WebsocketCommunicator
+    players = []
+    for key in session_keys:
+        communicator = WebsocketCommunicator(
+            application, f'/ws/game/{code}/', headers=[(b'cookie', f'sessionid={key}'.encode())])
+        connected, _ = await communicator.connect()
+        assert connected, f"room {code} refused a connection"
+        players.append(Player(communicator))
+    for player in players:
+        seq = player.seq
+        await player.communicator.send_json_to({'type': 'join_game'})
+        await player.wait_change(seq)
+    return players
+
+
+async def play_room(game_type, players, moves, latencies, rng):
+    from game.engines import get_engine
+    engine = get_engine(game_type)
+    # Everybody has seen every join before the first move.
+    await asyncio.sleep(0.2)
+
+    actions = 0
+    while actions < moves:
+        state = players[0].state
+        mover = next((p for p in players if p.side == state['turn']), players[0])
+        seq = mover.seq
+        action = next_action(game_type, mover.state, engine, rng)
+        if action is None:
+            await mover.wait_change(seq)
+            continue
+        start = time.perf_counter()
+        await mover.communicator.send_json_to(action)
+        await mover.wait_change(seq)
+        latencies.append(time.perf_counter() - start)
+        actions += 1
+        # The next mover must have the patch before choosing its action.
+        for player in players:
+            while player.version < mover.version:
+                await player.wait_change(player.seq)
+    return actions
+
+
+async def leave_room(players):
+    for player in players:
+        await player.communicator.disconnect()
+        player.reader.cancel()
+
+
+def percentile(values, p):
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 3) if values else None
+
+
+async def run_game(application, game_type, rooms, moves, counter, seed):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tables = await asyncio.gather(*(join_room(application, code, keys) for code, keys in rooms))
+    per_room = (tracemalloc.get_traced_memory()[0] - before) / len(rooms)
+    tracemalloc.stop()
+
+    latencies = []
+    queries_before = counter.count
+    start = time.perf_counter()
+    actions = sum(await asyncio.gather(*(
+        play_room(game_type, players, moves, latencies, random.Random(seed + i))
+        for i, players in enumerate(tables)
+    )))
+    elapsed = time.perf_counter() - start
+    queries = counter.count - queries_before
+    errors = sum(p.errors for players in tables for p in players)
+    await asyncio.gather(*(leave_room(players) for players in tables))
+
+    latencies.sort()
+    return {
+        'rooms': len(rooms),
+        'actions': actions,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'actions_per_s': round(actions / elapsed, 1),
+        'latency_ms': {
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+            'max': percentile(latencies, 1),
+        },
+        'queries_per_action': round(queries / max(actions, 1), 3),
+        'memory_per_room_kb': round(per_room / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rooms', type=int, default=50)
+    parser.add_argument('--players', type=int, default=2)
+    parser.add_argument('--moves', type=int, default=40, help='actions per room')
+    parser.add_argument('--games', default='TIC_TAC_TOE,LUDO')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['SQLITE_PATH'] = os.path.join(tmp.name, 'bench.sqlite3')
+    if os.environ.get('DB_PROFILE') == 'postgres':
+        del os.environ['DB_PROFILE']
+    os.environ.setdefault('MEDIA_BACKEND', 'static')
+    os.environ.setdefault('WS_MESSAGE_RATE', '1000')
+    os.environ.setdefault('WS_MESSAGE_LIMITS', 'make_move=1000/1000,roll_dice=1000/1000,reset_game=1000/1000')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'boardgames.settings')
+    import django
+    django.setup()
+
+    from django.contrib.sessions.backends.db import SessionStore
+    from django.core.management import call_command
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+    from game.models import Room
+    from boardgames.asgi import application
+
+    call_command('migrate', verbosity=0)
+    logging.getLogger('game').setLevel(logging.WARNING)
+    counter = QueryCounter()
+    connection_created.connect(
+        lambda sender, connection, **kwargs: connection.execute_wrappers.append(counter), weak=False)
+
+    results = {
+        'config': dict(vars(args), python=platform.python_version(),
+                       db_profile=os.environ.get('DB_PROFILE', 'default')),
+        'games': {},
+    }
+    for game_type in args.games.split(','):
+        rooms = []
+        for _ in range(args.rooms):
+            room = Room.objects.create(game_type=game_type, player_count=max(2, min(args.players, 4)))
+            keys = []
+            for p in range(args.players):
+                session = SessionStore()
+                session['player_name'] = f'Player {p}'
+                session.create()
+                keys.append(session.session_key)
+            rooms.append((room.code, keys))
+        connections.close_all()
+
+        result = asyncio.run(run_game(application, game_type, rooms, args.moves, counter, args.seed))
+        results['games'][game_type] = result
+        latency = result['latency_ms']
+        print(f"{game_type:12} {result['actions']:6} actions  {result['actions_per_s']:8} actions/s  "
+              f"p50 {latency['p50']} ms  p99 {latency['p99']} ms  "
+              f"{result['queries_per_action']} queries/action  {result['memory_per_room_kb']} KiB/room")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
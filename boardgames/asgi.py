@@ -11,10 +11,14 @@ django_asgi_app = get_asgi_application()
 
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
+import game.lifespan
 import game.routing
 
+game.lifespan.install()
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
+    "lifespan": game.lifespan.lifespan,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             game.routing.websocket_urlpatterns
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 from pathlib import Path
 
+from .database import database_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -96,15 +98,113 @@ CHANNEL_LAYERS = {
     }
 }
 
+# Live room state is held in memory by each worker and written back to
+# Room.game_state every ROOM_STATE_FLUSH_INTERVAL seconds (and on game end).
+ROOM_STATE_FLUSH_INTERVAL = float(os.environ.get('ROOM_STATE_FLUSH_INTERVAL', '2'))
+
+# Maximum number of pending actions per room before new client actions are
+# rejected with a "Room is busy" error.
+ROOM_ACTION_QUEUE_SIZE = int(os.environ.get('ROOM_ACTION_QUEUE_SIZE', '32'))
+
+# Rooms expire ROOM_TTL seconds after their last activity (moves, chat,
+# connections). Activity is written to the database at most once every
+# ROOM_ACTIVITY_WRITE_INTERVAL seconds per room.
+ROOM_TTL = int(os.environ.get('ROOM_TTL', '300'))
+ROOM_ACTIVITY_WRITE_INTERVAL = int(os.environ.get('ROOM_ACTIVITY_WRITE_INTERVAL', '30'))
+
+# Where live room state is shared between workers (see game/stores.py):
+# 'process' keeps it per worker (sockets of a room must share a worker),
+# 'redis' shares it through REDIS_URL so any worker can host any room, and
+# 'memory' is an in-process stand-in for tests.
+ROOM_STATE_STORE = os.environ.get('ROOM_STATE_STORE', 'process')
+ROOM_STATE_REDIS_URL = os.environ.get('REDIS_URL')
+ROOM_STATE_TTL = int(os.environ.get('ROOM_STATE_TTL', '3600'))
+
+# Room metadata cache used by the lobby, the room page and socket handshakes
+# (see game/room_cache.py).
+ROOM_CACHE_SIZE = int(os.environ.get('ROOM_CACHE_SIZE', '4096'))
+ROOM_CACHE_TTL = int(os.environ.get('ROOM_CACHE_TTL', '60'))
+
+# Expired rooms are archived and deleted by the sweeper (manage.py sweep_rooms,
+# or in-process every ROOM_SWEEP_INTERVAL seconds when non-zero) once they
+# have been expired for ROOM_SWEEP_GRACE seconds, ROOM_SWEEP_BATCH at a time.
+ROOM_SWEEP_INTERVAL = float(os.environ.get('ROOM_SWEEP_INTERVAL', '0'))
+ROOM_SWEEP_GRACE = int(os.environ.get('ROOM_SWEEP_GRACE', '3600'))
+ROOM_SWEEP_BATCH = int(os.environ.get('ROOM_SWEEP_BATCH', '200'))
+
+# Chat lines are buffered and written in batches of up to CHAT_FLUSH_SIZE,
+# at most CHAT_FLUSH_INTERVAL seconds after they were sent.
+CHAT_FLUSH_SIZE = int(os.environ.get('CHAT_FLUSH_SIZE', '50'))
+CHAT_FLUSH_INTERVAL = float(os.environ.get('CHAT_FLUSH_INTERVAL', '1'))
+# Chat messages sent to a player on join, and per "load older" page.
+CHAT_HISTORY_SIZE = int(os.environ.get('CHAT_HISTORY_SIZE', '30'))
+
+# WebSocket input guards (see GameConsumer.receive): the largest frame in
+# characters, the deepest JSON nesting, and each connection's message budget,
+# WS_MESSAGE_RATE per second in bursts of WS_MESSAGE_BURST overall, plus
+# (rate, burst) per message type. WS_MESSAGE_LIMITS overrides the latter,
+# e.g. "roll_dice=2/5,chat_message=1/4".
+WS_MAX_FRAME_SIZE = int(os.environ.get('WS_MAX_FRAME_SIZE', '8192'))
+WS_MAX_JSON_DEPTH = int(os.environ.get('WS_MAX_JSON_DEPTH', '8'))
+WS_MESSAGE_RATE = float(os.environ.get('WS_MESSAGE_RATE', '20'))
+WS_MESSAGE_BURST = int(os.environ.get('WS_MESSAGE_BURST', '40'))
+WS_MESSAGE_LIMITS = {
+    'join_game': (1, 5),
+    'make_move': (5, 10),
+    'roll_dice': (2, 5),
+    'reset_game': (1, 3),
+    'chat_message': (2, 8),
+    'search_stickers': (5, 10),
+    'sync_state': (1, 5),
+    'load_older_chat': (2, 5),
+}
+for _limit in filter(None, os.environ.get('WS_MESSAGE_LIMITS', '').split(',')):
+    _type, _, _budget = _limit.partition('=')
+    _rate, _, _burst = _budget.partition('/')
+    # A burst below one message would refuse that type outright.
+    WS_MESSAGE_LIMITS[_type.strip()] = (float(_rate), max(1, int(_burst or float(_rate))))
+
+# @ai replies (see game/media.py): meme source ('meme-api' at MEDIA_MEME_URL,
+# or 'static' for no requests), request timeout in seconds, memes kept
+# prefetched, outbound connection cap, and the per-room reply budget
+# (MEDIA_ROOM_RATE replies per second, bursts of MEDIA_ROOM_BURST).
+MEDIA_BACKEND = os.environ.get('MEDIA_BACKEND', 'meme-api')
+MEDIA_MEME_URL = os.environ.get('MEDIA_MEME_URL', 'https://meme-api.com/gimme')
+MEDIA_TIMEOUT = float(os.environ.get('MEDIA_TIMEOUT', '3'))
+MEDIA_BUFFER_SIZE = int(os.environ.get('MEDIA_BUFFER_SIZE', '20'))
+MEDIA_MAX_CONNECTIONS = int(os.environ.get('MEDIA_MAX_CONNECTIONS', '4'))
+MEDIA_ROOM_RATE = float(os.environ.get('MEDIA_ROOM_RATE', '0.2'))
+MEDIA_ROOM_BURST = int(os.environ.get('MEDIA_ROOM_BURST', '3'))
+
+# Sticker search (see game/stickers.py): an optional JSON catalog replacing
+# the built-in one, how many recent queries keep their results, and results
+# per page.
+STICKER_CATALOG = os.environ.get('STICKER_CATALOG')
+STICKER_CACHE_SIZE = int(os.environ.get('STICKER_CACHE_SIZE', '256'))
+STICKER_PAGE_SIZE = int(os.environ.get('STICKER_PAGE_SIZE', '24'))
+
+# Computer players: default Ludo search level (EASY, MEDIUM or HARD) and the
+# executor bot searches run on ('thread' or 'process') and its size.
+BOT_DIFFICULTY = os.environ.get('BOT_DIFFICULTY', 'MEDIUM')
+BOT_SEARCH_EXECUTOR = os.environ.get('BOT_SEARCH_EXECUTOR', 'thread')
+BOT_SEARCH_WORKERS = int(os.environ.get('BOT_SEARCH_WORKERS', '2'))
+
+# /metrics is off (404) unless the scraper sends METRICS_TOKEN as
+# "Authorization: Bearer <token>" or connects from one of the
+# comma-separated METRICS_ALLOWED_IPS (behind a proxy that is the proxy's
+# address, so prefer the token there).
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+# SQLite by default; DB_PROFILE=wal for the production SQLite profile, or
+# DB_PROFILE=postgres with DATABASE_URL for PostgreSQL, which needs psycopg
+# installed (see boardgames/database.py).
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_from_env(os.environ, BASE_DIR / 'db.sqlite3'),
 }
 
 
@@ -159,12 +259,39 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CSRF_TRUSTED_ORIGINS = ['https://*.onrender.com', 'https://boardgames-production.up.railway.app', 'http://127.0.0.1:8000', 'http://localhost:8000']
 
 # Logging Configuration
+# LOG_FORMAT=json writes one JSON object per line (see game/logs.py); the
+# text format shows the room a record is about, or '-'.
+# LOG_SAMPLE_RATE keeps that fraction of records below WARNING, so
+# LOG_LEVEL=DEBUG can be used in production. Per-message counts and
+# latencies are on /metrics instead of in the log.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '1'))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'text': {
+            '()': 'logging.Formatter',
+            'fmt': '%(asctime)s %(levelname)s %(name)s [%(room)s]: %(message)s',
+            'defaults': {'room': '-'},
+        },
+        'json': {
+            '()': 'game.logs.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sample': {
+            '()': 'game.logs.SampleFilter',
+            'rate': LOG_SAMPLE_RATE,
+        },
+    },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
+            'formatter': LOG_FORMAT,
+            'filters': ['sample'],
         },
     },
     'root': {
@@ -177,5 +304,10 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'game': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
     },
 }
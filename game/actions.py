@@ -0,0 +1,49 @@
+"""
+Applying actions to a live room and broadcasting the result.
+
+These work from a room code alone, via the process-wide channel layer, so
+that server-side work (bots, timers) can change a room and notify its
+sockets without going through any particular consumer.
+"""
+from channels.layers import get_channel_layer
+
+from . import wire
+from .engines import get_engine
+from .scheduler import scheduler
+from .state import room_states
+
+
+def group_name(room_code):
+    return f'game_{room_code}'
+
+
+async def broadcast(room_code, payload):
+    # Encode once here, per encoding; every socket in the group forwards
+    # the frame for the encoding it negotiated. MessagePack only when a
+    # socket in this process asked for it: sockets in other processes (and
+    # any socket when there is no binary frame) get the JSON text, which
+    # every client decodes.
+    event = {'type': 'room_frame', 'text': wire.dumps(payload)}
+    live = room_states.rooms.get(room_code)
+    if wire.msgpack is not None and live is not None and live.binary_subscribers > 0:
+        event['bytes'] = wire.pack(payload)
+    await get_channel_layer().group_send(group_name(room_code), event)
+
+
+async def broadcast_state(live):
+    ops = await room_states.publish(live)
+    if not ops:
+        return
+    await broadcast(live.code, {'type': 'game_patch', 'version': live.version, 'ops': ops})
+
+
+async def apply_action(live, action):
+    """Apply ``action`` through the room's engine. Must run on the room's queue."""
+    live.state, events = get_engine(live.game_type).apply(live.state, action)
+    room_states.mark_dirty(live)
+    if live.state.get('winner'):
+        # Game over: drop any bot turn or auto-pass still waiting.
+        scheduler.cancel(live.code, 'bot')
+        scheduler.cancel(live.code, 'pass')
+    await broadcast_state(live)
+    return events
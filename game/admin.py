@@ -1,7 +1,6 @@
-import csv
-from django.http import HttpResponse
 from django.contrib import admin
-from .models import Room, ChatLog
+from .exports import streaming_response
+from .models import Room, ChatLog, ArchivedRoom
 
 @admin.register(Room)
 class RoomAdmin(admin.ModelAdmin):
@@ -13,23 +12,25 @@ class RoomAdmin(admin.ModelAdmin):
 @admin.register(ChatLog)
 class ChatLogAdmin(admin.ModelAdmin):
     list_display = ('timestamp', 'room', 'sender', 'message')
+    list_select_related = ('room',)
     list_filter = ('room', 'sender', 'timestamp')
     search_fields = ('message', 'sender')
     readonly_fields = ('timestamp',)
-    actions = ['export_as_csv']
+    actions = ['export_as_csv', 'export_as_ndjson']
 
     def export_as_csv(self, request, queryset):
-        meta = self.model._meta
-        field_names = [field.name for field in meta.fields]
+        return streaming_response(queryset, 'csv', filename=self.model._meta)
 
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename={}.csv'.format(meta)
-        writer = csv.writer(response)
+    export_as_csv.short_description = "Export Selected as CSV"
 
-        writer.writerow(field_names)
-        for obj in queryset:
-            writer.writerow([getattr(obj, field) for field in field_names])
+    def export_as_ndjson(self, request, queryset):
+        return streaming_response(queryset, 'ndjson', filename=self.model._meta)
 
-        return response
+    export_as_ndjson.short_description = "Export Selected as NDJSON"
 
-    export_as_csv.short_description = "Export Selected as CSV"
+@admin.register(ArchivedRoom)
+class ArchivedRoomAdmin(admin.ModelAdmin):
+    list_display = ('code', 'game_type', 'winner', 'created_at', 'archived_at')
+    list_filter = ('game_type',)
+    search_fields = ('code',)
+    readonly_fields = ('archived_at',)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class GameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'game'
+
+    def ready(self):
+        # Connects the signal handlers that keep the room cache fresh.
+        from . import room_cache  # noqa: F401
+        # Index the sticker catalog before the first search.
+        from .stickers import sticker_catalog
+        sticker_catalog.load()
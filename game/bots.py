@@ -0,0 +1,150 @@
+"""
+Computer players.
+
+Ludo searches are plain CPU-bound functions (``engines.ludo_ai.choose_move``);
+they are handed to a shared executor so a bot thinking in one room never
+stalls the sockets of the others. ``BOT_SEARCH_EXECUTOR`` picks a thread
+pool (default) or a process pool, sized by ``BOT_SEARCH_WORKERS``.
+
+Tic-Tac-Toe is solved ahead of time (``engines.tictactoe_solver``), so its
+bot answers inline with a table lookup.
+
+Bot turns and auto-passes are driven by ``trigger`` and run as scheduler
+jobs keyed by room (see ``scheduler.py``). They only need the room code,
+so they keep going when the socket that started them goes away. They
+never load a room themselves (``submit(..., load=False)``) and stop once
+the room has been dropped from memory.
+"""
+import asyncio
+import random
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+
+from .actions import apply_action
+from .engines import IllegalAction, get_engine, tictactoe_solver
+from .engines.ludo_ai import DEFAULT_DIFFICULTY, DIFFICULTIES, choose_move
+from .scheduler import scheduler
+from .state import RoomGone, room_states
+
+THINK_DELAY = 1  # Before a bot rolls
+ANIMATION_DELAY = 1  # Between a bot's roll and its move
+AUTO_PASS_DELAY = 2  # Before the turn moves on after a roll with no moves
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'BOT_SEARCH_WORKERS', 2)
+        if getattr(settings, 'BOT_SEARCH_EXECUTOR', 'thread') == 'process':
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bot-search')
+    return _executor
+
+
+def get_difficulty(state):
+    difficulty = state.get('bot_difficulty') or getattr(settings, 'BOT_DIFFICULTY', DEFAULT_DIFFICULTY)
+    return difficulty if difficulty in DIFFICULTIES else DEFAULT_DIFFICULTY
+
+
+async def choose_ludo_move(state, color):
+    """Piece index for ``color`` to move with the rolled ``state['dice_value']``."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), choose_move, state, color, state['dice_value'], get_difficulty(state)
+    )
+
+
+def choose_tictactoe_move(state, side):
+    rate = tictactoe_solver.MISTAKE_RATES[get_difficulty(state)]
+    return tictactoe_solver.choose_move(state['board'], side, rate)
+
+
+async def trigger(room_code):
+    """Schedule the next bot step if a bot is to move in ``room_code``."""
+    live = room_states.rooms.get(room_code)
+    if live is None:
+        # Nobody is connected any more; bots pick up again on the next join.
+        return
+    bot_side = get_engine(live.game_type).bot_to_move(live.state)
+    if not bot_side:
+        return
+    if live.game_type == 'TIC_TAC_TOE':
+        # Solved game, so the reply is a table lookup; answer right away.
+        try:
+            await room_states.submit(room_code, apply_solver_move, bot_side, wait=True, load=False)
+        except (IllegalAction, RoomGone):
+            pass
+    elif live.game_type in ('LUDO', 'SNAKES_AND_LADDERS'):
+        scheduler.schedule(room_code, 'bot', THINK_DELAY, bot_roll, room_code, bot_side)
+
+
+def schedule_auto_pass(room_code, delay=AUTO_PASS_DELAY):
+    scheduler.schedule(room_code, 'pass', delay, auto_pass, room_code)
+
+
+async def auto_pass(room_code):
+    try:
+        await room_states.submit(room_code, apply_action, {'type': 'pass'}, wait=True, load=False)
+    except (IllegalAction, RoomGone):
+        return
+    await trigger(room_code)
+
+
+async def bot_roll(room_code, bot_color):
+    # Every step re-validates the turn inside the room's action queue,
+    # since humans and timers may have acted while we were waiting.
+    roll = {'type': 'roll', 'player': bot_color, 'value': random.randint(1, 6)}
+    try:
+        events = await room_states.submit(room_code, apply_action, roll, wait=True, load=False)
+    except (IllegalAction, RoomGone):
+        return
+    live = room_states.rooms.get(room_code)
+    if live is None:
+        return
+    if live.game_type == 'SNAKES_AND_LADDERS':
+        # Snakes & Ladders resolves the whole turn in the roll.
+        await trigger(room_code)
+    elif any(e['type'] == 'auto_pass' for e in events):
+        # No moves
+        schedule_auto_pass(room_code, ANIMATION_DELAY)
+    else:
+        scheduler.schedule(room_code, 'bot', ANIMATION_DELAY, bot_move, room_code, bot_color)
+
+
+async def bot_move(room_code, bot_color):
+    # Search on the executor, outside the room's queue, so other actions
+    # for the room are not held up while the bot thinks.
+    live = room_states.rooms.get(room_code)
+    if live is None:
+        return
+    state = live.state
+    if state['turn'] != bot_color or state.get('phase') != 'MOVE':
+        return
+    index = await choose_ludo_move(state, bot_color)
+    try:
+        await room_states.submit(room_code, apply_bot_move, bot_color, state, index, wait=True, load=False)
+    except (IllegalAction, RoomGone):
+        return
+    await trigger(room_code)
+
+
+async def apply_bot_move(live, bot_color, searched_state, index):
+    state = live.state
+    if state['turn'] != bot_color or state.get('phase') != 'MOVE':
+        raise IllegalAction("Bot turn is over")
+    if state is not searched_state:
+        # The room changed while the search ran (e.g. someone joined).
+        index = get_engine(live.game_type).greedy_move(state, bot_color, state['dice_value'])
+    return await apply_action(live, {'type': 'move', 'player': bot_color, 'index': index})
+
+
+async def apply_solver_move(live, bot_side):
+    state = live.state
+    if state['turn'] != bot_side or state.get('game_over'):
+        raise IllegalAction("Bot turn is over")
+    index = choose_tictactoe_move(state, bot_side)
+    return await apply_action(live, {'type': 'move', 'player': bot_side, 'index': index})
@@ -0,0 +1,134 @@
+"""
+Buffered chat persistence.
+
+Chat lines are collected in memory and written with one ``bulk_create``
+once ``CHAT_FLUSH_SIZE`` messages are waiting or ``CHAT_FLUSH_INTERVAL``
+seconds after the first unwritten one, whichever comes first. A burst of
+chat therefore costs one short SQLite transaction instead of one per line,
+and stays out of the way of game-state writes. Each ``ChatLog`` gets its
+timestamp when the message is sent, not when the batch is written.
+
+A disconnect leaves its lines to that timer rather than writing every
+room's buffer early. The buffer is also flushed on server shutdown and at
+interpreter exit. Messages still buffered when the process is killed
+outright are lost, which is acceptable for chat.
+
+``history`` pages backwards through a room's chat with a keyset cursor on
+``(timestamp, id)``, served by the ``(room, timestamp)`` index, so each
+page is a bounded index range scan however long the log is.
+"""
+import atexit
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .metrics import DB_SECONDS
+from .models import ChatLog
+from .scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+def get_flush_size():
+    return getattr(settings, 'CHAT_FLUSH_SIZE', 50)
+
+
+def get_flush_interval():
+    return getattr(settings, 'CHAT_FLUSH_INTERVAL', 1.0)
+
+
+def get_history_size():
+    return getattr(settings, 'CHAT_HISTORY_SIZE', 30)
+
+
+def parse_cursor(cursor):
+    """``[timestamp, id]`` as sent by the client, or None if it is malformed."""
+    try:
+        ts, pk = cursor
+        ts = parse_datetime(ts)
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+    return (ts, pk) if ts is not None else None
+
+
+def history(room_id, before=None, limit=None):
+    """
+    Up to ``limit`` messages of a room older than the ``(timestamp, id)``
+    cursor ``before`` (or the newest ones), oldest first. Returns
+    ``(messages, next_cursor)``; ``next_cursor`` is None on the first page
+    of the room's chat.
+    """
+    limit = limit or get_history_size()
+    qs = ChatLog.objects.filter(room_id=room_id)
+    if before is not None:
+        ts, pk = before
+        qs = qs.filter(Q(timestamp__lt=ts) | Q(timestamp=ts, id__lt=pk))
+    with DB_SECONDS.time('chat_history'):
+        rows = list(qs.order_by('-timestamp', '-id').values_list('id', 'timestamp', 'sender', 'message')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    messages = [
+        {'id': pk, 'timestamp': ts.isoformat(), 'sender': sender, 'message': message}
+        for pk, ts, sender, message in rows
+    ]
+    next_cursor = [messages[0]['timestamp'], messages[0]['id']] if has_more else None
+    return messages, next_cursor
+
+
+class ChatSink:
+    def __init__(self):
+        self.pending = []
+
+    async def add(self, room_id, sender, message):
+        self.pending.append(ChatLog(room_id=room_id, sender=sender, message=message, timestamp=timezone.now()))
+        if len(self.pending) >= get_flush_size():
+            scheduler.cancel('chat', 'flush')
+            await self.flush()
+        else:
+            scheduler.schedule('chat', 'flush', get_flush_interval(), self.flush)
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            await database_sync_to_async(self._write)(batch)
+        except Exception as e:
+            # Database busy or unreachable: keep the lines for the next
+            # attempt, ahead of newer ones.
+            self.pending[:0] = batch
+            scheduler.schedule('chat', 'flush', get_flush_interval(), self.flush)
+            logger.warning("Error saving chat: %s", e)
+
+    def has_pending(self, room_id):
+        return any(log.room_id == room_id for log in self.pending)
+
+    def flush_sync(self):
+        batch, self.pending = self.pending, []
+        if batch:
+            self._write(batch)
+
+    @staticmethod
+    def _write(batch):
+        try:
+            with DB_SECONDS.time('chat_write'), transaction.atomic():
+                ChatLog.objects.bulk_create(batch)
+        except IntegrityError:
+            # One bad row (e.g. its room was deleted) must not sink the batch.
+            for log in batch:
+                try:
+                    with transaction.atomic():
+                        log.save()
+                except IntegrityError as e:
+                    logger.warning("Dropping chat line for room %s: %s", log.room_id, e)
+
+
+chat_sink = ChatSink()
+atexit.register(chat_sink.flush_sync)
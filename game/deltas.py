@@ -0,0 +1,37 @@
+"""
+State patches for ``game_patch`` broadcasts.
+
+A patch is a list of operations against the previous version of a room's
+``game_state``:
+
+    [path, value]   set the value at ``path`` (a list of dict keys / list indexes)
+    [path]          delete the key at ``path``
+
+Lists are only diffed element-wise when their length is unchanged (boards,
+piece arrays); anything else is replaced wholesale. ``game.js`` applies the
+same format in ``applyPatch``.
+"""
+
+
+def diff(old, new, path=None, ops=None):
+    if ops is None:
+        ops = []
+    if path is None:
+        path = []
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, value in new.items():
+            if key not in old:
+                ops.append([path + [key], value])
+            elif old[key] != value:
+                diff(old[key], value, path + [key], ops)
+        for key in old:
+            if key not in new:
+                ops.append([path + [key]])
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for i, (a, b) in enumerate(zip(old, new)):
+            if a != b:
+                diff(a, b, path + [i], ops)
+    else:
+        ops.append([path, new])
+    return ops
@@ -0,0 +1,32 @@
+"""
+Pure, synchronous rule engines, one per ``Room.game_type``.
+
+    engine = get_engine(room.game_type)
+    new_state, events = engine.apply(state, {'type': 'move', 'player': 'X', 'index': 4})
+
+Engines never touch the database or sockets, so they can be driven from the
+consumer, a benchmark, a bot search or a thread pool alike.
+"""
+from .base import GameEngine, IllegalAction
+from .ludo import LudoEngine
+from .snakes import SnakesAndLaddersEngine
+from .tictactoe import TicTacToeEngine
+
+ENGINES = {}
+
+
+def register(engine):
+    ENGINES[engine.game_type] = engine
+    return engine
+
+
+def get_engine(game_type):
+    try:
+        return ENGINES[game_type]
+    except KeyError:
+        raise IllegalAction("Unknown game type")
+
+
+register(TicTacToeEngine())
+register(LudoEngine())
+register(SnakesAndLaddersEngine())
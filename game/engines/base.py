@@ -0,0 +1,51 @@
+import copy
+
+
+class IllegalAction(Exception):
+    """Raised by an engine when an action is not allowed in the current state."""
+
+    def __init__(self, message=None):
+        super().__init__(message)
+        self.message = message
+
+
+class GameEngine:
+    """
+    Rules for one ``Room.game_type``.
+
+    Engines are pure and synchronous: ``apply`` never touches the database,
+    sockets or the clock, and never mutates the state it is given. Actions are
+    plain dicts with a ``type`` key; each type is handled by an ``on_<type>``
+    method that mutates a private copy of the state and returns a list of
+    event dicts describing what happened.
+    """
+    game_type = None
+
+    def initial_state(self, mode, player_count, **options):
+        raise NotImplementedError
+
+    def apply(self, state, action):
+        """Return ``(new_state, events)``; raises ``IllegalAction``."""
+        handler = getattr(self, 'on_' + str(action.get('type')), None)
+        if handler is None:
+            raise IllegalAction("Unknown action")
+        new_state = copy.deepcopy(state)
+        events = handler(new_state, action) or []
+        return new_state, events
+
+    def bot_to_move(self, state):
+        """Side of the bot whose turn it is, or None."""
+        if state.get('winner'):
+            return None
+        turn = state.get('turn')
+        for p in state.get('players', {}).values():
+            if p.get('side') == turn and p.get('is_bot'):
+                return turn
+        return None
+
+    def on_join(self, state, action):
+        # Default: everyone watches.
+        return [{'type': 'joined', 'side': 'SPECTATOR'}]
+
+    def on_reset(self, state, action):
+        return []
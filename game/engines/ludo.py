@@ -0,0 +1,223 @@
+from ..ludo_board import COLORS, HOME, LudoBoard, geometry_for
+from .base import GameEngine, IllegalAction
+from .ludo_ai import DIFFICULTIES
+
+
+def new_pieces(**extra):
+    return dict({'pieces': [-1, -1, -1, -1], 'finished_pieces': 0, 'is_bot': False}, **extra)
+
+
+class LudoEngine(GameEngine):
+    """
+    Positions: -1 = Base, 0-51 = Main Path, 52-56 = Home Stretch, 57 = Home.
+    Board geometry and capture checks live in ``ludo_board.LudoBoard``.
+    """
+    game_type = 'LUDO'
+
+    def initial_state(self, mode, player_count, difficulty=None, **options):
+        state = {
+            'players': {}, # session_key: {side: 'RED', pieces: [-1, -1, -1, -1], finished_pieces: 0, name: ''}
+            'turn': 'RED', # RED, GREEN, YELLOW, BLUE (+ ORANGE, PURPLE, CYAN, PINK)
+            'dice_value': 0,
+            'phase': 'ROLL', # ROLL, MOVE or AUTO_PASS
+            'winner': None,
+            'consecutive_sixes': 0,
+            'last_moved_piece': None
+        }
+        if difficulty in DIFFICULTIES:
+            state['bot_difficulty'] = difficulty
+        return state
+
+    def on_join(self, state, action):
+        players = state.setdefault('players', {})
+        player_id = action['player_id']
+        player_name = action['name']
+        if player_id in players:
+            players[player_id]['name'] = player_name
+            return [{'type': 'joined', 'side': players[player_id]['side']}]
+
+        # 8-Player Support
+        player_count = action.get('player_count', 4)
+        colors = COLORS[:player_count] if player_count > 4 else COLORS[:4]
+        preferred_color = action.get('preferred_color')
+        mode = action.get('mode', 'ONLINE')
+
+        if mode == 'COMPUTER':
+            is_user_active = any(not p.get('is_bot') for p in players.values())
+            if is_user_active:
+                return [{'type': 'joined', 'side': 'SPECTATOR'}]
+
+            # Use preferred color if valid for the room, else RED
+            side = preferred_color if preferred_color in colors else 'RED'
+            for k in [k for k, p in players.items() if p['side'] == side and not p.get('is_bot')]:
+                del players[k]
+            players[player_id] = new_pieces(side=side, name=player_name)
+
+            # Bot assignment
+            bot_colors = [c for c in colors if c != side][:player_count - 1]
+            for b_color in bot_colors:
+                bot_key = f'bot_{b_color}'
+                if bot_key not in players:
+                    players[bot_key] = new_pieces(side=b_color, name='Computer', is_bot=True)
+            return [{'type': 'joined', 'side': side}]
+
+        if mode == 'LOCAL':
+            if not players:
+                for c in colors[:player_count]:
+                    players[f'local_{c}'] = new_pieces(side=c, name=f'Player {c}', is_local=True)
+                players[player_id] = {'side': 'CONTROLLER', 'name': player_name}
+            return [{'type': 'joined', 'side': 'CONTROLLER'}]
+
+        # ONLINE (Default)
+        taken = [p['side'] for p in players.values()]
+
+        # Priority: Preferred Color -> Available Colors
+        if preferred_color in colors and preferred_color not in taken:
+            side = preferred_color
+        else:
+            available = [c for c in colors if c not in taken]
+            side = available[0] if available else 'SPECTATOR'
+
+        players[player_id] = new_pieces(side=side, name=player_name)
+        return [{'type': 'joined', 'side': side}]
+
+    def on_roll(self, state, action):
+        player = action.get('player')
+        if state['turn'] != player or state.get('phase', 'ROLL') != 'ROLL' or state.get('winner'):
+            raise IllegalAction("Not your turn to roll")
+
+        value = action['value']
+        state['dice_value'] = value
+        state['phase'] = 'MOVE'
+
+        # Auto-pass if no moves possible; the caller schedules the pass.
+        if not self.has_valid_moves(state, player, value):
+            state['phase'] = 'AUTO_PASS'
+            return [{'type': 'rolled', 'value': value}, {'type': 'auto_pass', 'side': player}]
+        return [{'type': 'rolled', 'value': value}]
+
+    def on_move(self, state, action):
+        player = action.get('player')
+        piece_idx = action.get('index') # 0-3
+        if state['turn'] != player or state.get('phase') != 'MOVE':
+            raise IllegalAction("Not your turn or wait for roll!")
+        if not isinstance(piece_idx, int) or not 0 <= piece_idx < 4:
+            raise IllegalAction("Invalid piece")
+
+        dice_val = state['dice_value']
+        board = LudoBoard.from_state(state)
+        ci = board.geometry.color_index.get(player)
+        if ci not in board.owners:
+            raise IllegalAction("Player data not found")
+        p_data = state['players'][board.owners[ci]]
+
+        current_pos = board.position(ci, piece_idx)
+        new_pos = board.target(ci, piece_idx, dice_val)
+        if new_pos is None:
+            if current_pos == -1:
+                raise IllegalAction("Need a 6 to start!")
+            if current_pos == HOME:
+                raise IllegalAction("Piece already finished")
+            raise IllegalAction("Move exceeds home")
+
+        # Execute Move (any opponent on an unsafe landing square goes back to base)
+        captured = board.move(ci, piece_idx, new_pos)
+        board.write_to(state)
+        events = [{'type': 'moved', 'side': player, 'piece': piece_idx, 'from': current_pos, 'to': new_pos}]
+        if captured:
+            events.append({'type': 'captured', 'pieces': [
+                [board.geometry.colors[pid // 4], pid % 4] for pid in captured
+            ]})
+
+        # Final position
+        if new_pos == HOME:
+            p_data['finished_pieces'] += 1
+            if p_data['finished_pieces'] == 4:
+                state['winner'] = player
+                events.append({'type': 'game_over', 'winner': player})
+
+        # Next Turn if not a six
+        if dice_val != 6:
+            self.next_turn(state)
+        else:
+            state['phase'] = 'ROLL' # Roll again
+        return events
+
+    def on_pass(self, state, action):
+        """Hand the turn on after a roll with no legal moves."""
+        player = action.get('player', state['turn'])
+        if state['turn'] != player or state.get('phase') != 'AUTO_PASS':
+            raise IllegalAction("Nothing to pass")
+        # Check consecutive sixes reset happens in next_turn
+        self.next_turn(state)
+        return [{'type': 'passed', 'side': player}]
+
+    def on_reset(self, state, action):
+        state['winner'] = None
+        state['dice_value'] = 0
+        state['turn'] = 'RED'
+        return [{'type': 'reset', 'turn': 'RED'}]
+
+    def has_valid_moves(self, state, player, dice_val):
+        board = LudoBoard.from_state(state)
+        ci = board.geometry.color_index.get(player)
+        if ci not in board.owners: return False
+        return bool(board.valid_moves(ci, dice_val))
+
+    def next_turn(self, state):
+        colors = geometry_for(state).colors
+
+        # Check if current player gets another turn (rolled 6)
+        if state['dice_value'] == 6 and state.get('consecutive_sixes', 0) < 2 and state['winner'] is None:
+             state['phase'] = 'ROLL'
+             state['consecutive_sixes'] = state.get('consecutive_sixes', 0) + 1
+             return
+
+        # Next player
+        state['consecutive_sixes'] = 0
+
+        active_sides = [p['side'] for p in state['players'].values() if p['side'] in colors]
+        # Sort by standard order
+        active_sides.sort(key=lambda x: colors.index(x))
+
+        if not active_sides:
+            state['turn'] = 'RED' # Fallback
+            return
+
+        current_side = state['turn']
+        if current_side in active_sides:
+            idx = active_sides.index(current_side)
+            next_side = active_sides[(idx + 1) % len(active_sides)]
+        else:
+            # Current turn holder maybe left or invalid? Start from first active.
+            next_side = active_sides[0]
+
+        state['turn'] = next_side
+        state['phase'] = 'ROLL'
+        state['dice_value'] = 0
+
+    def greedy_move(self, state, color, dice_value):
+        """Single-ply heuristic used by the computer player. Returns a piece index or None."""
+        board = LudoBoard.from_state(state)
+        ci = board.geometry.color_index.get(color)
+        if ci not in board.owners: return None
+
+        moves = [] # (piece_idx, score)
+        for idx, pos in enumerate(board.player_pieces(ci)):
+            new_pos = board.target(ci, idx, dice_value)
+            if new_pos is None:
+                continue
+            if pos == -1:
+                moves.append((idx, 100)) # High priority to leave base
+                continue
+            score = 10 # Base move score
+            if new_pos == HOME: score += 500 # WIN piece
+            if board.is_capture(ci, new_pos): score += 200
+            if board.geometry.is_safe(ci, new_pos): score += 50
+            moves.append((idx, score))
+
+        if not moves:
+            return None
+        # Pick best
+        moves.sort(key=lambda x: x[1], reverse=True)
+        return moves[0][0]
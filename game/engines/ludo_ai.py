@@ -0,0 +1,218 @@
+"""
+Look-ahead Ludo bot.
+
+``choose_move`` runs an expectimax search over dice outcomes on a
+``LudoBoard``: the bot's own turns branch on every legal move, every roll
+is averaged over the six faces, and opponents are modelled as playing the
+move that is best for them under the same evaluation (so their turns only
+branch on the dice). A six keeps the turn with the same player, as in
+``LudoEngine.next_turn``; the three-sixes rule is ignored inside the search.
+
+The search deepens one ply at a time until the difficulty's depth, node or
+time budget runs out and keeps the answer of the deepest finished pass, so
+a move is always available after the first ply. Moves and captures are
+made and unmade in place on a single board, and piece values come from
+per-board tables, so the same code covers the 52- and 104-square boards.
+
+This module is pure CPU work; ``game.bots`` runs it in an executor so it
+never blocks the event loop.
+"""
+import random
+import time
+from functools import lru_cache
+
+from ..ludo_board import HOME, PIECES_PER_PLAYER, TRACK_LENGTH, LudoBoard
+
+# Evaluation weights, taken from the old single-ply greedy scorer.
+LEAVE_BASE = 100
+FINISH = 500
+SAFE = 50
+PROGRESS = 2  # Per square travelled
+WIN = 10000
+
+DIFFICULTIES = {
+    # depth: plies searched, nodes/time: budget for the deeper passes,
+    # noise: random score added to each root move.
+    'EASY': {'depth': 1, 'nodes': 0, 'time': 0, 'noise': 150},
+    'MEDIUM': {'depth': 3, 'nodes': 5000, 'time': 0.05, 'noise': 0},
+    'HARD': {'depth': 6, 'nodes': 60000, 'time': 0.3, 'noise': 0},
+}
+DEFAULT_DIFFICULTY = 'MEDIUM'
+
+
+class OutOfBudget(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def piece_values(geometry):
+    """value[color][pos + 1] for every relative position on ``geometry``."""
+    tables = []
+    for ci in range(len(geometry.colors)):
+        values = [0]  # Base
+        for pos in range(HOME + 1):
+            value = LEAVE_BASE + pos * PROGRESS
+            if pos == HOME:
+                value += FINISH
+            elif pos >= TRACK_LENGTH or geometry.is_safe(ci, pos):
+                # Home stretch squares cannot be captured either.
+                value += SAFE
+            values.append(value)
+        tables.append(values)
+    return tuple(tables)
+
+
+def evaluate(board, sides, values):
+    """Per-colour material: sum of piece values, plus ``WIN`` for a finished player."""
+    totals = {}
+    pieces = board.pieces
+    for ci in sides:
+        table = values[ci]
+        total = 0
+        home = 0
+        for pid in range(ci * PIECES_PER_PLAYER, (ci + 1) * PIECES_PER_PLAYER):
+            pos = pieces[pid]
+            total += table[pos + 1]
+            if pos == HOME:
+                home += 1
+        if home == PIECES_PER_PLAYER:
+            total += WIN
+        totals[ci] = total
+    return totals
+
+
+def score_for(ci, totals):
+    """``ci``'s material minus the average of its opponents'."""
+    if len(totals) < 2:
+        return totals[ci]
+    return totals[ci] - (sum(totals.values()) - totals[ci]) / (len(totals) - 1)
+
+
+class Search:
+    def __init__(self, board, me, sides, max_nodes=0, deadline=None):
+        self.board = board
+        self.me = me
+        self.sides = sides
+        self.values = piece_values(board.geometry)
+        self.max_nodes = max_nodes
+        self.deadline = deadline
+        self.nodes = 0
+
+    def next_side(self, ci):
+        sides = self.sides
+        return sides[(sides.index(ci) + 1) % len(sides)]
+
+    def apply(self, ci, idx, new_pos):
+        """Make a move and return what ``undo`` needs to take it back."""
+        board = self.board
+        old_pos = board.position(ci, idx)
+        victims = []
+        mask = board.opponents_at(ci, new_pos)
+        while mask:
+            low = mask & -mask
+            pid = low.bit_length() - 1
+            victims.append((pid, board.pieces[pid]))
+            mask ^= low
+        board.move(ci, idx, new_pos)
+        return old_pos, victims
+
+    def undo(self, ci, idx, old_pos, victims):
+        board = self.board
+        board.place(ci, idx, old_pos)
+        for pid, pos in victims:
+            board.place(pid // PIECES_PER_PLAYER, pid % PIECES_PER_PLAYER, pos)
+
+    def finished(self, ci, new_pos):
+        return new_pos == HOME and all(pos == HOME for pos in self.board.player_pieces(ci))
+
+    def value(self, ci, depth, game_over=False):
+        """Expected score for ``self.me`` with ``ci`` about to roll."""
+        if depth <= 0 or game_over:
+            return score_for(self.me, evaluate(self.board, self.sides, self.values))
+        return sum(self.decide(ci, dice, depth) for dice in range(1, 7)) / 6
+
+    def decide(self, ci, dice, depth):
+        """Score for ``self.me`` once ``ci`` has played ``dice``."""
+        self.nodes += 1
+        if self.max_nodes and self.nodes > self.max_nodes:
+            raise OutOfBudget
+        if self.deadline and not self.nodes & 255 and time.perf_counter() > self.deadline:
+            raise OutOfBudget
+
+        board = self.board
+        nxt = ci if dice == 6 else self.next_side(ci)
+        moves = [(idx, board.target(ci, idx, dice)) for idx in range(PIECES_PER_PLAYER)]
+        moves = [m for m in moves if m[1] is not None]
+        if not moves:
+            return self.value(nxt, depth - 1)
+
+        if ci != self.me:
+            # Opponents play their own best one-ply move.
+            moves = [self.best_reply(ci, moves)]
+
+        best = None
+        for idx, new_pos in moves:
+            undo = self.apply(ci, idx, new_pos)
+            v = self.value(nxt, depth - 1, self.finished(ci, new_pos))
+            self.undo(ci, idx, *undo)
+            if best is None or v > best:
+                best = v
+        return best
+
+    def best_reply(self, ci, moves):
+        best, best_score = None, None
+        for idx, new_pos in moves:
+            undo = self.apply(ci, idx, new_pos)
+            s = score_for(ci, evaluate(self.board, self.sides, self.values))
+            self.undo(ci, idx, *undo)
+            if best_score is None or s > best_score:
+                best, best_score = (idx, new_pos), s
+        return best
+
+    def root(self, dice, depth):
+        """Score of every legal move for ``self.me`` searched ``depth`` plies deep."""
+        scores = {}
+        nxt = self.me if dice == 6 else self.next_side(self.me)
+        for idx in range(PIECES_PER_PLAYER):
+            new_pos = self.board.target(self.me, idx, dice)
+            if new_pos is None:
+                continue
+            undo = self.apply(self.me, idx, new_pos)
+            scores[idx] = self.value(nxt, depth - 1, self.finished(self.me, new_pos))
+            self.undo(self.me, idx, *undo)
+        return scores
+
+
+def choose_move(state, color, dice_value, difficulty=None, rng=None):
+    """
+    Pick the piece index ``color`` should move with ``dice_value``, or None
+    if it has no legal move. ``state`` is not modified.
+    """
+    level = DIFFICULTIES.get(difficulty) or DIFFICULTIES[DEFAULT_DIFFICULTY]
+    board = LudoBoard.from_state(state)
+    me = board.geometry.color_index.get(color)
+    if me not in board.owners:
+        return None
+    legal = board.valid_moves(me, dice_value)
+    if len(legal) <= 1:
+        return legal[0] if legal else None
+
+    sides = sorted(board.owners)
+    deadline = time.perf_counter() + level['time'] if level['time'] else None
+    search = Search(board, me, sides)
+    scores = search.root(dice_value, 1)
+
+    # Later passes are budgeted. A pass that runs out is thrown away along
+    # with the board, which it leaves half-moved.
+    search.max_nodes = level['nodes']
+    search.deadline = deadline
+    for depth in range(2, level['depth'] + 1):
+        try:
+            scores = search.root(dice_value, depth)
+        except OutOfBudget:
+            break
+
+    if level['noise']:
+        rng = rng or random
+        scores = {idx: s + rng.uniform(0, level['noise']) for idx, s in scores.items()}
+    return max(scores, key=scores.get)
@@ -0,0 +1,272 @@
+"""
+Snakes & Ladders.
+
+Squares run 1-100, with 0 meaning "not on the board yet". A layout is a set
+of snakes and ladders (``{'snakes': [[head, tail], ...], 'ladders':
+[[foot, top], ...]}``); the room keeps its layout in ``game_state['layout']``
+so every room can use a different board.
+
+For each layout a 101 x 7 move table is built once and cached: it maps
+(square, roll) straight to the final square after bounce-back from 100 and
+any snake or ladder, so a roll resolves with a single lookup. ``simulate``
+uses the same table to play large numbers of games for layout balancing.
+"""
+import random
+from array import array
+from functools import lru_cache
+
+from .base import GameEngine, IllegalAction
+
+COLORS = ('RED', 'GREEN', 'YELLOW', 'BLUE')
+FINISH = 100
+
+LAYOUTS = {
+    'CLASSIC': {
+        'ladders': [[1, 38], [4, 14], [9, 31], [21, 42], [28, 84], [36, 44], [51, 67], [71, 91], [80, 100]],
+        'snakes': [[16, 6], [47, 26], [49, 11], [56, 53], [62, 19], [64, 60], [87, 24], [93, 73], [95, 75], [98, 78]],
+    },
+    'QUICK': {
+        'ladders': [[3, 22], [8, 30], [20, 41], [28, 76], [50, 67], [57, 83], [72, 92], [80, 99]],
+        'snakes': [[27, 5], [40, 3], [54, 31], [66, 45], [89, 53], [95, 75], [97, 61]],
+    },
+}
+DEFAULT_LAYOUT = 'CLASSIC'
+
+
+def layout_key(layout):
+    """Hashable, order-independent form of a layout, used to cache its tables."""
+    return (
+        tuple(sorted(tuple(s) for s in layout.get('snakes', ()))),
+        tuple(sorted(tuple(l) for l in layout.get('ladders', ()))),
+    )
+
+
+def validate_layout(layout):
+    starts = set()
+    for kind, descending in (('snakes', True), ('ladders', False)):
+        for pair in layout.get(kind, ()):
+            if len(pair) != 2:
+                raise IllegalAction(f"Bad {kind[:-1]}: {pair}")
+            a, b = pair
+            if not (1 <= a < FINISH and 1 <= b <= FINISH) or (a > b) != descending or a in starts:
+                raise IllegalAction(f"Bad {kind[:-1]}: {pair}")
+            starts.add(a)
+    return layout
+
+
+@lru_cache(maxsize=64)
+def _tables(key):
+    snakes, ladders = key
+    jumps = array('B', range(FINISH + 1))
+    for start, end in snakes + ladders:
+        jumps[start] = end
+
+    moves = array('B', bytes((FINISH + 1) * 7))
+    for pos in range(FINISH + 1):
+        for roll in range(1, 7):
+            target = pos + roll
+            if target > FINISH:
+                target = 2 * FINISH - target # Bounce back off 100
+            moves[pos * 7 + roll] = jumps[target]
+    return jumps, moves
+
+
+def jump_table(layout):
+    return _tables(layout_key(layout))[0]
+
+
+def move_table(layout):
+    return _tables(layout_key(layout))[1]
+
+
+def simulate(layout, games, players=2, seed=None):
+    """
+    Play ``games`` games of ``players`` seats with the house rules (bonus roll
+    on a six, turn passes after the third six in a row) and return summary
+    stats: mean and max turns per game, and win share per seat.
+    """
+    moves = move_table(layout)
+    rng = random.Random(seed)
+    rolls = rng.choices(range(1, 7), k=4096)
+    r = 0
+    wins = [0] * players
+    total_turns = 0
+    longest = 0
+
+    for _ in range(games):
+        positions = [0] * players
+        seat = 0
+        sixes = 0
+        turns = 0
+        while True:
+            if r == 4096:
+                rolls = rng.choices(range(1, 7), k=4096)
+                r = 0
+            roll = rolls[r]
+            r += 1
+            turns += 1
+            pos = moves[positions[seat] * 7 + roll]
+            positions[seat] = pos
+            if pos == FINISH:
+                wins[seat] += 1
+                break
+            if roll == 6:
+                sixes += 1
+                if sixes < 3:
+                    continue
+            sixes = 0
+            seat = (seat + 1) % players
+        total_turns += turns
+        longest = max(longest, turns)
+
+    return {
+        'games': games,
+        'mean_turns': total_turns / games if games else 0,
+        'max_turns': longest,
+        'win_share': [w / games for w in wins] if games else wins,
+    }
+
+
+class SnakesAndLaddersEngine(GameEngine):
+    game_type = 'SNAKES_AND_LADDERS'
+
+    def initial_state(self, mode, player_count, layout=None, **options):
+        if isinstance(layout, dict):
+            layout = dict(validate_layout(layout), name=layout.get('name', 'CUSTOM'))
+        else:
+            name = layout if layout in LAYOUTS else DEFAULT_LAYOUT
+            layout = dict(LAYOUTS[name], name=name)
+        return {
+            'players': {}, # session_key: {side: 'RED', pos: 0, name: ''}
+            'turn': 'RED',
+            'dice_value': 0,
+            'winner': None,
+            'phase': 'ROLL',
+            'mode': mode,
+            'player_count': player_count,
+            'layout': layout,
+            'last_roll': None
+        }
+
+    def on_join(self, state, action):
+        players = state.setdefault('players', {})
+        player_id = action['player_id']
+        player_name = action['name']
+        if player_id in players:
+            players[player_id]['name'] = player_name
+            return [{'type': 'joined', 'side': players[player_id]['side']}]
+
+        colors = COLORS[:max(2, min(action.get('player_count', 2), len(COLORS)))]
+        preferred_color = action.get('preferred_color')
+        mode = action.get('mode', 'ONLINE')
+
+        if mode == 'COMPUTER':
+            if any(not p.get('is_bot') for p in players.values()):
+                return [{'type': 'joined', 'side': 'SPECTATOR'}]
+            side = preferred_color if preferred_color in colors else 'RED'
+            players[player_id] = {'side': side, 'name': player_name, 'pos': 0, 'is_bot': False}
+            for b_color in [c for c in colors if c != side][:len(colors) - 1]:
+                players.setdefault(f'bot_{b_color}', {'side': b_color, 'name': 'Computer', 'pos': 0, 'is_bot': True})
+            self.ensure_turn(state)
+            return [{'type': 'joined', 'side': side}]
+
+        if mode == 'LOCAL':
+            if not players:
+                for c in colors:
+                    players[f'local_{c}'] = {'side': c, 'name': f'Player {c}', 'pos': 0, 'is_local': True}
+                players[player_id] = {'side': 'CONTROLLER', 'name': player_name}
+            return [{'type': 'joined', 'side': 'CONTROLLER'}]
+
+        # ONLINE (Default)
+        taken = [p['side'] for p in players.values()]
+        if preferred_color in colors and preferred_color not in taken:
+            side = preferred_color
+        else:
+            available = [c for c in colors if c not in taken]
+            side = available[0] if available else 'SPECTATOR'
+        if side == 'SPECTATOR':
+            players[player_id] = {'side': side, 'name': player_name}
+        else:
+            players[player_id] = {'side': side, 'name': player_name, 'pos': 0, 'is_bot': False}
+            self.ensure_turn(state)
+        return [{'type': 'joined', 'side': side}]
+
+    def active_sides(self, state):
+        sides = [p['side'] for p in state['players'].values() if p['side'] in COLORS]
+        sides.sort(key=COLORS.index)
+        return sides
+
+    def ensure_turn(self, state):
+        # The first seated player may not be RED (preferred colours, bots).
+        sides = self.active_sides(state)
+        if sides and state['turn'] not in sides:
+            state['turn'] = sides[0]
+
+    def on_roll(self, state, action):
+        player = action.get('player')
+        if player == 'CONTROLLER':
+            # Pass & Play: the controlling device rolls for whoever's turn it is.
+            player = state['turn']
+        if state['turn'] != player or state.get('phase', 'ROLL') != 'ROLL' or state.get('winner'):
+            raise IllegalAction("Not your turn to roll")
+        p_data = next((p for p in state['players'].values() if p['side'] == player and 'pos' in p), None)
+        if p_data is None:
+            raise IllegalAction("Player data not found")
+
+        if not state.get('layout'):
+            # Rooms created before layouts were stored play the default board.
+            state['layout'] = dict(LAYOUTS[DEFAULT_LAYOUT], name=DEFAULT_LAYOUT)
+        value = action['value']
+        start = p_data['pos']
+        end = move_table(state['layout'])[start * 7 + value]
+        p_data['pos'] = end
+        state['dice_value'] = value
+        state['last_roll'] = {'side': player, 'value': value, 'from': start, 'to': end}
+
+        events = [{'type': 'moved', 'side': player, 'from': start, 'to': end}]
+        if end == FINISH:
+            state['winner'] = player
+            events.append({'type': 'game_over', 'winner': player})
+        self.next_turn(state)
+        return events
+
+    def on_reset(self, state, action):
+        for p in state['players'].values():
+            if 'pos' in p:
+                p['pos'] = 0
+        sides = self.active_sides(state)
+        state.update({
+            'turn': sides[0] if sides else 'RED', 'dice_value': 0, 'winner': None,
+            'phase': 'ROLL', 'consecutive_6s': 0, 'last_roll': None,
+        })
+        return [{'type': 'reset', 'turn': state['turn']}]
+
+    def next_turn(self, state):
+        active_sides = self.active_sides(state)
+
+        if not active_sides: return
+
+        # Track 6s for consecutive turn rule
+        if state['dice_value'] == 6:
+            state['consecutive_6s'] = state.get('consecutive_6s', 0) + 1
+        else:
+            state['consecutive_6s'] = 0
+
+        # Rule: Three 6s in a row resets turn to next player
+        if state['consecutive_6s'] >= 3:
+            state['consecutive_6s'] = 0
+            idx = active_sides.index(state['turn'])
+            state['turn'] = active_sides[(idx + 1) % len(active_sides)]
+            state['phase'] = 'ROLL'
+            state['dice_value'] = 0
+            return
+
+        # Bonus turn for 6
+        if state['dice_value'] == 6 and state['winner'] is None:
+             state['phase'] = 'ROLL'
+             return
+
+        idx = active_sides.index(state['turn'])
+        state['turn'] = active_sides[(idx + 1) % len(active_sides)]
+        state['phase'] = 'ROLL'
+        state['dice_value'] = 0
@@ -0,0 +1,85 @@
+from .base import GameEngine, IllegalAction
+
+WIN_CONDITIONS = (
+    (0, 1, 2), (3, 4, 5), (6, 7, 8),
+    (0, 3, 6), (1, 4, 7), (2, 5, 8),
+    (0, 4, 8), (2, 4, 6)
+)
+
+
+def check_winner(board, player):
+    return any(all(board[i] == player for i in condition) for condition in WIN_CONDITIONS)
+
+
+class TicTacToeEngine(GameEngine):
+    game_type = 'TIC_TAC_TOE'
+
+    def initial_state(self, mode, player_count, difficulty=None, **options):
+        state = {
+            'board': [None] * 9,
+            'turn': 'X',
+            'starting_turn': 'X',
+            'winner': None,
+            'players': {}
+        }
+        # Imported here: the solver takes WIN_CONDITIONS from this module.
+        from .tictactoe_solver import MISTAKE_RATES
+        if difficulty in MISTAKE_RATES:
+            state['bot_difficulty'] = difficulty
+        return state
+
+    def on_join(self, state, action):
+        players = state.setdefault('players', {})
+        player_id = action['player_id']
+        if player_id in players:
+            players[player_id]['name'] = action['name']
+            return [{'type': 'joined', 'side': players[player_id]['side']}]
+
+        if action.get('mode') == 'COMPUTER':
+            if any(not p.get('is_bot') for p in players.values()):
+                return [{'type': 'joined', 'side': 'SPECTATOR'}]
+            players[player_id] = {'side': 'X', 'name': action['name'], 'score': 0}
+            players.setdefault('bot_O', {'side': 'O', 'name': 'Computer', 'score': 0, 'is_bot': True})
+            return [{'type': 'joined', 'side': 'X'}]
+
+        taken_sides = [p['side'] for p in players.values()]
+        if 'X' not in taken_sides: side = 'X'
+        elif 'O' not in taken_sides: side = 'O'
+        else: side = 'SPECTATOR'
+        players[player_id] = {'side': side, 'name': action['name'], 'score': 0}
+        return [{'type': 'joined', 'side': side}]
+
+    def on_move(self, state, action):
+        index = action.get('index')
+        player = action.get('player')
+        if not isinstance(index, int) or not 0 <= index < 9:
+            raise IllegalAction("Invalid move or not your turn")
+        if state.get('game_over', False) or state['board'][index] is not None or state['turn'] != player:
+            raise IllegalAction("Invalid move or not your turn")
+
+        state['board'][index] = player
+        if check_winner(state['board'], player):
+            state['winner'] = player
+            state['game_over'] = True
+            return [{'type': 'game_over', 'winner': player}]
+        if None not in state['board']:
+            state['winner'] = 'Draw'
+            state['game_over'] = True
+            return [{'type': 'game_over', 'winner': 'Draw'}]
+        state['turn'] = 'O' if player == 'X' else 'X'
+        return []
+
+    def on_reset(self, state, action):
+        # Guard: Only toggle turn if the game was actually over
+        if not state.get('game_over', False) and state.get('board') == [None] * 9:
+            return []
+
+        state['board'] = [None] * 9
+        state['winner'] = None
+        state['game_over'] = False
+
+        # Alternate starting turn
+        new_start = 'O' if state.get('starting_turn', 'X') == 'X' else 'X'
+        state['starting_turn'] = new_start
+        state['turn'] = new_start
+        return [{'type': 'reset', 'turn': new_start}]
@@ -0,0 +1,109 @@
+"""
+Solved Tic-Tac-Toe.
+
+A board is encoded in base 3 (cell ``i`` contributes ``digit * 3**i``, with
+0 empty, 1 X and 2 O). ``solve`` walks the whole game tree once from the
+empty board with either side to start (rooms alternate the opening move)
+and fills two flat tables indexed by ``code * 2 + side``: the game value
+for the side to move and a 9-bit mask of the cells that keep that value.
+
+The tables are dense (2 * 3**9 entries, about 120 KB) rather than a dict of
+the few thousand reachable positions, so a bot reply is one encode and one
+array lookup. They are built on first use and cached for the process.
+"""
+import random
+from array import array
+from functools import lru_cache
+
+from .tictactoe import WIN_CONDITIONS
+
+SIDES = ('X', 'O')
+DIGITS = {None: 0, 'X': 1, 'O': 2}
+POWERS = tuple(3 ** i for i in range(9))
+UNSOLVED = -2
+
+# Chance of a random legal move instead of a best one, per bot difficulty.
+MISTAKE_RATES = {
+    'EASY': 0.4,
+    'MEDIUM': 0.15,
+    'HARD': 0.0,
+}
+
+
+def encode(board):
+    return sum(DIGITS[cell] * POWERS[i] for i, cell in enumerate(board))
+
+
+def decode(code):
+    board = []
+    for _ in range(9):
+        code, digit = divmod(code, 3)
+        board.append((None, 'X', 'O')[digit])
+    return board
+
+
+def winner(cells):
+    for a, b, c in WIN_CONDITIONS:
+        if cells[a] and cells[a] == cells[b] == cells[c]:
+            return cells[a]
+    return None
+
+
+@lru_cache(maxsize=1)
+def solve():
+    """
+    Return ``(values, best, reachable)``: ``values[code * 2 + s]`` is +1/0/-1
+    for side ``SIDES[s]`` to move on board ``code``, ``best`` the matching
+    move masks and ``reachable`` the number of positions solved.
+    """
+    values = array('b', [UNSOLVED]) * (2 * 3 ** 9)
+    best = array('H', [0]) * (2 * 3 ** 9)
+    cells = [0] * 9
+
+    def search(code, s):
+        key = code * 2 + s
+        if values[key] != UNSOLVED:
+            return values[key]
+        if winner(cells):
+            # The previous mover completed a line.
+            value = -1
+        elif 0 not in cells:
+            value = 0
+        else:
+            value, mask = -2, 0
+            digit = s + 1
+            for i in range(9):
+                if cells[i]:
+                    continue
+                cells[i] = digit
+                v = -search(code + digit * POWERS[i], 1 - s)
+                cells[i] = 0
+                if v > value:
+                    value, mask = v, 1 << i
+                elif v == value:
+                    mask |= 1 << i
+            best[key] = mask
+        values[key] = value
+        return value
+
+    search(0, 0)
+    search(0, 1)
+    reachable = sum(1 for v in values if v != UNSOLVED)
+    return values, best, reachable
+
+
+def best_moves(board, side):
+    """Bitmask of the cells that play ``board`` perfectly for ``side``."""
+    _, best, _ = solve()
+    return best[encode(board) * 2 + SIDES.index(side)]
+
+
+def choose_move(board, side, mistake_rate=0.0, rng=None):
+    """Cell index for ``side`` to play, or None if the game is over."""
+    rng = rng or random
+    mask = best_moves(board, side)
+    if not mask:
+        return None
+    if mistake_rate and rng.random() < mistake_rate:
+        return rng.choice([i for i, cell in enumerate(board) if cell is None])
+    return rng.choice([i for i in range(9) if mask >> i & 1])
@@ -0,0 +1,74 @@
+"""
+Streaming ChatLog exports.
+
+Rows are read with ``values_list`` and ``iterator(chunk_size=...)``, so the
+database hands them over in chunks (a server-side cursor on PostgreSQL)
+and no model instances are built. The room code comes from the same
+query through a join instead of one lookup per row. Output is produced
+lazily, a few hundred lines per chunk, for ``StreamingHttpResponse`` or a
+file.
+"""
+import csv
+
+from django.http import StreamingHttpResponse
+
+from . import wire
+
+FIELDS = ('id', 'room__code', 'sender', 'message', 'timestamp')
+HEADER = ('id', 'room', 'sender', 'message', 'timestamp')
+CHUNK_SIZE = 2000
+LINES_PER_CHUNK = 500
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+def rows(queryset, chunk_size=CHUNK_SIZE):
+    return queryset.order_by('pk').values_list(*FIELDS).iterator(chunk_size=chunk_size)
+
+
+class Echo:
+    """File-like object whose ``write`` just returns the line, for ``csv.writer``."""
+
+    def write(self, value):
+        return value
+
+
+def batched(lines):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= LINES_PER_CHUNK:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def csv_lines(queryset, chunk_size=CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADER)
+    for pk, room, sender, message, timestamp in rows(queryset, chunk_size):
+        yield writer.writerow((pk, room, sender, message, timestamp.isoformat()))
+
+
+def ndjson_lines(queryset, chunk_size=CHUNK_SIZE):
+    for pk, room, sender, message, timestamp in rows(queryset, chunk_size):
+        yield wire.dumps({
+            'id': pk, 'room': room, 'sender': sender,
+            'message': message, 'timestamp': timestamp.isoformat(),
+        }) + '\n'
+
+
+def export_chunks(queryset, fmt='csv', chunk_size=CHUNK_SIZE):
+    lines = csv_lines if fmt == 'csv' else ndjson_lines
+    return batched(lines(queryset, chunk_size))
+
+
+def streaming_response(queryset, fmt='csv', filename='chatlogs'):
+    content_type, extension = FORMATS[fmt]
+    response = StreamingHttpResponse(export_chunks(queryset, fmt), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename={filename}.{extension}'
+    return response
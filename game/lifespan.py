@@ -0,0 +1,46 @@
+"""
+Process shutdown for the game server.
+
+``shutdown`` releases what the process holds outside any one socket: chat
+lines still in the write buffer and the pooled HTTP session behind ``@ai``
+replies. It runs from the ASGI ``lifespan`` protocol (uvicorn) or, under
+daphne, which has no lifespan support, from a Twisted shutdown trigger
+installed by ``install``.
+"""
+import asyncio
+import logging
+import sys
+
+from .chat import chat_sink
+from .media import media_service
+
+logger = logging.getLogger(__name__)
+
+
+async def shutdown():
+    # Failed writes are logged and kept by the sink itself.
+    await chat_sink.flush()
+    try:
+        await media_service.close()
+    except Exception:
+        logger.exception("Error closing media session")
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def install():
+    """Run ``shutdown`` before the Twisted reactor stops, when serving under daphne."""
+    if 'twisted.internet.reactor' not in sys.modules:
+        return
+    from twisted.internet import defer, reactor
+    reactor.addSystemEventTrigger(
+        'before', 'shutdown', lambda: defer.Deferred.fromFuture(asyncio.ensure_future(shutdown())))
@@ -0,0 +1,42 @@
+"""
+Logging helpers referenced from settings.LOGGING.
+
+``JsonFormatter`` writes one JSON object per record, including any fields
+passed with ``extra=``, for log pipelines that index structured logs.
+``SampleFilter`` keeps only a fraction of the records below WARNING
+(``LOG_SAMPLE_RATE``), so per-connection debug logging can be switched on
+in production without flooding it. Counts and latencies belong in
+``game.metrics``, not in the log.
+"""
+import logging
+import random
+
+from . import wire
+
+# Attributes every LogRecord has; anything else came in through ``extra``.
+RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRS:
+                entry[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return wire.dumps(entry)
+
+
+class SampleFilter(logging.Filter):
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
@@ -0,0 +1,151 @@
+"""
+Array-backed Ludo board.
+
+Piece positions in ``game_state`` are relative to each colour's start square:
+-1 is the base, 0-51 the shared track, 52-56 the home stretch and 57 home.
+The 4-player board has 52 global squares and the 8-player board 104, each
+colour starting 13 squares after the previous one.
+
+``LudoBoard`` keeps every piece in one flat ``array`` and mirrors the shared
+track in an occupancy array of piece bitmasks indexed by global square, so
+collision and capture checks are a single lookup instead of a scan over every
+player's pieces. Offsets, safe squares and relative-to-global tables are
+built once per board size at import time.
+"""
+from array import array
+
+COLORS = ('RED', 'GREEN', 'YELLOW', 'BLUE', 'ORANGE', 'PURPLE', 'CYAN', 'PINK')
+EXTENDED_COLORS = COLORS[4:]
+
+BASE = -1
+TRACK_LENGTH = 52  # Relative squares on the shared track (0-51)
+HOME = 57
+PIECES_PER_PLAYER = 4
+SEGMENT_SIZE = 13
+STAR_OFFSET = 8  # Safe star square, relative to each start square
+
+
+class BoardGeometry:
+    __slots__ = ('size', 'colors', 'color_index', 'offsets', 'safe', 'global_squares')
+
+    def __init__(self, color_count):
+        self.size = color_count * SEGMENT_SIZE
+        self.colors = COLORS[:color_count]
+        self.color_index = {c: i for i, c in enumerate(self.colors)}
+        self.offsets = array('H', (i * SEGMENT_SIZE for i in range(color_count)))
+
+        self.safe = bytearray(self.size)
+        for offset in self.offsets:
+            self.safe[offset] = 1
+            self.safe[(offset + STAR_OFFSET) % self.size] = 1
+
+        # global_squares[color][relative position + 1] -> global square, or -1
+        # when the piece is off the shared track (base, home stretch, home).
+        self.global_squares = tuple(
+            array('h', [-1] + [(pos + offset) % self.size for pos in range(TRACK_LENGTH)]
+                  + [-1] * (HOME - TRACK_LENGTH + 1))
+            for offset in self.offsets
+        )
+
+    def global_square(self, color_idx, pos):
+        return self.global_squares[color_idx][pos + 1]
+
+    def is_safe(self, color_idx, pos):
+        square = self.global_squares[color_idx][pos + 1]
+        return square >= 0 and self.safe[square] == 1
+
+
+BOARD_52 = BoardGeometry(4)
+BOARD_104 = BoardGeometry(8)
+
+
+def geometry_for(state):
+    # Same rule game.js uses to pick the board it draws.
+    players = state.get('players', {})
+    is_8_player = len(players) > 4 or any(p.get('side') in EXTENDED_COLORS for p in players.values())
+    return BOARD_104 if is_8_player else BOARD_52
+
+
+class LudoBoard:
+    __slots__ = ('geometry', 'pieces', 'occupancy', 'owners')
+
+    def __init__(self, geometry):
+        self.geometry = geometry
+        self.pieces = array('b', [BASE]) * (len(geometry.colors) * PIECES_PER_PLAYER)
+        # Bitmask of piece ids (color_idx * 4 + piece_idx) on each global square.
+        self.occupancy = array('L', [0]) * geometry.size
+        # color_idx -> player key in game_state['players']
+        self.owners = {}
+
+    @classmethod
+    def from_state(cls, state):
+        board = cls(geometry_for(state))
+        color_index = board.geometry.color_index
+        for key, p in state['players'].items():
+            ci = color_index.get(p.get('side'))
+            if ci is None or 'pieces' not in p:
+                continue
+            board.owners[ci] = key
+            for i, pos in enumerate(p['pieces']):
+                board.place(ci, i, pos)
+        return board
+
+    def write_to(self, state):
+        """Copy piece positions back into ``state['players']``."""
+        players = state['players']
+        for ci, key in self.owners.items():
+            start = ci * PIECES_PER_PLAYER
+            players[key]['pieces'] = self.pieces[start:start + PIECES_PER_PLAYER].tolist()
+
+    def place(self, ci, piece_idx, pos):
+        piece_id = ci * PIECES_PER_PLAYER + piece_idx
+        old = self.geometry.global_squares[ci][self.pieces[piece_id] + 1]
+        if old >= 0:
+            self.occupancy[old] &= ~(1 << piece_id)
+        self.pieces[piece_id] = pos
+        new = self.geometry.global_squares[ci][pos + 1]
+        if new >= 0:
+            self.occupancy[new] |= 1 << piece_id
+
+    def position(self, ci, piece_idx):
+        return self.pieces[ci * PIECES_PER_PLAYER + piece_idx]
+
+    def player_pieces(self, ci):
+        start = ci * PIECES_PER_PLAYER
+        return self.pieces[start:start + PIECES_PER_PLAYER]
+
+    def opponents_at(self, ci, pos):
+        """Bitmask of opposing pieces a piece of ``ci`` at ``pos`` would capture."""
+        square = self.geometry.global_squares[ci][pos + 1]
+        if square < 0 or self.geometry.safe[square]:
+            return 0
+        own = ((1 << PIECES_PER_PLAYER) - 1) << (ci * PIECES_PER_PLAYER)
+        return self.occupancy[square] & ~own
+
+    def is_capture(self, ci, pos):
+        return self.opponents_at(ci, pos) != 0
+
+    def move(self, ci, piece_idx, new_pos):
+        """Move a piece, sending any captured opponents home. Returns the captured piece ids."""
+        captured = self.opponents_at(ci, new_pos)
+        self.place(ci, piece_idx, new_pos)
+        victims = []
+        while captured:
+            low = captured & -captured
+            piece_id = low.bit_length() - 1
+            victims.append(piece_id)
+            self.place(piece_id // PIECES_PER_PLAYER, piece_id % PIECES_PER_PLAYER, BASE)
+            captured ^= low
+        return victims
+
+    def target(self, ci, piece_idx, dice_val):
+        """Position the piece would reach with ``dice_val``, or None if it cannot move."""
+        pos = self.pieces[ci * PIECES_PER_PLAYER + piece_idx]
+        if pos == BASE:
+            return 0 if dice_val == 6 else None
+        if pos == HOME or pos + dice_val > HOME:
+            return None
+        return pos + dice_val
+
+    def valid_moves(self, ci, dice_val):
+        return [i for i in range(PIECES_PER_PLAYER) if self.target(ci, i, dice_val) is not None]
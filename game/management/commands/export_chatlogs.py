@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from game.exports import CHUNK_SIZE, FORMATS, export_chunks
+from game.models import ChatLog
+
+
+class Command(BaseCommand):
+    help = "Stream ChatLog rows to a CSV or NDJSON file for offline analysis."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Output file, or - for stdout")
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--room', help="Only export this room code")
+        parser.add_argument('--since', help="Only export messages at or after this ISO timestamp")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        queryset = ChatLog.objects.all()
+        if options['room']:
+            queryset = queryset.filter(room__code=options['room'])
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since timestamp: {options['since']}")
+            queryset = queryset.filter(timestamp__gte=since)
+
+        chunks = export_chunks(queryset, options['format'], options['chunk_size'])
+        if options['output'] == '-':
+            # Chunks end mid-line; the wrapper must not add newlines of its own.
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        self.stderr.write(f"Exported chat logs to {options['output']}")
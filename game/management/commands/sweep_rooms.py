@@ -0,0 +1,42 @@
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+
+from game.sweeper import close_rooms, get_batch_size, get_grace, sweep_batch, sweep_cutoff
+
+
+class Command(BaseCommand):
+    help = "Archive and delete expired rooms (and their chat) in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=get_batch_size())
+        parser.add_argument('--grace', type=int, default=get_grace(),
+                            help="Seconds past expiry before a room is swept")
+        parser.add_argument('--archive-file', help="Append archived rooms to this NDJSON file instead of ArchivedRoom")
+        parser.add_argument('--no-archive', action='store_true', help="Delete without archiving")
+        parser.add_argument('--dry-run', action='store_true', help="Only list the first batch that would be swept")
+
+    def handle(self, *args, **options):
+        cutoff = sweep_cutoff(options['grace'])
+        batch_size = options['batch_size']
+
+        if options['dry_run']:
+            codes = sweep_batch(cutoff, batch_size, dry_run=True)
+            self.stdout.write(f"{len(codes)} rooms in the first batch: {' '.join(codes)}")
+            return
+
+        archive_file = open(options['archive_file'], 'a', encoding='utf-8') if options['archive_file'] else None
+        total = 0
+        try:
+            while True:
+                codes = sweep_batch(cutoff, batch_size, archive=not options['no_archive'], archive_file=archive_file)
+                if archive_file is not None:
+                    archive_file.flush()
+                # Reaches sockets in other processes when a shared channel layer (Redis) is configured.
+                async_to_sync(close_rooms)(codes)
+                total += len(codes)
+                if len(codes) < batch_size:
+                    break
+        finally:
+            if archive_file is not None:
+                archive_file.close()
+        self.stdout.write(f"Swept {total} rooms")
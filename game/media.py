@@ -0,0 +1,192 @@
+"""
+Media for ``@ai`` chat replies.
+
+Memes come from a ring buffer that is filled on the first ``@ai meme``
+and then refilled in the background, several per request, through one
+pooled ``aiohttp`` session with a hard timeout and a connection cap
+(closed at shutdown, see lifespan.py). A reply is normally a ``popleft``
+from the buffer, and only a cold or exhausted buffer waits for the
+network, for at most ``MEDIA_TIMEOUT`` seconds. After a failed refill the
+backend is left alone for ``RETRY_DELAY`` seconds. Stickers and cats are
+generated URLs and need no request at all.
+
+Each room gets a token bucket (``MEDIA_ROOM_RATE`` replies per second, bursts
+of ``MEDIA_ROOM_BURST``). Chat spam therefore cannot turn into outbound
+traffic.
+
+The meme source is pluggable (``MEDIA_BACKEND``). ``'meme-api'`` talks to
+any meme-api.com compatible server at ``MEDIA_MEME_URL``, such as a local
+stub in tests. ``'static'`` makes no requests at all.
+"""
+import asyncio
+import collections
+import logging
+import random
+import time
+
+import aiohttp
+from django.conf import settings
+
+from .metrics import MEDIA_FETCH_SECONDS, MEDIA_REPLIES
+from .ratelimit import KeyedBuckets
+
+logger = logging.getLogger(__name__)
+
+BOT_NAME = "LudoBot 🤖"
+HELP = "I can send you a 'meme' or a 'sticker' (try '@ai meme' or '@ai sticker')"
+RETRY_DELAY = 30
+
+
+def get_backend_name():
+    return getattr(settings, 'MEDIA_BACKEND', 'meme-api')
+
+
+def get_meme_url():
+    return getattr(settings, 'MEDIA_MEME_URL', 'https://meme-api.com/gimme')
+
+
+def get_timeout():
+    return getattr(settings, 'MEDIA_TIMEOUT', 3.0)
+
+
+def get_buffer_size():
+    return getattr(settings, 'MEDIA_BUFFER_SIZE', 20)
+
+
+def get_max_connections():
+    return getattr(settings, 'MEDIA_MAX_CONNECTIONS', 4)
+
+
+def get_room_rate():
+    return getattr(settings, 'MEDIA_ROOM_RATE', 0.2)
+
+
+def get_room_burst():
+    return getattr(settings, 'MEDIA_ROOM_BURST', 3)
+
+
+class MemeApiBackend:
+    """``GET <url>/<count>`` answering ``{"memes": [{"url": ...}, ...]}``, as meme-api.com does."""
+    uses_network = True
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    async def fetch(self, session, count):
+        async with session.get(f'{self.url}/{count}') as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        return [meme['url'] for meme in data.get('memes', [data]) if meme.get('url')]
+
+
+class StaticBackend:
+    """Picsum images; no requests from the server."""
+    uses_network = False
+
+    async def fetch(self, session, count):
+        return [f"https://picsum.photos/seed/meme{random.randint(1, 100000)}/300/300" for _ in range(count)]
+
+
+def get_backend():
+    if get_backend_name() == 'static':
+        return StaticBackend()
+    return MemeApiBackend(get_meme_url())
+
+
+class MediaService:
+    def __init__(self, backend=None):
+        self._backend = backend
+        self.memes = collections.deque(maxlen=get_buffer_size())
+        self.limits = KeyedBuckets(get_room_rate(), get_room_burst())
+        self._session = None
+        self._loop = None
+        self._refill = None
+        self._retry_at = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+    def allow(self, room_code):
+        """Take one reply from the room's budget; False if it is used up."""
+        if self.limits.allow(room_code):
+            return True
+        MEDIA_REPLIES.inc('limited')
+        return False
+
+    async def reply(self, message):
+        cmd = message.lower().strip()
+        if "meme" in cmd:
+            return await self.meme() or "Could not fetch meme :("
+        if "cat" in cmd:
+            # CATAAS with a unique tag so browsers don't show the cached cat
+            return f"https://cataas.com/cat/says/AI?t={random.randint(1, 1000)}"
+        if "sticker" in cmd:
+            return f"https://picsum.photos/seed/{random.randint(1, 1000)}/200/200"
+        return HELP
+
+    async def meme(self):
+        self._bind_loop()
+        if self.memes:
+            MEDIA_REPLIES.inc('hit')
+        else:
+            MEDIA_REPLIES.inc('miss')
+            self.warm()
+            if self._refill is not None:
+                try:
+                    await asyncio.wait_for(asyncio.shield(self._refill), get_timeout())
+                except asyncio.TimeoutError:
+                    pass
+        url = self.memes.popleft() if self.memes else None
+        if len(self.memes) <= self.memes.maxlen // 2:
+            self.warm()
+        return url
+
+    def warm(self):
+        """Start a background refill unless one is running or the backend is resting."""
+        self._bind_loop()
+        if self._refill is not None and not self._refill.done():
+            return
+        if time.monotonic() < self._retry_at or len(self.memes) == self.memes.maxlen:
+            return
+        self._refill = self._loop.create_task(self._fill())
+
+    async def _fill(self):
+        count = self.memes.maxlen - len(self.memes)
+        try:
+            with MEDIA_FETCH_SECONDS.time():
+                session = self._get_session() if self.backend.uses_network else None
+                urls = await self.backend.fetch(session, count)
+        except Exception as e:
+            self._retry_at = time.monotonic() + RETRY_DELAY
+            logger.warning("Meme refill failed: %r", e)
+            return
+        self.memes.extend(urls)
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=get_max_connections()),
+                timeout=aiohttp.ClientTimeout(total=get_timeout()),
+            )
+        return self._session
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Sessions and tasks belong to the loop that created them.
+            self._loop = loop
+            self._session = None
+            self._refill = None
+
+    async def close(self):
+        if self._refill is not None:
+            self._refill.cancel()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+media_service = MediaService()
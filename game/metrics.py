@@ -0,0 +1,146 @@
+"""
+Process-wide counters and latency histograms, served as Prometheus text on
+``/metrics``.
+
+Recording is a lock-protected add (DB timings are taken on the database
+thread pool, so metrics are updated from several threads), cheap enough to
+stay on every message. Gauges are read from their owners only when
+``/metrics`` is scraped. Values are per worker process; Prometheus sums
+them across workers.
+"""
+import bisect
+import threading
+import time
+
+REGISTRY = []
+
+# Seconds; WebSocket handling and DB calls are expected in the ms range.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        # Snapshot under the lock; inc() may run on a database thread meanwhile.
+        with self._lock:
+            values = list(self.values.items())
+        for labels, value in sorted(values):
+            yield self.name + format_labels(self.labelnames, labels), value
+
+
+class Gauge:
+    """A value computed by ``read()`` at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+        REGISTRY.append(self)
+
+    def samples(self):
+        yield self.name, self.read()
+
+
+class Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self.values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self.values.get(labels)
+            if row is None:
+                row = self.values[labels] = [0] * (len(self.buckets) + 2)
+            row[i] += 1
+            row[-1] += value
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            rows = [(labels, list(row)) for labels, row in self.values.items()]
+        for labels, row in sorted(rows):
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), row):
+                total += count
+                yield self.name + '_bucket' + format_labels(self.labelnames, labels, f'le="{bound}"'), total
+            yield self.name + '_sum' + format_labels(self.labelnames, labels), row[-1]
+            yield self.name + '_count' + format_labels(self.labelnames, labels), total
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, value in metric.samples():
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+WS_CONNECTIONS = Counter(
+    'boardgames_ws_connections_total', 'WebSocket connection attempts by outcome', ('outcome',))
+WS_MESSAGES = Counter(
+    'boardgames_ws_messages_total', 'WebSocket messages received by type', ('type',))
+WS_ERRORS = Counter(
+    'boardgames_ws_errors_total', 'WebSocket messages that failed with an unexpected error', ('type',))
+WS_DROPPED = Counter(
+    'boardgames_ws_dropped_total',
+    'WebSocket messages dropped as too large, too deeply nested or over the rate limit', ('reason', 'type'))
+WS_MESSAGE_SECONDS = Histogram(
+    'boardgames_ws_message_seconds',
+    'Time from receiving a message until its replies and broadcasts are sent', ('type',))
+DB_SECONDS = Histogram(
+    'boardgames_db_seconds', 'Time spent in database calls by operation', ('op',))
+MEDIA_REPLIES = Counter(
+    'boardgames_media_replies_total', '@ai meme replies by buffer hit, miss or rate-limited', ('result',))
+MEDIA_FETCH_SECONDS = Histogram(
+    'boardgames_media_fetch_seconds', 'Time spent refilling the meme buffer')
+STICKER_SEARCHES = Counter(
+    'boardgames_sticker_searches_total', 'Sticker searches answered from the recent-query cache or the index', ('result',))
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0003_chatlog'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='room',
+            name='game_type',
+            field=models.CharField(choices=[('TIC_TAC_TOE', 'Tic Tac Toe'), ('LUDO', 'Ludo'), ('SNAKES_AND_LADDERS', 'Snakes and Ladders')], default='TIC_TAC_TOE', max_length=20),
+        ),
+    ]
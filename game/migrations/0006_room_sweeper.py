@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0005_chatlog_room_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRoom',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(db_index=True, max_length=8)),
+                ('game_type', models.CharField(max_length=20)),
+                ('mode', models.CharField(max_length=20)),
+                ('player_count', models.IntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('winner', models.CharField(blank=True, max_length=20, null=True)),
+                ('game_state', models.JSONField(default=dict)),
+                ('chat', models.JSONField(default=list)),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_created_at(apps, schema_editor):
+    # Existing rooms were last known active when they were created.
+    Room = apps.get_model('game', 'Room')
+    Room.objects.update(last_activity=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0006_room_sweeper'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='last_activity',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['is_active', 'last_activity'], name='room_active_last_activity'),
+        ),
+    ]
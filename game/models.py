@@ -1,7 +1,17 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
+import datetime
 import random
 import string
 
+from .engines import ENGINES
+
+
+def get_room_ttl():
+    """How long a room stays joinable after its last activity."""
+    return datetime.timedelta(seconds=getattr(settings, 'ROOM_TTL', 300))
+
 class Room(models.Model):
     GAME_TYPES = (
         ('TIC_TAC_TOE', 'Tic Tac Toe'),
@@ -14,54 +24,35 @@ class Room(models.Model):
     mode = models.CharField(max_length=20, default='ONLINE') # ONLINE, COMPUTER, LOCAL
     player_count = models.IntegerField(default=2) # 2, 3, 4
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped by sockets in the room; written at most every
+    # ROOM_ACTIVITY_WRITE_INTERVAL seconds (see state.py).
+    last_activity = models.DateTimeField(default=timezone.now)
     is_active = models.BooleanField(default=True)
     
     # Store game state as JSON (simplifies handling different game types)
     # For Tic-Tac-Toe: {'board': [null]*9, 'turn': 'X', 'winner': null}
     game_state = models.JSONField(default=dict, blank=True)
 
+    class Meta:
+        indexes = [
+            # Sweeper scans (see sweeper.py): inactive rooms, then idle active rooms.
+            models.Index(fields=['is_active', 'last_activity'], name='room_active_last_activity'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.code:
             self.code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
         
         if not self.game_state or 'players' not in self.game_state:
-            if self.game_type == 'TIC_TAC_TOE':
-                self.game_state = {
-                    'board': [None] * 9,
-                    'turn': 'X',
-                    'starting_turn': 'X',
-                    'winner': None,
-                    'players': {} 
-                }
-            elif self.game_type == 'LUDO':
-                # Positions: -1 = Base, 0-51 = Main Path, 52-56 = Home Stretch, 57 = Home
-                self.game_state = {
-                    'players': {}, # session_key: {color: 'RED', pieces: [-1, -1, -1, -1], score: 0, name: ''}
-                    'turn': 'RED', # RED, GREEN, YELLOW, BLUE
-                    'dice_value': 0,
-                    'phase': 'ROLL', # ROLL or MOVE
-                    'winner': None,
-                    'consecutive_sixes': 0,
-                    'last_moved_piece': None
-                }
-            elif self.game_type == 'SNAKES_AND_LADDERS':
-                self.game_state = {
-                    'players': {}, # session_key: {side: 'RED', pos: 0, name: ''}
-                    'turn': 'RED',
-                    'dice_value': 0,
-                    'winner': None,
-                    'phase': 'ROLL',
-                    'mode': self.mode,
-                    'player_count': self.player_count
-                }
+            engine = ENGINES.get(self.game_type)
+            if engine is not None:
+                self.game_state = engine.initial_state(self.mode, self.player_count)
         
         super().save(*args, **kwargs)
 
     @property
     def is_expired(self):
-        from django.utils import timezone
-        import datetime
-        expiration_time = self.created_at + datetime.timedelta(minutes=5)
+        expiration_time = self.last_activity + get_room_ttl()
         return timezone.now() > expiration_time
 
     def __str__(self):
@@ -72,7 +63,31 @@ class ChatLog(models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='chat_logs')
     sender = models.CharField(max_length=100)
     message = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the message is sent; rows are written later in batches (see chat.py).
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Chat history is read newest-first per room (see chat.history).
+            models.Index(fields=['room', 'timestamp'], name='chatlog_room_timestamp'),
+        ]
 
     def __str__(self):
         return f"[{self.timestamp}] {self.sender}: {self.message[:50]}"
+
+
+class ArchivedRoom(models.Model):
+    """Cold copy of a swept room: its final state and chat, one row per room."""
+    code = models.CharField(max_length=8, db_index=True)
+    game_type = models.CharField(max_length=20)
+    mode = models.CharField(max_length=20)
+    player_count = models.IntegerField()
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    winner = models.CharField(max_length=20, null=True, blank=True)
+    game_state = models.JSONField(default=dict)
+    # [[timestamp, sender, message], ...] oldest first
+    chat = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"{self.game_type} - {self.code} (archived)"
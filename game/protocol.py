@@ -0,0 +1,189 @@
+"""
+Messages clients may send over the game socket.
+
+Each message type is a ``Message`` subclass that lists its fields, each
+with a validator. ``parse`` turns a decoded frame into an instance of it
+(``__slots__``, attribute access) or raises ``ProtocolError``. Handlers
+never see a missing field, a wrong type or an out-of-range value, and a
+bad frame is refused before the room or the database is touched. Keys a
+message does not declare are ignored.
+
+Clients name the protocol version they speak in ``join_game``
+(``protocol``). The original game.js sends none and gets version 1. A
+connection uses the highest version both sides know, and message types
+introduced in a later version (``since``) are refused on it. New messages
+and encodings can therefore be added without breaking older clients.
+"""
+
+PROTOCOL_VERSION = 2
+MIN_PROTOCOL_VERSION = 1
+
+# Version 2: join_game may ask for an ``encoding`` other than JSON (see wire.py).
+BINARY_FRAMES = 2
+
+MISSING = object()
+
+
+class ProtocolError(Exception):
+    """A frame that does not match the protocol; ``message`` is sent back."""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def integer(low, high):
+    def check(value):
+        # bool is an int subclass, but True is not a board index.
+        if type(value) is not int or not low <= value <= high:
+            raise ProtocolError(f"expected an integer from {low} to {high}")
+        return value
+    return check
+
+
+def text(max_length):
+    def check(value):
+        if not isinstance(value, str) or len(value) > max_length:
+            raise ProtocolError(f"expected text of at most {max_length} characters")
+        return value
+    return check
+
+
+def optional(check):
+    def check_optional(value):
+        return None if value is None else check(value)
+    return check_optional
+
+
+def cursor(value):
+    """A ``[timestamp, id]`` chat cursor; the values are parsed by ``chat.parse_cursor``."""
+    if not isinstance(value, list) or len(value) != 2:
+        raise ProtocolError("expected a [timestamp, id] cursor")
+    return value
+
+
+class Field:
+    __slots__ = ('name', 'check', 'default')
+
+    def __init__(self, name, check, default=MISSING):
+        self.name = name
+        self.check = check
+        self.default = default
+
+
+class Message:
+    __slots__ = ()
+    type = None
+    # First protocol version that has this message type.
+    since = 1
+    fields = ()
+
+    @classmethod
+    def parse(cls, data):
+        message = cls.__new__(cls)
+        for field in cls.fields:
+            value = data.get(field.name, MISSING)
+            if value is MISSING:
+                if field.default is MISSING:
+                    raise ProtocolError(f"{cls.type}: '{field.name}' is required")
+                value = field.default
+            else:
+                try:
+                    value = field.check(value)
+                except ProtocolError as e:
+                    raise ProtocolError(f"{cls.type}: '{field.name}' {e.message}") from None
+            setattr(message, field.name, value)
+        return message
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f"<{type(self).__name__} {values}>"
+
+
+class JoinGame(Message):
+    __slots__ = ('protocol', 'encoding')
+    type = 'join_game'
+    fields = (
+        Field('protocol', optional(integer(0, 1000)), None),
+        # Unknown encodings fall back to JSON rather than failing the join.
+        Field('encoding', optional(text(16)), None),
+    )
+
+
+class MakeMove(Message):
+    __slots__ = ('index', 'player')
+    type = 'make_move'
+    # The engine checks the index against the board; this only keeps it sane.
+    fields = (Field('index', integer(0, 255)), Field('player', text(16)))
+
+
+class RollDice(Message):
+    __slots__ = ('player',)
+    type = 'roll_dice'
+    fields = (Field('player', text(16)),)
+
+
+class ResetGame(Message):
+    __slots__ = ()
+    type = 'reset_game'
+
+
+class ChatMessage(Message):
+    __slots__ = ('message', 'sender')
+    type = 'chat_message'
+    fields = (
+        Field('message', optional(text(2000)), None),
+        Field('sender', text(64), 'Anonymous'),
+    )
+
+
+class SearchStickers(Message):
+    __slots__ = ('query', 'page')
+    type = 'search_stickers'
+    fields = (Field('query', text(256), ''), Field('page', integer(0, 10000), 0))
+
+
+class SyncState(Message):
+    __slots__ = ()
+    type = 'sync_state'
+
+
+class LoadOlderChat(Message):
+    __slots__ = ('before',)
+    type = 'load_older_chat'
+    fields = (Field('before', cursor),)
+
+
+MESSAGES = {cls.type: cls for cls in (
+    JoinGame, MakeMove, RollDice, ResetGame, ChatMessage, SearchStickers, SyncState, LoadOlderChat,
+)}
+
+
+def negotiate(requested):
+    """The version to speak with a client that asked for ``requested`` (None: version 1)."""
+    if requested is None:
+        return MIN_PROTOCOL_VERSION
+    if requested < MIN_PROTOCOL_VERSION:
+        raise ProtocolError(f"Protocol version {requested} is no longer supported")
+    return min(requested, PROTOCOL_VERSION)
+
+
+def message_type(data):
+    """The ``type`` of a decoded frame if it is a known one, else None."""
+    if isinstance(data, dict):
+        kind = data.get('type')
+        if isinstance(kind, str) and kind in MESSAGES:
+            return kind
+    return None
+
+
+def parse(data, version):
+    """The message in a decoded frame, or None for a type this server does not know."""
+    if not isinstance(data, dict):
+        raise ProtocolError("expected an object")
+    schema = MESSAGES.get(message_type(data))
+    if schema is None:
+        return None
+    if schema.since > version:
+        raise ProtocolError(f"{schema.type} needs protocol version {schema.since}")
+    return schema.parse(data)
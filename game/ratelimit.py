@@ -0,0 +1,89 @@
+"""
+Token buckets for throttling chatty clients and rooms.
+
+A bucket holds up to ``capacity`` tokens and refills at ``rate`` tokens per
+second. Refilling is computed lazily from the time of the last call, so an
+idle bucket costs nothing. ``KeyedBuckets`` keeps one bucket per key (room
+code, message type, ...). Buckets that have refilled completely behave
+exactly like new ones, so they are dropped whenever the map grows past
+``max_keys``. ``MessageLimiter`` is the pair of budgets a WebSocket
+connection gets: one for all its messages and one per message type.
+"""
+import time
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def allow(self, cost=1, now=None):
+        """Take ``cost`` tokens if there are enough; returns whether it did."""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+
+    def is_full(self, now=None):
+        self._refill(time.monotonic() if now is None else now)
+        return self.tokens >= self.capacity
+
+    def retry_after(self, cost=1):
+        """Seconds until ``cost`` tokens are available, as of the last call."""
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+
+class KeyedBuckets:
+    def __init__(self, rate, capacity, max_keys=4096):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.buckets = {}
+
+    def allow(self, key, cost=1):
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self.prune(now)
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.capacity, now)
+        return bucket.allow(cost, now)
+
+    def prune(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.buckets = {key: b for key, b in self.buckets.items() if not b.is_full(now)}
+
+
+class MessageLimiter:
+    def __init__(self, rate, capacity, limits):
+        self.total = TokenBucket(rate, capacity)
+        # message type -> (rate, capacity); types not listed share only the total
+        self.limits = limits
+        self.buckets = {}
+
+    def check(self, kind):
+        """0 if a message of ``kind`` may go through, else seconds until it may."""
+        now = time.monotonic()
+        if not self.total.allow(now=now):
+            return self.total.retry_after()
+        bucket = self.buckets.get(kind)
+        if bucket is None:
+            if kind not in self.limits:
+                return 0
+            rate, capacity = self.limits[kind]
+            bucket = self.buckets[kind] = TokenBucket(rate, capacity, now)
+        if bucket.allow(now=now):
+            return 0
+        # Not sent, so not charged to the connection either.
+        self.total.tokens += 1
+        return bucket.retry_after()
@@ -0,0 +1,121 @@
+"""
+Room metadata cache.
+
+``views.index``, ``views.room`` and ``GameConsumer.connect`` only need to
+know that a room exists, what game it is and whether it has expired. That
+is answered from a small LRU of ``RoomInfo`` records (no game state) kept
+for ``ROOM_CACHE_TTL`` seconds, so the page load warms the entry that the
+socket handshake right after it uses, and a reconnect storm does not queue
+one ``Room.objects.get`` per socket on the database thread pool.
+
+Entries are dropped when a room is saved or deleted in this process, and
+age out after the TTL for changes made elsewhere. Expiry is judged from
+the live room when there is one, since its activity is fresher than the
+database's; a cached record that looks expired is re-read before a room
+is turned away.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .metrics import DB_SECONDS
+from .models import Room, get_room_ttl
+from .state import room_states
+
+
+def get_cache_size():
+    return getattr(settings, 'ROOM_CACHE_SIZE', 4096)
+
+
+def get_cache_ttl():
+    return getattr(settings, 'ROOM_CACHE_TTL', 60)
+
+
+class RoomInfo:
+    __slots__ = ('pk', 'code', 'game_type', 'mode', 'player_count', 'last_activity', 'cached_until')
+
+    FIELDS = ('pk', 'game_type', 'mode', 'player_count', 'last_activity')
+
+    def __init__(self, code, pk, game_type, mode, player_count, last_activity):
+        self.code = code
+        self.pk = pk
+        self.game_type = game_type
+        self.mode = mode
+        self.player_count = player_count
+        self.last_activity = last_activity
+        self.cached_until = time.monotonic() + get_cache_ttl()
+
+    @property
+    def is_expired(self):
+        return timezone.now() > self.last_activity + get_room_ttl()
+
+    def __repr__(self):
+        return f"<RoomInfo {self.game_type} {self.code}>"
+
+
+class RoomCache:
+    def __init__(self):
+        self.entries = OrderedDict()
+        # Views run in worker threads, consumers on the event loop.
+        self._lock = threading.Lock()
+
+    def lookup(self, code):
+        """The cached record for ``code``, or None; never touches the database."""
+        with self._lock:
+            info = self.entries.get(code)
+            if info is None:
+                return None
+            if info.cached_until < time.monotonic():
+                del self.entries[code]
+                return None
+            self.entries.move_to_end(code)
+            return info
+
+    def get(self, code):
+        """Return the ``RoomInfo`` for ``code``. Raises ``Room.DoesNotExist``."""
+        info = self.lookup(code)
+        if info is None or self.is_expired(info):
+            info = self._fetch(code)
+        return info
+
+    async def aget(self, code):
+        info = self.lookup(code)
+        if info is None or self.is_expired(info):
+            info = await database_sync_to_async(self._fetch)(code)
+        return info
+
+    def is_expired(self, info):
+        live = room_states.rooms.get(info.code)
+        return (live if live is not None else info).is_expired
+
+    def invalidate(self, code):
+        with self._lock:
+            self.entries.pop(code, None)
+
+    def _fetch(self, code):
+        with DB_SECONDS.time('room_lookup'):
+            row = Room.objects.filter(code=code).values_list(*RoomInfo.FIELDS).first()
+        if row is None:
+            raise Room.DoesNotExist(code)
+        info = RoomInfo(code, *row)
+        with self._lock:
+            self.entries[code] = info
+            self.entries.move_to_end(code)
+            while len(self.entries) > get_cache_size():
+                self.entries.popitem(last=False)
+        return info
+
+
+room_cache = RoomCache()
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_room(sender, instance, **kwargs):
+    room_cache.invalidate(instance.code)
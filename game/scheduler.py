@@ -0,0 +1,131 @@
+"""
+Per-process timer for server-side room work (bot turns, auto-passes).
+
+Pending jobs sit in one heap ordered by deadline, and a single
+``loop.call_at`` handle is armed for the earliest of them. No task exists
+while a job is waiting. A job only becomes a task when it is due, and that
+task lives as long as the callback runs. Thousands of rooms waiting on a
+bot therefore cost one timer handle rather than thousands of sleeping
+tasks.
+
+Jobs are keyed by ``(room, kind)`` and a key can be pending only once, so
+several sockets asking for the same bot turn schedule it a single time.
+Callbacks must re-validate the room state themselves (they normally run
+through ``room_states.submit``), because the room may have moved on since
+they were scheduled.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+
+from .metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    __slots__ = ('deadline', 'room', 'kind', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline, room, kind, callback, args):
+        self.deadline = deadline
+        self.room = room
+        self.kind = kind
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+class Scheduler:
+    def __init__(self):
+        self._loop = None
+        self._heap = []
+        self._jobs = {}  # (room, kind) -> pending Job
+        self._timer = None
+        self._running = set()
+        self._seq = itertools.count()
+
+    def schedule(self, room, kind, delay, callback, *args):
+        """
+        Run ``await callback(*args)`` after ``delay`` seconds. Returns False
+        without scheduling anything if ``(room, kind)`` is already pending.
+        """
+        loop = self._bind_loop()
+        key = (room, kind)
+        if key in self._jobs:
+            return False
+        job = Job(loop.time() + delay, room, kind, callback, args)
+        self._jobs[key] = job
+        heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+        if self._heap[0][2] is job:
+            self._arm()
+        return True
+
+    def cancel(self, room, kind):
+        job = self._jobs.pop((room, kind), None)
+        if job is None:
+            return False
+        job.cancelled = True
+        return True
+
+    def cancel_room(self, room):
+        """Drop every pending job for ``room``; callbacks already running finish."""
+        for key in [k for k in self._jobs if k[0] == room]:
+            self._jobs.pop(key).cancelled = True
+
+    def is_pending(self, room, kind):
+        return (room, kind) in self._jobs
+
+    def pending_count(self, room=None):
+        if room is None:
+            return len(self._jobs)
+        return sum(1 for k in self._jobs if k[0] == room)
+
+    def running_count(self):
+        return len(self._running)
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # New event loop (tests, management commands); timers armed on
+            # the old one can never fire.
+            self._loop = loop
+            self._heap = []
+            self._jobs = {}
+            self._timer = None
+            self._running = set()
+        return loop
+
+    def _arm(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Cancelled jobs are left in the heap and skipped here.
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        if self._heap:
+            self._timer = self._loop.call_at(self._heap[0][0], self._fire)
+
+    def _fire(self):
+        self._timer = None
+        now = self._loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, job = heapq.heappop(self._heap)
+            if job.cancelled:
+                continue
+            del self._jobs[(job.room, job.kind)]
+            task = self._loop.create_task(self._run(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+        self._arm()
+
+    async def _run(self, job):
+        try:
+            await job.callback(*job.args)
+        except Exception:
+            logger.exception("Error in scheduled %s job", job.kind, extra={'room': job.room})
+
+
+scheduler = Scheduler()
+
+Gauge('boardgames_scheduled_jobs', 'Timers waiting on the room scheduler', scheduler.pending_count)
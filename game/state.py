@@ -0,0 +1,324 @@
+"""
+In-process authoritative room state.
+
+Live rooms are kept as plain Python objects for as long as somebody is
+connected to them. Consumers apply moves against ``LiveRoom.state`` through
+the room's rule engine (``game.engines``) and the manager writes the JSON blob back to ``Room.game_state`` behind the
+scenes: every ``ROOM_STATE_FLUSH_INTERVAL`` seconds, immediately when a game
+ends, and when the last socket leaves the room.
+
+Every change to a room's state goes through ``RoomStateManager.submit``,
+which runs actions one at a time on a per-room worker coroutine. Human
+clicks, bot turns and auto-pass timers therefore never interleave their
+read-modify-write cycles, and a bounded queue keeps one noisy room from
+piling up unbounded work.
+
+Broadcasts are versioned: ``publish`` diffs the state against the last
+published snapshot and bumps ``LiveRoom.version``, so clients only receive
+the fields that changed (see ``deltas.py``).
+
+With a shared store (``ROOM_STATE_STORE``, see ``stores.py``) several
+workers can host the same room: each action starts from the store's latest
+version and publishing commits the new state with a check-and-set, so a
+lost race is retried on fresh state instead of overwriting another
+worker's move. ``Room.game_state`` then is a write-behind copy only.
+
+Room activity (``touch``) is tracked in memory too. ``Room.last_activity``
+is written along with the state when that is flushed anyway, and on its
+own at most once every ``ROOM_ACTIVITY_WRITE_INTERVAL`` seconds, so moves
+and chat do not each cost a write just to keep the room from expiring.
+
+Engines return a fresh state dict for every action and never mutate the one
+they were given, so ``LiveRoom.state`` is replaced rather than edited in
+place. That lets published snapshots and write-behind flushes hold on to a
+state object without copying it.
+"""
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .deltas import diff
+from .metrics import DB_SECONDS, Gauge
+from .models import Room, get_room_ttl
+from .scheduler import scheduler
+from .stores import StateConflict, get_store
+
+logger = logging.getLogger(__name__)
+
+# How often an action is retried after losing a race with another worker.
+MAX_ATTEMPTS = 5
+
+
+def get_flush_interval():
+    return getattr(settings, 'ROOM_STATE_FLUSH_INTERVAL', 2.0)
+
+
+def get_queue_size():
+    return getattr(settings, 'ROOM_ACTION_QUEUE_SIZE', 32)
+
+
+def get_activity_write_interval():
+    return getattr(settings, 'ROOM_ACTIVITY_WRITE_INTERVAL', 30)
+
+
+class RoomBusy(Exception):
+    """Raised when a room's action queue is full."""
+
+
+class RoomGone(Exception):
+    """Raised by ``submit(..., load=False)`` when the room is no longer in memory."""
+
+
+class LiveRoom:
+    __slots__ = ('code', 'pk', 'game_type', 'mode', 'player_count',
+                 'state', 'dirty', 'connections', 'binary_subscribers', 'actions', 'worker',
+                 'version', 'snapshot', 'last_activity', 'activity_written')
+
+    def __init__(self, room):
+        self.code = room.code
+        self.pk = room.pk
+        self.game_type = room.game_type
+        self.mode = room.mode
+        self.player_count = room.player_count
+        self.state = room.game_state
+        self.dirty = False
+        self.connections = 0
+        # Sockets here that negotiated MessagePack frames (see actions.broadcast).
+        self.binary_subscribers = 0
+        self.actions = asyncio.Queue(maxsize=get_queue_size())
+        self.worker = None
+        self.version = 0
+        self.snapshot = self.state
+        self.last_activity = room.last_activity
+        # last_activity as currently stored in the database
+        self.activity_written = room.last_activity
+
+    @property
+    def is_expired(self):
+        return timezone.now() > self.last_activity + get_room_ttl()
+
+    def __repr__(self):
+        return f"<LiveRoom {self.game_type} {self.code}>"
+
+
+class RoomStateManager:
+    def __init__(self):
+        self.rooms = {}
+        self._loading = {}
+        self._flusher = None
+        self._store = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = get_store()
+        return self._store
+
+    async def get(self, code):
+        """
+        Return the live room for ``code``, loading it from the database the
+        first time it is touched. Raises ``Room.DoesNotExist``.
+        """
+        live = self.rooms.get(code)
+        if live is not None:
+            return live
+
+        # Several sockets of the same room usually connect at once; share a
+        # single load between them so the room is only read once.
+        pending = self._loading.get(code)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load(code))
+            self._loading[code] = pending
+            pending.add_done_callback(lambda _: self._loading.pop(code, None))
+        return await asyncio.shield(pending)
+
+    async def _load(self, code):
+        room = await database_sync_to_async(self._read)(code)
+        version, room.game_state = await self.store.attach(code, room.game_state)
+        live = LiveRoom(room)
+        live.version = version
+        live = self.rooms.setdefault(code, live)
+        self._ensure_flusher()
+        return live
+
+    @staticmethod
+    def _read(code):
+        with DB_SECONDS.time('room_load'):
+            return Room.objects.get(code=code)
+
+    async def submit(self, code, action, *args, wait=False, load=True):
+        """
+        Run ``action(live, *args)`` on the room's worker and return its
+        result. Actions for one room never overlap.
+
+        When the queue is full a client-initiated action fails fast with
+        ``RoomBusy``; server-side callers (bots, timers) pass ``wait=True``
+        and are held back until there is room. They also pass
+        ``load=False``: a room that was dropped from memory after its last
+        socket left raises ``RoomGone`` rather than being read back in.
+        """
+        if load:
+            live = await self.get(code)
+        else:
+            live = self.rooms.get(code)
+            if live is None:
+                raise RoomGone(code)
+        future = asyncio.get_running_loop().create_future()
+        item = (action, args, future)
+        if wait:
+            await live.actions.put(item)
+        else:
+            try:
+                live.actions.put_nowait(item)
+            except asyncio.QueueFull:
+                raise RoomBusy(code)
+        if live.worker is None or live.worker.done():
+            live.worker = asyncio.ensure_future(self._run_actions(live))
+        return await future
+
+    async def _run_actions(self, live):
+        while True:
+            while not live.actions.empty():
+                action, args, future = live.actions.get_nowait()
+                if future.cancelled():
+                    continue
+                try:
+                    result = await self._attempt(live, action, args)
+                except Exception as e:
+                    if not future.cancelled():
+                        future.set_exception(e)
+                else:
+                    if not future.cancelled():
+                        future.set_result(result)
+            if live.connections > 0:
+                return
+            # The last socket left while work was queued (see ``detach``).
+            await self._release(live)
+            if live.actions.empty():
+                return
+
+    async def _attempt(self, live, action, args):
+        for _ in range(MAX_ATTEMPTS):
+            await self.store.refresh(live)
+            try:
+                return await action(live, *args)
+            except StateConflict:
+                # Another worker published first; run again on its state.
+                continue
+        raise RoomBusy(live.code)
+
+    def mark_dirty(self, live):
+        """
+        Record that ``live.state`` changed. Finished games are persisted right
+        away, everything else waits for the next write-behind tick.
+        """
+        live.dirty = True
+        if live.state.get('winner'):
+            asyncio.ensure_future(self.flush(live.code))
+
+    def touch(self, live):
+        """Record activity in the room; see ``flush`` for when it is written."""
+        live.last_activity = timezone.now()
+
+    async def publish(self, live):
+        """
+        Return the patch ops taking clients from the last published version
+        to the current state, bumping the version if anything changed.
+        Raises ``StateConflict`` if a shared store has moved past the room.
+        """
+        ops = diff(live.snapshot, live.state)
+        if ops:
+            await self.store.commit(live, live.state)
+            live.version += 1
+            live.snapshot = live.state
+        return ops
+
+    async def flush(self, code=None, force_activity=False):
+        codes = [code] if code else list(self.rooms)
+        for c in codes:
+            live = self.rooms.get(c)
+            if live is None:
+                continue
+            fields = {}
+            if live.dirty:
+                if self.store.shared and not await self.store.is_current(live):
+                    # Another worker has a newer state and writes it back itself.
+                    live.dirty = False
+                else:
+                    fields['game_state'] = live.state
+            if live.last_activity != live.activity_written and (
+                    fields or force_activity or self._activity_due(live)):
+                fields['last_activity'] = live.last_activity
+            if not fields:
+                continue
+
+            written = live.activity_written
+            live.dirty = False
+            live.activity_written = live.last_activity
+            try:
+                await database_sync_to_async(self._write)(live.pk, fields)
+            except Exception as e:
+                live.dirty = live.dirty or 'game_state' in fields
+                live.activity_written = written
+                logger.warning("Error flushing room: %s", e, extra={'room': c})
+
+    @staticmethod
+    def _activity_due(live):
+        return (live.last_activity - live.activity_written).total_seconds() >= get_activity_write_interval()
+
+    @staticmethod
+    def _write(pk, fields):
+        with DB_SECONDS.time('room_flush'):
+            Room.objects.filter(pk=pk).update(**fields)
+
+    async def attach(self, code):
+        live = await self.get(code)
+        live.connections += 1
+        self.touch(live)
+        return live
+
+    async def detach(self, code):
+        live = self.rooms.get(code)
+        if live is None:
+            return
+        live.connections -= 1
+        if live.connections <= 0:
+            # No bot turns or auto-passes for an empty room; the next join
+            # triggers them again.
+            scheduler.cancel_room(code)
+            if live.worker is None or live.worker.done():
+                await self._release(live)
+            # Otherwise the worker releases the room once its queue drains.
+
+    async def _release(self, live):
+        """Write an empty room back and drop it from memory if it is idle."""
+        await self.flush(live.code, force_activity=True)
+        # A socket may have attached, or an action been queued, meanwhile. A
+        # failed write leaves the room dirty; the flush loop retries it.
+        if (live.connections <= 0 and not live.dirty and live.actions.empty()
+                and self.rooms.get(live.code) is live):
+            del self.rooms[live.code]
+            scheduler.cancel_room(live.code)
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self.rooms:
+            await asyncio.sleep(get_flush_interval())
+            await self.flush()
+            # Empty rooms whose write failed before are dropped once it succeeds.
+            for live in list(self.rooms.values()):
+                if live.connections <= 0 and (live.worker is None or live.worker.done()):
+                    await self._release(live)
+
+
+room_states = RoomStateManager()
+
+Gauge('boardgames_live_rooms', 'Rooms held in memory by this worker', lambda: len(room_states.rooms))
+Gauge('boardgames_connections', 'Sockets attached to live rooms',
+      lambda: sum(live.connections for live in list(room_states.rooms.values())))
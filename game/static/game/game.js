@@ -3,11 +3,18 @@ const gameType = JSON.parse(document.getElementById('game-type').textContent);
 const statusDiv = document.getElementById('status');
 const boardDiv = document.getElementById('game-board');
 
+// WebSocket protocol version this client speaks (see game/protocol.py).
+// Version 2 lets it ask for MessagePack frames, decoded by msgpack.js.
+const PROTOCOL_VERSION = 2;
+const FRAME_ENCODING = typeof MsgPack !== 'undefined' ? 'msgpack' : 'json';
+
 let socket;
 let mySide = null;
 let currentTurn = null;
 let currentPhase = null; // ROLL or MOVE
 let myPieces = []; // Track my pieces indices for UI
+let gameState = null; // Last full state, kept current by game_patch messages
+let stateVersion = null;
 
 // Standard Ludo Path (Global 0-51)
 const MAIN_PATH = [
@@ -49,6 +56,7 @@ function connect() {
 
     console.log(`Connecting to: ${wsUrl}`);
     socket = new WebSocket(wsUrl);
+    socket.binaryType = 'arraybuffer';
 
     socket.onopen = function (e) {
         console.log('Chat socket opened');
@@ -59,25 +67,35 @@ function connect() {
             status.style.color = '#55efc4';
         }
         socket.send(JSON.stringify({
-            'type': 'join_game'
+            'type': 'join_game',
+            'protocol': PROTOCOL_VERSION,
+            'encoding': FRAME_ENCODING
         }));
     };
 
     socket.onmessage = function (e) {
-        const data = JSON.parse(e.data);
+        // Binary frames are MessagePack; text frames (and older servers) JSON.
+        const data = typeof e.data === 'string' ? JSON.parse(e.data) : MsgPack.decode(new Uint8Array(e.data));
         console.log('DEBUG: Received message:', data);
-        socket.lastState = data.game_state;
 
         if (data.type === 'game_start') {
             mySide = data.side;
             console.log("My Side:", mySide);
-            renderBoard(data.game_state);
+            setGameState(data.game_state, data.version);
         } else if (data.type === 'game_update') {
-            renderBoard(data.game_state);
+            setGameState(data.game_state, data.version);
+        } else if (data.type === 'game_patch') {
+            applyPatch(data.version, data.ops);
         } else if (data.type === 'chat_message') {
             displayChatMessage(data.message, data.sender);
+        } else if (data.type === 'chat_history') {
+            showChatHistory(data.messages, data.before, data.older);
+        } else if (data.type === 'sticker_search_results') {
+            showStickerResults(data.query, data.page, data.results, data.more);
         } else if (data.type === 'error') {
             showToast(data.message);
+        } else if (data.type === 'rate_limited') {
+            showToast('Slow down! Try again in a moment.');
         }
     };
 
@@ -112,6 +130,50 @@ function connect() {
     };
 }
 
+function setGameState(state, version) {
+    resyncPending = false;
+    gameState = state;
+    stateVersion = version;
+    socket.lastState = state;
+    renderBoard(state);
+}
+
+// Patches are [path, value] (set) or [path] (delete) against the previous
+// version. Anything older than what we hold is ignored; a gap means we
+// missed something, so ask the server for a fresh snapshot, once: the
+// patches that keep arriving until it does are dropped.
+let resyncPending = false;
+
+function applyPatch(version, ops) {
+    if (gameState === null || version <= stateVersion) return;
+    if (version !== stateVersion + 1) {
+        if (!resyncPending) {
+            resyncPending = true;
+            socket.send(JSON.stringify({ 'type': 'sync_state' }));
+        }
+        return;
+    }
+
+    ops.forEach(op => {
+        const path = op[0];
+        if (path.length === 0) {
+            gameState = op[1];
+            return;
+        }
+        let target = gameState;
+        for (let i = 0; i < path.length - 1; i++) {
+            target = target[path[i]];
+        }
+        const key = path[path.length - 1];
+        if (op.length === 1) delete target[key];
+        else target[key] = op[1];
+    });
+
+    stateVersion = version;
+    socket.lastState = gameState;
+    renderBoard(gameState);
+}
+
 function renderBoard(gameState) {
     if (!gameState || !gameState.players) {
         console.warn("DEBUG: renderBoard called with empty state");
@@ -131,7 +193,7 @@ function renderBoard(gameState) {
         } else {
             let statusText = `Turn: ${currentTurn}`;
             if (currentTurn === mySide) {
-                if (gameType === 'LUDO') {
+                if (gameType === 'LUDO' || gameType === 'SNAKES_AND_LADDERS') {
                     statusText += ` (${currentPhase === 'ROLL' ? 'Roll Dice!' : 'Move a Piece!'})`;
                 } else {
                     statusText += ` (Your Turn)`;
@@ -337,6 +399,64 @@ function renderLudo(gameState) {
 }
 
 
+function renderSnakesAndLadders(gameState) {
+    boardDiv.className = 'board snakes_and_ladders';
+    boardDiv.style.display = 'grid';
+    boardDiv.style.gridTemplateColumns = 'repeat(10, 1fr)';
+    boardDiv.innerHTML = '';
+
+    const jumps = {};
+    const layout = gameState.layout || { snakes: [], ladders: [] };
+    layout.snakes.forEach(([from, to]) => { jumps[from] = { icon: '🐍', to: to }; });
+    layout.ladders.forEach(([from, to]) => { jumps[from] = { icon: '🪜', to: to }; });
+
+    const tokens = {};
+    Object.values(gameState.players).forEach(p => {
+        if (p.pos === undefined) return;
+        (tokens[p.pos] = tokens[p.pos] || []).push(p.side);
+    });
+
+    // Square 100 is top-left; rows alternate direction (boustrophedon).
+    for (let row = 9; row >= 0; row--) {
+        for (let col = 0; col < 10; col++) {
+            const square = row * 10 + (row % 2 === 0 ? col + 1 : 10 - col);
+            const cell = document.createElement('div');
+            cell.className = 'sl-cell';
+            cell.style.cssText = 'position:relative; border:1px solid rgba(255,255,255,0.1); font-size:0.6rem; aspect-ratio:1; padding:2px;';
+            cell.innerText = square;
+            if (jumps[square]) {
+                cell.innerText += ` ${jumps[square].icon}${jumps[square].to}`;
+                cell.style.background = jumps[square].icon === '🐍' ? 'rgba(255,118,117,0.15)' : 'rgba(85,239,196,0.15)';
+            }
+            (tokens[square] || []).forEach(side => {
+                const t = document.createElement('div');
+                t.style.cssText = `display:inline-block; width:40%; height:40%; border-radius:50%; border:1px solid #fff; background:${getPlayerColor(side)};`;
+                cell.appendChild(t);
+            });
+            boardDiv.appendChild(cell);
+        }
+    }
+
+    // Dice
+    const diceContainer = document.getElementById('shared-dice');
+    if (diceContainer) {
+        const diceBox = diceContainer.querySelector('.dice-box');
+        if (diceBox && diceBox.intervalId) {
+            clearInterval(diceBox.intervalId);
+            diceBox.intervalId = null;
+        }
+        const last = gameState.last_roll;
+        renderDiceFace(last ? last.value : 0, diceBox);
+        diceContainer.style.borderColor = getPlayerColor(currentTurn);
+        diceContainer.onclick = null;
+        diceContainer.classList.remove('active');
+        if (!gameState.winner && (currentTurn === mySide || mySide === 'CONTROLLER')) {
+            diceContainer.classList.add('active');
+            diceContainer.onclick = () => rollDice();
+        }
+    }
+}
+
 function renderDiceFace(val, container) {
     if (!container) return;
     container.innerHTML = '';
@@ -572,6 +692,10 @@ function renderPlayers(players, currentTurn, diceVal) {
             if (p.finished_pieces !== undefined) {
                 scoreDiv.innerText = `Home: ${p.finished_pieces}/4`;
             }
+        } else if (gameType === 'SNAKES_AND_LADDERS') {
+            if (p.pos !== undefined) {
+                scoreDiv.innerText = `Square: ${p.pos}`;
+            }
         } else {
             scoreDiv.innerText = p.score || 0;
             scoreDiv.classList.add('player-score');
@@ -860,38 +984,11 @@ function resetGame() {
 console.log("Game.js loaded");
 
 // --- CHAT SYSTEM ---
-const stickerLibrary = [
-    { tags: 'funny lol haha', url: '😂' },
-    { tags: 'love heart', url: '❤️' },
-    { tags: 'cool sunglasses', url: '😎' },
-    { tags: 'cry sad', url: '😭' },
-    { tags: 'angry mad', url: '😡' },
-    { tags: 'wow surprise', url: '😮' },
-    { tags: 'party celebrate', url: '🎉' },
-    { tags: 'thumb up like', url: '👍' },
-    { tags: 'cat cute', url: '🐱' },
-    { tags: 'dog', url: '🐶' },
-    { tags: 'ghost', url: '👻' },
-    { tags: 'poop funny', url: '💩' },
-    { tags: 'fire hot', url: '🔥' },
-    { tags: 'brain smart', url: '🧠' },
-    { tags: 'money rich', url: '💰' },
-    { tags: 'robot', url: '🤖' },
-    { tags: 'alien', url: '👽' },
-    { tags: 'cat funny', url: '😹' },
-    { tags: 'monkey', url: '🙈' },
-    // Trending Memes
-    { tags: 'meme doge wow cute', url: 'https://images.unsplash.com/photo-1518717758536-85ae29035b6d?auto=format&fit=crop&w=150&h=150&q=80' },
-    { tags: 'meme sunglasses cool', url: 'https://images.unsplash.com/photo-1572635196237-14b3f281503f?auto=format&fit=crop&w=150&h=150&q=80' },
-    { tags: 'meme happy success kid', url: 'https://images.unsplash.com/photo-1503454537195-1dcabb73ffb9?auto=format&fit=crop&w=150&h=150&q=80' },
-    { tags: 'meme thinking smart', url: 'https://images.unsplash.com/photo-1506794778202-cad84cf45f1d?auto=format&fit=crop&w=150&h=150&q=80' },
-    { tags: 'meme distracted boyfriend', url: 'https://images.unsplash.com/photo-1534528741775-53994a69daeb?auto=format&fit=crop&w=150&h=150&q=80' },
-    { tags: 'meme fire this is fine', url: 'https://images.unsplash.com/photo-1506744038136-46273834b3fb?auto=format&fit=crop&w=150&h=150&q=80' },
-    { tags: 'meme surprised pikachu face', url: 'https://images.unsplash.com/photo-1542751371-adc38448a05e?auto=format&fit=crop&w=150&h=150&q=80' },
-    { tags: 'meme gaming cards win', url: 'https://images.unsplash.com/photo-1511512578047-dfb367046420?auto=format&fit=crop&w=150&h=150&q=80' },
-    { tags: 'meme random fun', url: 'https://picsum.photos/seed/fun/150/150' },
-    { tags: 'meme classic vibe', url: 'https://picsum.photos/seed/classic/150/150' }
-];
+// Stickers are searched on the server (game/stickers.py); the same query
+// always returns the same URLs, so the images come from the browser cache.
+let stickerQuery = null;
+let stickerPage = 0;
+let stickerSearchTimer = null;
 
 function toggleStickerPicker() {
     const picker = document.getElementById('sticker-picker');
@@ -916,26 +1013,70 @@ document.addEventListener('click', function (event) {
 });
 
 function filterStickers() {
-    const query = document.getElementById('sticker-search').value.toLowerCase();
+    // One search per pause in typing, not per keystroke.
+    clearTimeout(stickerSearchTimer);
+    stickerSearchTimer = setTimeout(() => searchStickers(0), 150);
+}
+
+function searchStickers(page) {
+    if (!socket || socket.readyState !== WebSocket.OPEN) return;
+    socket.send(JSON.stringify({
+        'type': 'search_stickers',
+        'query': document.getElementById('sticker-search').value,
+        'page': page
+    }));
+}
+
+// Same as stickers.normalize on the server, so answers can be matched to the box.
+const MAX_STICKER_QUERY_LENGTH = 64;
+
+function normalizeStickerQuery(query) {
+    const words = query.toLowerCase().split(/\s+/).filter(Boolean).join(' ');
+    // Cut by code point, as Python slices strings (emoji are two UTF-16 units).
+    return Array.from(words).slice(0, MAX_STICKER_QUERY_LENGTH).join('');
+}
+
+function showStickerResults(query, page, results, more) {
     const grid = document.getElementById('sticker-grid');
-    grid.innerHTML = '';
+    const current = normalizeStickerQuery(document.getElementById('sticker-search').value);
+    if (query !== current) return;  // answer to an older query
+    if (page === 0) {
+        grid.innerHTML = '';
+    } else if (query !== stickerQuery || page !== stickerPage + 1) {
+        return;
+    }
+    stickerQuery = query;
+    stickerPage = page;
 
-    stickerLibrary.forEach(s => {
-        if (s.tags.includes(query) || query === '') {
-            const el = document.createElement('div');
-            el.className = 'sticker-item';
+    const moreButton = grid.querySelector('.sticker-more');
+    if (moreButton) moreButton.remove();
 
-            // Render Image or Emoji
-            if (s.url.startsWith('http')) {
-                el.innerHTML = `<img src="${s.url}" style="width:100%; height:100%; object-fit:cover; border-radius:5px;" loading="lazy">`;
-            } else {
-                el.textContent = s.url;
-            }
+    results.forEach(url => {
+        const el = document.createElement('div');
+        el.className = 'sticker-item';
 
-            el.onclick = () => sendSticker(s.url);
-            grid.appendChild(el);
+        // Render Image or Emoji
+        if (url.startsWith('http')) {
+            el.innerHTML = `<img src="${url}" style="width:100%; height:100%; object-fit:cover; border-radius:5px;" loading="lazy">`;
+        } else {
+            el.textContent = url;
         }
+
+        el.onclick = () => sendSticker(url);
+        grid.appendChild(el);
     });
+
+    if (more) {
+        const el = document.createElement('div');
+        el.className = 'sticker-item sticker-more';
+        el.textContent = '…';
+        el.title = 'More';
+        el.onclick = (event) => {
+            event.stopPropagation();
+            searchStickers(stickerPage + 1);
+        };
+        grid.appendChild(el);
+    }
 }
 
 function sendSticker(content) {
@@ -978,7 +1119,39 @@ function sendReaction(emoji) {
     sendSticker(emoji);
 }
 
-function displayChatMessage(msg, sender) {
+// Cursor ([timestamp, id]) of the oldest chat message loaded so far, or
+// null once the start of the room's chat has been reached.
+let chatHistoryCursor = null;
+// Ids of history messages on screen; a reconnect sends the latest page again.
+const shownChatIds = new Set();
+
+function showChatHistory(messages, before, older) {
+    // After a reconnect, keep paging from the oldest message already loaded.
+    if (older || shownChatIds.size === 0) chatHistoryCursor = before;
+    messages = messages.filter(m => !shownChatIds.has(m.id));
+    messages.forEach(m => shownChatIds.add(m.id));
+    if (older) {
+        // Walk newest to oldest so the page ends up in order above what is shown
+        for (let i = messages.length - 1; i >= 0; i--) {
+            displayChatMessage(messages[i].message, messages[i].sender, true, true);
+        }
+    } else {
+        messages.forEach(m => displayChatMessage(m.message, m.sender, false, true));
+    }
+    const btn = document.getElementById('load-older-chat');
+    if (btn) btn.style.display = chatHistoryCursor ? 'inline-block' : 'none';
+}
+
+function loadOlderChat() {
+    if (!chatHistoryCursor || !socket || socket.readyState !== WebSocket.OPEN) return;
+    socket.send(JSON.stringify({
+        'type': 'load_older_chat',
+        'before': chatHistoryCursor
+    }));
+}
+
+// History (``keep``) stays on screen; live messages fade after 30 seconds.
+function displayChatMessage(msg, sender, prepend, keep) {
     // Try Board Chat first (TTT)
     const boardChat = document.getElementById('board-chat-display');
     const sidebarChat = document.getElementById('chat-messages');
@@ -1048,10 +1221,15 @@ function displayChatMessage(msg, sender) {
         }
     }
 
-    target.appendChild(div);
-    target.scrollTop = target.scrollHeight;
+    if (prepend) {
+        target.insertBefore(div, target.firstChild);
+    } else {
+        target.appendChild(div);
+        target.scrollTop = target.scrollHeight;
+    }
 
     // Auto-Remove after 30 seconds
+    if (keep) return;
     setTimeout(() => {
         div.classList.add('fade-out');
         setTimeout(() => div.remove(), 1000); // Wait for 1s animation
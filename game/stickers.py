@@ -0,0 +1,197 @@
+"""
+Sticker catalog behind ``search_stickers``.
+
+The catalog is loaded once per process, from ``STICKER_CATALOG`` (a JSON
+list of ``{"tags": "...", "url": "..."}``) or from the built-in list below,
+and indexed by tag. Each query word matches a tag exactly, as a prefix
+(bisect over the sorted tags), or, from three letters on, anywhere inside
+it (trigram postings, checked against the tag). A sticker has to match
+every word. Results are ordered by how well they match, then by catalog
+order, and end with avatars generated from the query, so the same query
+always gives the same URLs and browsers and CDNs can cache the images.
+
+Result lists for the last ``STICKER_CACHE_SIZE`` queries are kept in an
+LRU. Clients ask for them ``STICKER_PAGE_SIZE`` at a time.
+"""
+import bisect
+import json
+from collections import OrderedDict
+from urllib.parse import quote
+
+from django.conf import settings
+
+from .metrics import STICKER_SEARCHES
+
+MAX_QUERY_LENGTH = 64
+
+# Match strength per query word.
+EXACT, PREFIX, SUBSTRING = 3, 2, 1
+
+STICKERS = (
+    ('funny lol haha', '😂'),
+    ('love heart', '❤️'),
+    ('cool sunglasses', '😎'),
+    ('cry sad', '😭'),
+    ('angry mad', '😡'),
+    ('wow surprise', '😮'),
+    ('party celebrate', '🎉'),
+    ('thumb up like', '👍'),
+    ('cat cute', '🐱'),
+    ('dog', '🐶'),
+    ('ghost', '👻'),
+    ('poop funny', '💩'),
+    ('fire hot', '🔥'),
+    ('brain smart', '🧠'),
+    ('money rich', '💰'),
+    ('robot', '🤖'),
+    ('alien', '👽'),
+    ('cat funny', '😹'),
+    ('monkey', '🙈'),
+    # Trending memes
+    ('meme doge wow cute', 'https://images.unsplash.com/photo-1518717758536-85ae29035b6d?auto=format&fit=crop&w=150&h=150&q=80'),
+    ('meme sunglasses cool', 'https://images.unsplash.com/photo-1572635196237-14b3f281503f?auto=format&fit=crop&w=150&h=150&q=80'),
+    ('meme happy success kid', 'https://images.unsplash.com/photo-1503454537195-1dcabb73ffb9?auto=format&fit=crop&w=150&h=150&q=80'),
+    ('meme thinking smart', 'https://images.unsplash.com/photo-1506794778202-cad84cf45f1d?auto=format&fit=crop&w=150&h=150&q=80'),
+    ('meme distracted boyfriend', 'https://images.unsplash.com/photo-1534528741775-53994a69daeb?auto=format&fit=crop&w=150&h=150&q=80'),
+    ('meme fire this is fine', 'https://images.unsplash.com/photo-1506744038136-46273834b3fb?auto=format&fit=crop&w=150&h=150&q=80'),
+    ('meme surprised pikachu face', 'https://images.unsplash.com/photo-1542751371-adc38448a05e?auto=format&fit=crop&w=150&h=150&q=80'),
+    ('meme gaming cards win', 'https://images.unsplash.com/photo-1511512578047-dfb367046420?auto=format&fit=crop&w=150&h=150&q=80'),
+    ('meme random fun', 'https://picsum.photos/seed/fun/150/150'),
+    ('meme classic vibe', 'https://picsum.photos/seed/classic/150/150'),
+)
+
+
+def get_catalog_path():
+    return getattr(settings, 'STICKER_CATALOG', None)
+
+
+def get_cache_size():
+    return getattr(settings, 'STICKER_CACHE_SIZE', 256)
+
+
+def get_page_size():
+    return getattr(settings, 'STICKER_PAGE_SIZE', 24)
+
+
+def load_catalog(path=None):
+    """``(tags, url)`` pairs from the JSON file at ``path``, or the built-in list."""
+    if not path:
+        return STICKERS
+    with open(path, encoding='utf-8') as f:
+        return tuple((entry['tags'], entry['url']) for entry in json.load(f))
+
+
+def normalize(query):
+    return ' '.join(str(query).lower().split())[:MAX_QUERY_LENGTH]
+
+
+def trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def generated(query):
+    """Avatars drawn from the query text itself; stable for a given query."""
+    seed = quote(query)
+    return (
+        f"https://robohash.org/{seed}.png?set=set2&size=150x150",
+        f"https://robohash.org/{seed}.png?set=set1&size=150x150",
+        f"https://picsum.photos/seed/{seed}/150/150",
+    )
+
+
+class StickerIndex:
+    def __init__(self, entries):
+        self.urls = []
+        # tag -> ids of the stickers carrying it, in catalog order
+        self.postings = {}
+        for tags, url in entries:
+            sticker = len(self.urls)
+            self.urls.append(url)
+            for tag in dict.fromkeys(tags.lower().split()):
+                self.postings.setdefault(tag, []).append(sticker)
+        self.tags = sorted(self.postings)
+        self.grams = {}
+        for tag in self.tags:
+            for gram in trigrams(tag):
+                self.grams.setdefault(gram, set()).add(tag)
+
+    def match_word(self, word):
+        """tag -> match strength for every tag that ``word`` matches."""
+        found = {}
+        if len(word) >= 3:
+            grams = sorted(trigrams(word), key=lambda g: len(self.grams.get(g, ())))
+            candidates = set(self.grams.get(grams[0], ()))
+            for gram in grams[1:]:
+                if not candidates:
+                    break
+                candidates &= self.grams.get(gram, set())
+            for tag in candidates:
+                if word in tag:
+                    found[tag] = SUBSTRING
+        i = bisect.bisect_left(self.tags, word)
+        while i < len(self.tags) and self.tags[i].startswith(word):
+            tag = self.tags[i]
+            found[tag] = EXACT if tag == word else PREFIX
+            i += 1
+        return found
+
+    def search(self, query):
+        """Catalog URLs for a normalized query, best matches first."""
+        if not query:
+            return tuple(self.urls)
+        scores = None
+        for word in query.split():
+            best = {}
+            for tag, strength in self.match_word(word).items():
+                for sticker in self.postings[tag]:
+                    if strength > best.get(sticker, 0):
+                        best[sticker] = strength
+            if scores is None:
+                scores = best
+            else:
+                scores = {sticker: score + best[sticker] for sticker, score in scores.items() if sticker in best}
+            if not scores:
+                break
+        ranked = sorted(scores, key=lambda sticker: (-scores[sticker], sticker))
+        return tuple(self.urls[sticker] for sticker in ranked) + generated(query)
+
+
+class StickerCatalog:
+    def __init__(self, entries=None):
+        self._entries = entries
+        self._index = None
+        self.recent = OrderedDict()
+
+    @property
+    def index(self):
+        if self._index is None:
+            self.load()
+        return self._index
+
+    def load(self):
+        entries = self._entries if self._entries is not None else load_catalog(get_catalog_path())
+        self._index = StickerIndex(entries)
+        self.recent.clear()
+
+    def results(self, query):
+        query = normalize(query)
+        results = self.recent.get(query)
+        if results is not None:
+            STICKER_SEARCHES.inc('hit')
+            self.recent.move_to_end(query)
+            return results
+        STICKER_SEARCHES.inc('miss')
+        results = self.recent[query] = self.index.search(query)
+        if len(self.recent) > get_cache_size():
+            self.recent.popitem(last=False)
+        return results
+
+    def page(self, query, page=0):
+        """One page of results for ``query`` and whether there are more."""
+        size = get_page_size()
+        results = self.results(query)
+        start = page * size
+        return list(results[start:start + size]), start + size < len(results)
+
+
+sticker_catalog = StickerCatalog()
@@ -0,0 +1,213 @@
+"""
+Where live room state is shared between worker processes.
+
+By default (``ROOM_STATE_STORE = 'process'``) each worker keeps its rooms to
+itself and ``Room.game_state`` is only written behind, so every socket of a
+room has to land on the same worker. With ``'redis'`` the authoritative
+copy of each room lives in Redis and any worker can host any socket:
+
+* a room is one hash, ``room:<code>``, holding the version (``v``) and the
+  state encoded as one JSON blob (``s``);
+* before each action the worker compares its version with the hash and
+  reloads the state only if another worker moved on (one round trip);
+* publishing a change is a check-and-set Lua script that writes version
+  ``n + 1`` only if the hash is still at ``n``; on a lost race the action
+  fails with ``StateConflict`` and is retried against the fresh state;
+* hashes expire ``ROOM_STATE_TTL`` seconds after their last write, after
+  which the room is seeded again from ``Room.game_state``.
+
+All of this uses ``redis.asyncio``, so moves never go through the database
+thread pool. ``'memory'`` is an in-process stand-in with the same
+semantics: every manager in the process gets the same ``memory_store``, so
+two ``RoomStateManager`` instances can be run against each other in tests
+without a Redis server.
+"""
+import time
+
+from django.conf import settings
+
+from . import wire
+
+
+def get_store_name():
+    return getattr(settings, 'ROOM_STATE_STORE', 'process')
+
+
+def get_state_ttl():
+    return getattr(settings, 'ROOM_STATE_TTL', 3600)
+
+
+class StateConflict(Exception):
+    """Raised when another worker published a newer version of the room first."""
+
+
+class ProcessStore:
+    """State is owned by this process; nothing to share or check."""
+    shared = False
+
+    async def attach(self, code, state):
+        return 0, state
+
+    async def refresh(self, live):
+        return False
+
+    async def commit(self, live, state):
+        pass
+
+    async def is_current(self, live):
+        return True
+
+    async def discard(self, code):
+        pass
+
+
+class SharedStore:
+    """
+    Versioned state shared between workers. Subclasses provide the storage
+    primitives; states travel as encoded blobs so that no two managers ever
+    share a state object.
+    """
+    shared = True
+
+    async def attach(self, code, state):
+        """Seed the room with ``state`` unless it is already stored; return what is stored."""
+        version, blob = await self._attach(code, wire.dumps(state))
+        return version, wire.loads(blob)
+
+    async def refresh(self, live):
+        """Load the stored state into ``live`` if it is newer. Returns whether it was."""
+        found = await self._refresh(live.code, live.version)
+        if found is None:
+            # Expired while the room was idle: put it back as we know it.
+            await self._attach(live.code, wire.dumps(live.state), live.version)
+            return False
+        version, blob = found
+        if blob is None:
+            return False
+        live.state = live.snapshot = wire.loads(blob)
+        live.version = version
+        return True
+
+    async def commit(self, live, state):
+        """Store ``state`` as the version after ``live.version``; raises ``StateConflict``."""
+        if not await self._cas(live.code, live.version, wire.dumps(state)):
+            raise StateConflict(live.code)
+
+    async def is_current(self, live):
+        found = await self._refresh(live.code, live.version)
+        return found is None or found[1] is None
+
+    def _key(self, code):
+        return f'room:{code}'
+
+    def _ttl_ms(self):
+        return int(get_state_ttl() * 1000)
+
+
+class MemoryStore(SharedStore):
+    """In-process stand-in for ``RedisStore``."""
+
+    def __init__(self):
+        self.rooms = {}
+
+    def _get(self, code):
+        entry = self.rooms.get(code)
+        if entry is not None and entry[2] < time.monotonic():
+            del self.rooms[code]
+            return None
+        return entry
+
+    async def _attach(self, code, blob, version=0):
+        entry = self._get(code)
+        if entry is None:
+            entry = (version, blob)
+        self.rooms[code] = (entry[0], entry[1], time.monotonic() + get_state_ttl())
+        return entry[0], entry[1]
+
+    async def _refresh(self, code, version):
+        entry = self._get(code)
+        if entry is None:
+            return None
+        return entry[0], (entry[1] if entry[0] != version else None)
+
+    async def _cas(self, code, expected, blob):
+        entry = self._get(code)
+        if entry is None or entry[0] != expected:
+            return False
+        self.rooms[code] = (expected + 1, blob, time.monotonic() + get_state_ttl())
+        return True
+
+    async def discard(self, code):
+        self.rooms.pop(code, None)
+
+
+# KEYS[1] room hash; ARGV: blob, version, ttl in ms
+ATTACH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], 'v', ARGV[2], 's', ARGV[1])
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[3])
+return redis.call('HMGET', KEYS[1], 'v', 's')
+"""
+
+# ARGV: version the caller has. Returns nil (no room), {v} (up to date)
+# or {v, s} (newer state).
+REFRESH_SCRIPT = """
+local v = redis.call('HGET', KEYS[1], 'v')
+if not v then
+    return nil
+end
+if v == ARGV[1] then
+    return {v}
+end
+return {v, redis.call('HGET', KEYS[1], 's')}
+"""
+
+# ARGV: expected version, new blob, ttl in ms. Returns 1 if written.
+CAS_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'v') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'v', tostring(tonumber(ARGV[1]) + 1), 's', ARGV[2])
+redis.call('PEXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+class RedisStore(SharedStore):
+    def __init__(self, client):
+        self.redis = client
+        self._attach_script = client.register_script(ATTACH_SCRIPT)
+        self._refresh_script = client.register_script(REFRESH_SCRIPT)
+        self._cas_script = client.register_script(CAS_SCRIPT)
+
+    async def _attach(self, code, blob, version=0):
+        v, s = await self._attach_script(keys=[self._key(code)], args=[blob, version, self._ttl_ms()])
+        return int(v), s
+
+    async def _refresh(self, code, version):
+        found = await self._refresh_script(keys=[self._key(code)], args=[version])
+        if found is None:
+            return None
+        return int(found[0]), (found[1] if len(found) > 1 else None)
+
+    async def _cas(self, code, expected, blob):
+        return bool(await self._cas_script(keys=[self._key(code)], args=[expected, blob, self._ttl_ms()]))
+
+    async def discard(self, code):
+        await self.redis.delete(self._key(code))
+
+
+# Shared by every manager that uses the 'memory' store.
+memory_store = MemoryStore()
+
+
+def get_store():
+    name = get_store_name()
+    if name == 'redis':
+        import redis.asyncio as redis
+        url = getattr(settings, 'ROOM_STATE_REDIS_URL', None) or 'redis://127.0.0.1:6379'
+        return RedisStore(redis.Redis.from_url(url))
+    if name == 'memory':
+        return memory_store
+    return ProcessStore()
@@ -0,0 +1,161 @@
+"""
+Expired-room sweeper.
+
+Rooms stop being joinable ``ROOM_TTL`` seconds after their last activity,
+but until now nothing ever removed them. ``sweep_batch`` takes a bounded
+batch of rooms that are either marked inactive or expired more than
+``ROOM_SWEEP_GRACE`` seconds ago, oldest first, and removes them and their
+chat in one transaction. By default it first compacts each room into a
+single ``ArchivedRoom`` row (final state plus chat); it can instead append
+the same records as NDJSON to a file, or just delete. Both scans use the
+``(is_active, last_activity)`` index.
+
+Sockets still open on a swept room are closed with code 4000 through the
+room's channel group, the same code ``connect`` uses for expired rooms.
+
+The sweep runs from ``manage.py sweep_rooms`` or, when
+``ROOM_SWEEP_INTERVAL`` is set, as a periodic job on the in-process
+scheduler.
+"""
+import asyncio
+import datetime
+import logging
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import wire
+from .actions import group_name
+from .metrics import DB_SECONDS
+from .models import ArchivedRoom, ChatLog, Room, get_room_ttl
+from .scheduler import scheduler
+from .state import room_states
+
+logger = logging.getLogger(__name__)
+
+
+def get_sweep_interval():
+    return getattr(settings, 'ROOM_SWEEP_INTERVAL', 0)
+
+
+def get_grace():
+    return getattr(settings, 'ROOM_SWEEP_GRACE', 3600)
+
+
+def get_batch_size():
+    return getattr(settings, 'ROOM_SWEEP_BATCH', 200)
+
+
+def sweep_cutoff(grace=None, now=None):
+    """Rooms last active before this are swept."""
+    if grace is None:
+        grace = get_grace()
+    return (now or timezone.now()) - get_room_ttl() - datetime.timedelta(seconds=grace)
+
+
+def expired_batch(cutoff, batch_size):
+    # is_active__in rather than is_active=: on SQLite a plain boolean filter
+    # is rendered as a bare column test, which cannot use the index.
+    pks = list(Room.objects.filter(is_active__in=[False])
+               .order_by('last_activity').values_list('pk', flat=True)[:batch_size])
+    if len(pks) < batch_size:
+        pks += Room.objects.filter(is_active__in=[True], last_activity__lt=cutoff) \
+            .order_by('last_activity').values_list('pk', flat=True)[:batch_size - len(pks)]
+    return pks
+
+
+def archive_records(rooms):
+    """
+    One ``ArchivedRoom`` per room, built lazily: each room's chat is read
+    with its own ``(room, timestamp)`` index scan when the room is reached,
+    so only one room's chat is held at a time.
+    """
+    for pk, code, game_type, mode, player_count, created_at, game_state in rooms:
+        chat_rows = ChatLog.objects.filter(room_id=pk).order_by('timestamp', 'id') \
+            .values_list('timestamp', 'sender', 'message').iterator()
+        yield ArchivedRoom(
+            code=code, game_type=game_type, mode=mode, player_count=player_count,
+            created_at=created_at, game_state=game_state,
+            winner=(game_state or {}).get('winner'),
+            chat=[[timestamp.isoformat(), sender, message] for timestamp, sender, message in chat_rows],
+        )
+
+
+def sweep_batch(cutoff, batch_size=None, archive=True, archive_file=None, dry_run=False):
+    """
+    Archive and delete one batch of rooms; returns their codes. With
+    ``archive_file`` (an open text file) records are written there as
+    NDJSON instead of to ``ArchivedRoom``; with ``archive=False`` they are
+    only deleted.
+    """
+    batch_size = batch_size or get_batch_size()
+    with DB_SECONDS.time('sweep_batch'), transaction.atomic():
+        pks = expired_batch(cutoff, batch_size)
+        if not pks:
+            return []
+        rooms = list(Room.objects.filter(pk__in=pks).values_list(
+            'pk', 'code', 'game_type', 'mode', 'player_count', 'created_at', 'game_state'))
+        if dry_run:
+            return [r[1] for r in rooms]
+
+        if archive_file is not None:
+            for record in archive_records(rooms):
+                archive_file.write(wire.dumps({
+                    'code': record.code, 'game_type': record.game_type, 'mode': record.mode,
+                    'player_count': record.player_count, 'created_at': record.created_at.isoformat(),
+                    'winner': record.winner, 'game_state': record.game_state, 'chat': record.chat,
+                }) + '\n')
+        elif archive:
+            # Saved one by one: bulk_create would materialise every room's
+            # chat first. The rows still share the batch's transaction.
+            for record in archive_records(rooms):
+                record.save()
+
+        ChatLog.objects.filter(room_id__in=pks).delete()
+        Room.objects.filter(pk__in=pks).delete()
+    return [r[1] for r in rooms]
+
+
+async def close_rooms(codes):
+    """Drop swept rooms from this process and close their sockets everywhere."""
+    layer = get_channel_layer()
+    for code in codes:
+        room_states.rooms.pop(code, None)
+        scheduler.cancel_room(code)
+        await room_states.store.discard(code)
+        await layer.group_send(group_name(code), {'type': 'room_closed', 'code': 4000})
+
+
+async def sweep(batch_size=None, archive=True):
+    """Sweep every expired room in batches from inside the server; returns the count."""
+    batch_size = batch_size or get_batch_size()
+    # Archive the latest state of rooms that are still live here.
+    await room_states.flush()
+    cutoff = sweep_cutoff()
+    total = 0
+    while True:
+        codes = await database_sync_to_async(sweep_batch)(cutoff, batch_size, archive)
+        await close_rooms(codes)
+        total += len(codes)
+        if len(codes) < batch_size:
+            return total
+        # Let sockets get a turn between batches.
+        await asyncio.sleep(0)
+
+
+def ensure_periodic():
+    interval = get_sweep_interval()
+    if interval:
+        scheduler.schedule('sweeper', 'sweep', interval, periodic_sweep)
+
+
+async def periodic_sweep():
+    try:
+        swept = await sweep()
+        if swept:
+            logger.info("Swept %d expired rooms", swept)
+    finally:
+        ensure_periodic()
@@ -1,3 +1,1121 @@
-from django.test import TestCase
+import asyncio
+import copy
+import csv
+import datetime
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import CommandError, call_command
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase, TransactionTestCase
+from django.utils import timezone
+
+from benchmarks import bench_ws_load
+
+from .chat import ChatSink, chat_sink, history, parse_cursor
+from .deltas import diff
+from .engines import IllegalAction, get_engine, tictactoe_solver
+from .engines.ludo_ai import choose_move
+from .engines.snakes import DEFAULT_LAYOUT, FINISH, LAYOUTS, simulate, validate_layout
+from .ludo_board import BOARD_104, COLORS, LudoBoard, geometry_for
+from .lifespan import lifespan, shutdown
+from .media import media_service
+from .models import ArchivedRoom, ChatLog, Room
+from .protocol import ProtocolError, negotiate, parse
+from .ratelimit import KeyedBuckets, MessageLimiter, TokenBucket
+from .room_cache import RoomCache, room_cache
+from .routing import websocket_urlpatterns
+from .scheduler import Scheduler, scheduler
+from .state import RoomStateManager, room_states
+from .stickers import MAX_QUERY_LENGTH, StickerCatalog, generated, normalize
+from .stores import memory_store
+from .sweeper import close_rooms, sweep_batch, sweep_cutoff
+from . import exports, wire
+
+
+async def apply_and_publish(manager, code, action):
+    """Submit ``action`` to ``manager`` the way ``actions.apply_action`` does, without broadcasting."""
+    async def run(live):
+        live.state, events = get_engine(live.game_type).apply(live.state, action)
+        manager.mark_dirty(live)
+        await manager.publish(live)
+        return events
+    return await manager.submit(code, run)
+
+
+def apply_patch(state, ops):
+    """``game.js`` applyPatch: the state ``diff`` ops turn ``state`` into."""
+    state = copy.deepcopy(state)
+    for op in ops:
+        path = op[0]
+        if not path:
+            state = op[1]
+            continue
+        target = state
+        for key in path[:-1]:
+            target = target[key]
+        if len(op) == 1:
+            del target[path[-1]]
+        else:
+            target[path[-1]] = op[1]
+    return state
+
+
+def seated(game_type, players=2):
+    """A fresh ONLINE game with ``players`` joined, one per colour."""
+    engine = get_engine(game_type)
+    state = engine.initial_state('ONLINE', players)
+    for i in range(players):
+        state, _ = engine.apply(state, {
+            'type': 'join', 'player_id': f'p{i + 1}', 'name': f'Player {i + 1}',
+            'mode': 'ONLINE', 'player_count': players,
+        })
+    return engine, state
+
+
+def list_scan_captures(state, side, pos):
+    """Opponents a piece of ``side`` landing on ``pos`` captures, by the pre-LudoBoard scan over every piece."""
+    colors = COLORS if geometry_for(state) is BOARD_104 else COLORS[:4]
+    total = len(colors) * 13
+    offsets = {c: i * 13 for i, c in enumerate(colors)}
+    safe = {square for i in range(len(colors)) for square in (i * 13, (i * 13 + 8) % total)}
+    if not 0 <= pos < 52:
+        return set()
+    square = (pos + offsets[side]) % total
+    if square in safe:
+        return set()
+    return {
+        (p['side'], i)
+        for p in state['players'].values() if p['side'] != side and p['side'] in offsets
+        for i, other in enumerate(p['pieces'])
+        if 0 <= other < 52 and (other + offsets[p['side']]) % total == square
+    }
+
+
+class TicTacToeEngineTests(SimpleTestCase):
+    def test_join_seats_x_then_o_then_spectators(self):
+        engine, state = seated('TIC_TAC_TOE')
+        self.assertEqual([p['side'] for p in state['players'].values()], ['X', 'O'])
+        _, events = engine.apply(state, {'type': 'join', 'player_id': 'p3', 'name': 'C'})
+        self.assertEqual(events, [{'type': 'joined', 'side': 'SPECTATOR'}])
+
+    def test_move_takes_the_cell_and_passes_the_turn(self):
+        engine, state = seated('TIC_TAC_TOE')
+        new_state, events = engine.apply(state, {'type': 'move', 'player': 'X', 'index': 4})
+        self.assertEqual(new_state['board'][4], 'X')
+        self.assertEqual(new_state['turn'], 'O')
+        self.assertEqual(events, [])
+        # apply works on a copy.
+        self.assertEqual(state['board'], [None] * 9)
+        self.assertEqual(state['turn'], 'X')
+
+    def test_illegal_moves_are_refused(self):
+        engine, state = seated('TIC_TAC_TOE')
+        state, _ = engine.apply(state, {'type': 'move', 'player': 'X', 'index': 0})
+        for action in (
+            {'type': 'move', 'player': 'X', 'index': 1},  # not X's turn
+            {'type': 'move', 'player': 'O', 'index': 0},  # taken
+            {'type': 'move', 'player': 'O', 'index': 9},  # off the board
+            {'type': 'move', 'player': 'O', 'index': '1'},
+            {'type': 'fly', 'player': 'O'},
+        ):
+            with self.subTest(action=action), self.assertRaises(IllegalAction):
+                engine.apply(state, action)
+
+    def test_win_ends_the_game_and_reset_alternates_the_start(self):
+        engine, state = seated('TIC_TAC_TOE')
+        for player, index in (('X', 0), ('O', 3), ('X', 1), ('O', 4), ('X', 2)):
+            state, events = engine.apply(state, {'type': 'move', 'player': player, 'index': index})
+        self.assertEqual(events, [{'type': 'game_over', 'winner': 'X'}])
+        self.assertTrue(state['game_over'])
+        with self.assertRaises(IllegalAction):
+            engine.apply(state, {'type': 'move', 'player': 'O', 'index': 8})
+        state, _ = engine.apply(state, {'type': 'reset'})
+        self.assertEqual(state['board'], [None] * 9)
+        self.assertEqual(state['turn'], 'O')
+
+    def test_full_board_without_a_line_is_a_draw(self):
+        engine, state = seated('TIC_TAC_TOE')
+        for index in (0, 1, 2, 4, 3, 5, 7, 6, 8):
+            state, events = engine.apply(state, {'type': 'move', 'player': state['turn'], 'index': index})
+        self.assertEqual(state['winner'], 'Draw')
+
+
+class TicTacToeSolverTests(SimpleTestCase):
+    def bot_losses(self, board, turn, bot):
+        """Games lost by perfect play for ``bot`` against every reply from ``board``."""
+        if tictactoe_solver.winner(board) or None not in board:
+            return int(tictactoe_solver.winner(board) not in (None, bot))
+        if turn == bot:
+            mask = tictactoe_solver.best_moves(board, bot)
+            moves = [i for i in range(9) if mask >> i & 1]
+        else:
+            moves = [i for i, cell in enumerate(board) if cell is None]
+        losses = 0
+        for i in moves:
+            board[i] = turn
+            losses += self.bot_losses(board, 'O' if turn == 'X' else 'X', bot)
+            board[i] = None
+        return losses
+
+    def test_perfect_play_never_loses(self):
+        for bot in ('X', 'O'):
+            for turn in ('X', 'O'):
+                with self.subTest(bot=bot, turn=turn):
+                    self.assertEqual(self.bot_losses([None] * 9, turn, bot), 0)
+
+    def test_mistake_rate_follows_the_difficulty(self):
+        # X threatens 0-1-2; the only perfect reply for O is the block at 2.
+        board = ['X', 'X', None, None, 'O', None, None, None, None]
+        self.assertEqual(tictactoe_solver.best_moves(board, 'O'), 1 << 2)
+        for difficulty, rate in tictactoe_solver.MISTAKE_RATES.items():
+            with self.subTest(difficulty=difficulty):
+                rng = random.Random(7)
+                misses = sum(tictactoe_solver.choose_move(board, 'O', rate, rng) != 2 for _ in range(2000))
+                # A mistake picks any free cell, the block included.
+                expected = 2000 * rate * 5 / 6
+                self.assertAlmostEqual(misses, expected, delta=60)
+        self.assertGreater(
+            tictactoe_solver.MISTAKE_RATES['EASY'], tictactoe_solver.MISTAKE_RATES['MEDIUM'])
+        self.assertEqual(tictactoe_solver.MISTAKE_RATES['HARD'], 0.0)
+
+    def test_unknown_difficulty_is_not_stored(self):
+        engine = get_engine('TIC_TAC_TOE')
+        self.assertEqual(engine.initial_state('COMPUTER', 2, difficulty='EASY')['bot_difficulty'], 'EASY')
+        for difficulty in (None, '', 'easy', 'IMPOSSIBLE'):
+            with self.subTest(difficulty=difficulty):
+                self.assertNotIn('bot_difficulty', engine.initial_state('COMPUTER', 2, difficulty=difficulty))
+
+
+class LudoEngineTests(SimpleTestCase):
+    def test_roll_without_a_move_waits_for_the_pass(self):
+        engine, state = seated('LUDO')
+        self.assertFalse(engine.has_valid_moves(state, 'RED', 3))
+        state, events = engine.apply(state, {'type': 'roll', 'player': 'RED', 'value': 3})
+        self.assertEqual(state['phase'], 'AUTO_PASS')
+        self.assertEqual(events[-1], {'type': 'auto_pass', 'side': 'RED'})
+        with self.assertRaises(IllegalAction):
+            engine.apply(state, {'type': 'move', 'player': 'RED', 'index': 0})
+        state, _ = engine.apply(state, {'type': 'pass', 'player': 'RED'})
+        self.assertEqual((state['turn'], state['phase']), ('GREEN', 'ROLL'))
+
+    def test_six_brings_a_piece_out_and_rolls_again(self):
+        engine, state = seated('LUDO')
+        self.assertTrue(engine.has_valid_moves(state, 'RED', 6))
+        state, _ = engine.apply(state, {'type': 'roll', 'player': 'RED', 'value': 6})
+        self.assertEqual(state['phase'], 'MOVE')
+        self.assertEqual(engine.greedy_move(state, 'RED', 6), 0)
+        state, events = engine.apply(state, {'type': 'move', 'player': 'RED', 'index': 0})
+        self.assertEqual(events[0]['from'], -1)
+        self.assertNotEqual(state['players']['p1']['pieces'][0], -1)
+        self.assertEqual((state['turn'], state['phase']), ('RED', 'ROLL'))
+
+    def test_out_of_turn_and_bad_pieces_are_refused(self):
+        engine, state = seated('LUDO')
+        with self.assertRaises(IllegalAction):
+            engine.apply(state, {'type': 'roll', 'player': 'GREEN', 'value': 6})
+        with self.assertRaises(IllegalAction):
+            engine.apply(state, {'type': 'move', 'player': 'RED', 'index': 0})
+        state, _ = engine.apply(state, {'type': 'roll', 'player': 'RED', 'value': 6})
+        for index in (4, -1, None):
+            with self.subTest(index=index), self.assertRaises(IllegalAction):
+                engine.apply(state, {'type': 'move', 'player': 'RED', 'index': index})
+        with self.assertRaises(IllegalAction):
+            engine.apply(state, {'type': 'pass', 'player': 'RED'})
+
+
+class SnakesEngineTests(SimpleTestCase):
+    def test_roll_follows_ladders_and_passes_the_turn(self):
+        engine, state = seated('SNAKES_AND_LADDERS')
+        self.assertIn([1, 38], state['layout']['ladders'])
+        state, events = engine.apply(state, {'type': 'roll', 'player': 'RED', 'value': 1})
+        self.assertEqual(events, [{'type': 'moved', 'side': 'RED', 'from': 0, 'to': 38}])
+        self.assertEqual(state['turn'], 'GREEN')
+        with self.assertRaises(IllegalAction):
+            engine.apply(state, {'type': 'roll', 'player': 'RED', 'value': 1})
+
+    def test_exact_roll_to_the_finish_wins(self):
+        engine, state = seated('SNAKES_AND_LADDERS')
+        state['layout'] = {'snakes': [], 'ladders': [], 'name': 'EMPTY'}
+        state['players']['p1']['pos'] = FINISH - 4
+        over, _ = engine.apply(state, {'type': 'roll', 'player': 'RED', 'value': 6})
+        self.assertEqual(over['players']['p1']['pos'], FINISH - 2)  # bounced back
+        won, events = engine.apply(state, {'type': 'roll', 'player': 'RED', 'value': 4})
+        self.assertEqual(won['winner'], 'RED')
+        self.assertEqual(events[-1], {'type': 'game_over', 'winner': 'RED'})
+
+    def test_rooms_without_a_stored_layout_play_the_default(self):
+        engine, state = seated('SNAKES_AND_LADDERS')
+        del state['layout']
+        state, events = engine.apply(state, {'type': 'roll', 'player': 'RED', 'value': 1})
+        self.assertEqual(events, [{'type': 'moved', 'side': 'RED', 'from': 0, 'to': 38}])
+        self.assertEqual(state['layout']['name'], DEFAULT_LAYOUT)
+
+    def test_layout_validation(self):
+        for layout in LAYOUTS.values():
+            validate_layout(layout)
+        for layout in (
+            {'snakes': [[10, 20]]},  # a snake has to go down
+            {'ladders': [[20, 10]]},
+            {'snakes': [[100, 1]]},
+            {'snakes': [[30, 2]], 'ladders': [[30, 50]]},  # two starts on one square
+            {'ladders': [[1, 2, 3]]},
+        ):
+            with self.subTest(layout=layout), self.assertRaises(IllegalAction):
+                validate_layout(layout)
+
+    def test_simulate_is_repeatable(self):
+        layout = LAYOUTS['QUICK']
+        self.assertEqual(simulate(layout, 50, 2, seed=3), simulate(layout, 50, 2, seed=3))
+
+
+class LudoBoardTests(SimpleTestCase):
+    def random_state(self, players, rng):
+        state = {'players': {}}
+        for side in COLORS[:players]:
+            state['players'][side.lower()] = {
+                'side': side, 'pieces': [rng.choice([-1, 57, rng.randint(0, 56)]) for _ in range(4)],
+            }
+        return state
+
+    def test_captures_match_the_list_scan(self):
+        rng = random.Random(5)
+        for players in (2, 4, 6, 8):
+            for _ in range(300):
+                state = self.random_state(players, rng)
+                board = LudoBoard.from_state(state)
+                side = rng.choice(COLORS[:players])
+                ci = board.geometry.color_index[side]
+                pos = rng.randint(-1, 57)
+                mask = board.opponents_at(ci, pos)
+                found = {(board.geometry.colors[pid // 4], pid % 4) for pid in range(len(board.pieces)) if mask >> pid & 1}
+                self.assertEqual(found, list_scan_captures(state, side, pos), (state, side, pos))
+                self.assertEqual(board.is_capture(ci, pos), bool(found))
+
+    def test_move_sends_captured_pieces_to_base(self):
+        state = {'players': {
+            'r': {'side': 'RED', 'pieces': [1, -1, -1, -1]},
+            # GREEN's 42 is RED's 3 on the 4-player board; so is YELLOW's 29.
+            'g': {'side': 'GREEN', 'pieces': [42, 42, 10, -1]},
+            'y': {'side': 'YELLOW', 'pieces': [29, -1, -1, 57]},
+        }}
+        board = LudoBoard.from_state(state)
+        victims = board.move(0, 0, 3)
+        self.assertEqual(sorted(victims), [4, 5, 8])
+        board.write_to(state)
+        self.assertEqual(state['players']['g']['pieces'], [-1, -1, 10, -1])
+        self.assertEqual(state['players']['y']['pieces'], [-1, -1, -1, 57])
+        self.assertEqual(board.occupancy[board.geometry.global_square(0, 3)], 1)
+
+    def test_start_and_star_squares_are_safe(self):
+        state = {'players': {
+            'r': {'side': 'RED', 'pieces': [-1, -1, -1, -1]},
+            'g': {'side': 'GREEN', 'pieces': [0, 8, -1, -1]},
+        }}
+        board = LudoBoard.from_state(state)
+        # GREEN's start and star are RED's 13 and 21.
+        self.assertTrue(board.geometry.is_safe(0, 13))
+        self.assertFalse(board.is_capture(0, 13))
+        self.assertFalse(board.is_capture(0, 21))
+        self.assertFalse(board.geometry.is_safe(0, 52))
+
+
+class LudoAITests(SimpleTestCase):
+    def two_player(self, red, green):
+        return {'players': {
+            'r': {'side': 'RED', 'pieces': red, 'finished_pieces': 0, 'is_bot': True},
+            'g': {'side': 'GREEN', 'pieces': green, 'finished_pieces': 0, 'is_bot': False},
+        }, 'turn': 'RED', 'phase': 'MOVE', 'dice_value': 3, 'winner': None}
+
+    def test_prefers_a_capture(self):
+        # RED 2 + 3 lands on GREEN's 44 (RED's 5); RED 20 + 3 takes nothing.
+        state = self.two_player([2, 20, -1, -1], [44, -1, -1, -1])
+        before = copy.deepcopy(state)
+        for difficulty in ('MEDIUM', 'HARD'):
+            with self.subTest(difficulty=difficulty):
+                self.assertEqual(choose_move(state, 'RED', 3, difficulty, random.Random(1)), 0)
+        self.assertEqual(state, before)
+
+    def test_prefers_a_safe_square_under_threat(self):
+        # RED 5 + 3 reaches the star on 8, away from GREEN's piece two squares
+        # behind it; RED 30 + 3 would just move on.
+        state = self.two_player([5, 30, -1, -1], [42, -1, -1, -1])
+        for difficulty in ('MEDIUM', 'HARD'):
+            with self.subTest(difficulty=difficulty):
+                self.assertEqual(choose_move(state, 'RED', 3, difficulty, random.Random(1)), 0)
+
+    def test_single_legal_move_and_no_move(self):
+        state = self.two_player([5, -1, -1, -1], [-1, -1, -1, -1])
+        self.assertEqual(choose_move(state, 'RED', 3, 'HARD'), 0)
+        state = self.two_player([-1, -1, -1, -1], [-1, -1, -1, -1])
+        self.assertIsNone(choose_move(state, 'RED', 3, 'HARD'))
+
+
+class SharedStoreTests(TransactionTestCase):
+    async def test_two_managers_share_the_memory_store(self):
+        with self.settings(ROOM_STATE_STORE='memory'):
+            a, b = RoomStateManager(), RoomStateManager()
+            self.assertIs(a.store, memory_store)
+            self.assertIs(b.store, memory_store)
+
+    async def test_concurrent_actions_converge_through_check_and_set(self):
+        room = await database_sync_to_async(Room.objects.create)(game_type='LUDO', player_count=2)
+        with self.settings(ROOM_STATE_STORE='memory'):
+            a, b = RoomStateManager(), RoomStateManager()
+            live_a = await a.attach(room.code)
+            live_b = await b.attach(room.code)
+            join = {'type': 'join', 'mode': 'ONLINE', 'player_count': 2}
+            await apply_and_publish(a, room.code, dict(join, player_id='p1', name='A'))
+            # b is a version behind; its action runs on a's state.
+            await apply_and_publish(b, room.code, dict(join, player_id='p2', name='B'))
+            self.assertEqual(sorted(live_b.state['players']), ['p1', 'p2'])
+
+            # Both roll for the same turn at once: one commits, the other
+            # loses the race, is retried on the new state and is refused.
+            # (A six, so the winner has a move to make rather than a pass.)
+            turn = live_b.state['turn']
+            refresh, cas, refused = memory_store._refresh, memory_store._cas, []
+
+            async def slow_refresh(code, version):
+                # Let the other manager read the same version before either commits.
+                found = await refresh(code, version)
+                await asyncio.sleep(0)
+                return found
+
+            async def counting_cas(code, expected, blob):
+                if not await cas(code, expected, blob):
+                    refused.append(expected)
+                    return False
+                return True
+
+            memory_store._refresh, memory_store._cas = slow_refresh, counting_cas
+            try:
+                results = await asyncio.gather(
+                    apply_and_publish(a, room.code, {'type': 'roll', 'player': turn, 'value': 6}),
+                    apply_and_publish(b, room.code, {'type': 'roll', 'player': turn, 'value': 6}),
+                    return_exceptions=True,
+                )
+            finally:
+                del memory_store._refresh, memory_store._cas
+            self.assertEqual(len(refused), 1)
+            self.assertEqual(sum(isinstance(r, IllegalAction) for r in results), 1)
+            await a.store.refresh(live_a)
+            self.assertEqual(live_a.version, live_b.version)
+            self.assertEqual(live_a.state, live_b.state)
+            self.assertEqual(live_a.state['phase'], 'MOVE')
+
+            await a.detach(room.code)
+            await b.detach(room.code)
+            await memory_store.discard(room.code)
+        stored = await database_sync_to_async(Room.objects.get)(pk=room.pk)
+        self.assertEqual(sorted(stored.game_state['players']), ['p1', 'p2'])
+
+
+class DiffTests(SimpleTestCase):
+    def assertRoundTrip(self, old, new):
+        ops = diff(old, new)
+        self.assertEqual(apply_patch(old, ops), new)
+        return ops
+
+    def test_nested_changes_are_patched_in_place(self):
+        old = {'turn': 'X', 'board': [None] * 9, 'players': {'p1': {'side': 'X'}}, 'gone': 1}
+        new = {'turn': 'O', 'board': ['X'] + [None] * 8, 'players': {'p1': {'side': 'X'}, 'p2': {'side': 'O'}}}
+        ops = self.assertRoundTrip(old, new)
+        self.assertCountEqual(ops, [
+            [['turn'], 'O'], [['board', 0], 'X'], [['players', 'p2'], {'side': 'O'}], [['gone']],
+        ])
+        self.assertEqual(diff(new, copy.deepcopy(new)), [])
+
+    def test_resized_lists_and_type_changes_are_replaced(self):
+        self.assertEqual(self.assertRoundTrip({'a': [1, 2]}, {'a': [1, 2, 3]}), [[['a'], [1, 2, 3]]])
+        self.assertEqual(self.assertRoundTrip({'a': {'b': 1}}, {'a': None}), [[['a'], None]])
+        self.assertEqual(self.assertRoundTrip([1], {'a': 1}), [[[], {'a': 1}]])
+
+    def test_patches_follow_real_games(self):
+        rng = random.Random(7)
+        engine, state = seated('LUDO', 4)
+        for _ in range(200):
+            side = state['turn']
+            new_state, _ = engine.apply(state, {'type': 'roll', 'player': side, 'value': rng.randint(1, 6)})
+            self.assertRoundTrip(state, new_state)
+            state = new_state
+            if state['phase'] == 'AUTO_PASS':
+                new_state, _ = engine.apply(state, {'type': 'pass', 'player': side})
+            else:
+                index = engine.greedy_move(state, side, state['dice_value'])
+                new_state, _ = engine.apply(state, {'type': 'move', 'player': side, 'index': index})
+            self.assertRoundTrip(state, new_state)
+            state = new_state
+
+
+class SchedulerTests(SimpleTestCase):
+    def test_jobs_are_deduplicated_per_room_and_kind(self):
+        async def scenario():
+            timers, ran = Scheduler(), []
+
+            async def record(tag):
+                ran.append(tag)
+
+            self.assertTrue(timers.schedule('R1', 'bot', 0.01, record, 'first'))
+            self.assertFalse(timers.schedule('R1', 'bot', 0, record, 'second'))
+            self.assertTrue(timers.schedule('R1', 'pass', 0.01, record, 'pass'))
+            self.assertTrue(timers.schedule('R2', 'bot', 0.01, record, 'other room'))
+            self.assertEqual(timers.pending_count(), 3)
+            self.assertEqual(timers.pending_count('R1'), 2)
+            await asyncio.sleep(0.05)
+            self.assertEqual(sorted(ran), ['first', 'other room', 'pass'])
+            self.assertEqual(timers.pending_count(), 0)
+            # Once run, the key can be scheduled again.
+            self.assertTrue(timers.schedule('R1', 'bot', 0, record, 'again'))
+            await asyncio.sleep(0.01)
+            self.assertEqual(ran[-1], 'again')
+
+        asyncio.run(scenario())
+
+    def test_cancelled_jobs_never_run(self):
+        async def scenario():
+            timers, ran = Scheduler(), []
+
+            async def record(tag):
+                ran.append(tag)
+
+            timers.schedule('R1', 'bot', 0.01, record, 'bot')
+            timers.schedule('R1', 'pass', 0.01, record, 'pass')
+            timers.schedule('R2', 'bot', 0.02, record, 'R2')
+            self.assertTrue(timers.cancel('R2', 'bot'))
+            self.assertFalse(timers.cancel('R2', 'bot'))
+            self.assertFalse(timers.is_pending('R2', 'bot'))
+            timers.cancel_room('R1')
+            self.assertEqual(timers.pending_count(), 0)
+            await asyncio.sleep(0.05)
+            self.assertEqual(ran, [])
+
+        asyncio.run(scenario())
+
+    def test_failing_callback_does_not_stop_the_timer(self):
+        async def scenario():
+            timers, ran = Scheduler(), []
+
+            async def fail():
+                raise RuntimeError('boom')
+
+            async def record(tag):
+                ran.append(tag)
+
+            timers.schedule('R1', 'bot', 0, fail)
+            timers.schedule('R2', 'bot', 0.01, record, 'R2')
+            with self.assertLogs('game.scheduler', 'ERROR'):
+                await asyncio.sleep(0.05)
+            self.assertEqual(ran, ['R2'])
+
+        asyncio.run(scenario())
+
+    def test_rebinds_when_the_event_loop_changes(self):
+        timers = Scheduler()
+
+        async def noop():
+            pass
+
+        async def first():
+            timers.schedule('R1', 'bot', 60, noop)
+            self.assertTrue(timers.is_pending('R1', 'bot'))
+
+        async def second():
+            # The job armed on the closed loop can never fire, so the key is free.
+            self.assertTrue(timers.schedule('R1', 'bot', 60, noop))
+            self.assertEqual(timers.pending_count(), 1)
+            timers.cancel_room('R1')
+
+        asyncio.run(first())
+        asyncio.run(second())
+
+
+class ChatSinkTests(TransactionTestCase):
+    def setUp(self):
+        self.room = Room.objects.create(game_type='TIC_TAC_TOE')
+
+    async def test_sink_writes_on_flush_and_when_full(self):
+        sink = ChatSink()
+        with self.settings(CHAT_FLUSH_SIZE=3, CHAT_FLUSH_INTERVAL=60):
+            await sink.add(self.room.pk, 'A', 'one')
+            await sink.add(self.room.pk, 'B', 'two')
+            self.assertTrue(sink.has_pending(self.room.pk))
+            self.assertEqual(await ChatLog.objects.acount(), 0)
+            await sink.add(self.room.pk, 'A', 'three')
+            self.assertFalse(sink.has_pending(self.room.pk))
+            self.assertEqual(await ChatLog.objects.acount(), 3)
+
+            await sink.add(self.room.pk, 'B', 'four')
+            await sink.flush()
+            scheduler.cancel('chat', 'flush')
+        messages = [m async for m in ChatLog.objects.order_by('timestamp', 'id').values_list('message', flat=True)]
+        self.assertEqual(messages, ['one', 'two', 'three', 'four'])
+
+    async def test_shutdown_writes_buffered_lines(self):
+        with self.settings(CHAT_FLUSH_INTERVAL=60):
+            await chat_sink.add(self.room.pk, 'A', 'last words')
+            await shutdown()
+            scheduler.cancel('chat', 'flush')
+        self.assertFalse(chat_sink.has_pending(self.room.pk))
+        self.assertEqual(await ChatLog.objects.filter(room=self.room).acount(), 1)
+
+
+class ChatHistoryTests(TransactionTestCase):
+    def setUp(self):
+        self.room = Room.objects.create(game_type='TIC_TAC_TOE')
+
+    def test_history_pages_backwards_with_a_keyset_cursor(self):
+        now = timezone.now()
+        # Two lines share a timestamp; the id breaks the tie.
+        stamps = [now, now + datetime.timedelta(seconds=1), now + datetime.timedelta(seconds=1),
+                  now + datetime.timedelta(seconds=2), now + datetime.timedelta(seconds=3)]
+        ChatLog.objects.bulk_create(
+            ChatLog(room=self.room, sender='A', message=str(i), timestamp=ts) for i, ts in enumerate(stamps))
+        other = Room.objects.create(game_type='TIC_TAC_TOE')
+        ChatLog.objects.create(room=other, sender='B', message='elsewhere')
+
+        seen, before = [], None
+        while True:
+            messages, cursor = history(self.room.pk, parse_cursor(before) if before else None, limit=2)
+            seen[:0] = [m['message'] for m in messages]
+            if cursor is None:
+                break
+            before = cursor
+        self.assertEqual(seen, ['0', '1', '2', '3', '4'])
+        self.assertEqual(history(self.room.pk, limit=10)[1], None)
+
+    def test_parse_cursor_rejects_malformed_cursors(self):
+        ts = timezone.now().isoformat()
+        self.assertEqual(parse_cursor([ts, '5'])[1], 5)
+        for cursor in ([ts], ['yesterday', 5], [ts, 'five'], None):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(parse_cursor(cursor))
+
+
+class ExportTests(TransactionTestCase):
+    def setUp(self):
+        self.room = Room.objects.create(game_type='TIC_TAC_TOE')
+        self.other = Room.objects.create(game_type='LUDO')
+        now = timezone.now()
+        self.lines = ['plain', 'with, comma', 'two\nlines', 'quote "this"', 'last']
+        ChatLog.objects.bulk_create(
+            ChatLog(room=self.room, sender='A', message=message, timestamp=now + datetime.timedelta(seconds=i))
+            for i, message in enumerate(self.lines))
+        ChatLog.objects.create(room=self.other, sender='B', message='elsewhere', timestamp=now)
+
+    def export(self, *args):
+        out = io.StringIO()
+        call_command('export_chatlogs', '-', *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv_is_streamed_in_batches(self):
+        chunks = exports.export_chunks(ChatLog.objects.filter(room=self.room), 'csv', chunk_size=2)
+        self.assertNotIsInstance(chunks, (list, str))
+        with mock.patch.object(exports, 'LINES_PER_CHUNK', 2):
+            chunks = list(chunks)
+        # Header plus five rows, two lines per chunk.
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.reader(io.StringIO(''.join(chunks))))
+        self.assertEqual(rows[0], list(exports.HEADER))
+        self.assertEqual([row[3] for row in rows[1:]], self.lines)
+        self.assertEqual({row[1] for row in rows[1:]}, {self.room.code})
+
+    def test_response_streams_with_the_format_content_type(self):
+        response = exports.streaming_response(ChatLog.objects.all(), 'ndjson', filename='logs')
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=logs.ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(records), 6)
+        self.assertEqual(sorted(records[0]), ['id', 'message', 'room', 'sender', 'timestamp'])
+
+    def test_command_filters_by_room_and_time(self):
+        records = [json.loads(line) for line in self.export('--format', 'ndjson', '--room', self.room.code).splitlines()]
+        self.assertEqual([r['message'] for r in records], self.lines)
+        since = ChatLog.objects.get(message='last').timestamp.isoformat()
+        rows = list(csv.reader(io.StringIO(self.export('--since', since, '--chunk-size', '1'))))
+        self.assertEqual([row[3] for row in rows[1:]], ['last'])
+        with self.assertRaises(CommandError):
+            self.export('--since', 'yesterday')
+
+    def test_command_writes_a_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'chat.csv')
+            call_command('export_chatlogs', path, stdout=io.StringIO(), stderr=io.StringIO())
+            with open(path, newline='', encoding='utf-8') as f:
+                self.assertEqual(''.join(exports.export_chunks(ChatLog.objects.all())), f.read())
+
+
+class SweeperTests(TransactionTestCase):
+    def setUp(self):
+        self.closed = Room.objects.create(game_type='LUDO', is_active=False)
+        self.expired = Room.objects.create(game_type='TIC_TAC_TOE', game_state={'players': {}, 'winner': 'X'})
+        Room.objects.filter(pk=self.expired.pk).update(last_activity=timezone.now() - datetime.timedelta(days=1))
+        self.fresh = Room.objects.create(game_type='TIC_TAC_TOE')
+        for room, message in ((self.expired, 'gg'), (self.expired, 'rematch?'), (self.fresh, 'hi')):
+            ChatLog.objects.create(room=room, sender='A', message=message)
+
+    def test_batch_archives_and_deletes_expired_rooms(self):
+        codes = sweep_batch(sweep_cutoff())
+        self.assertCountEqual(codes, [self.closed.code, self.expired.code])
+        self.assertEqual(list(Room.objects.values_list('code', flat=True)), [self.fresh.code])
+        self.assertEqual(list(ChatLog.objects.values_list('message', flat=True)), ['hi'])
+        archived = ArchivedRoom.objects.get(code=self.expired.code)
+        self.assertEqual(archived.winner, 'X')
+        self.assertEqual([line[2] for line in archived.chat], ['gg', 'rematch?'])
+        self.assertEqual(ArchivedRoom.objects.get(code=self.closed.code).chat, [])
+        self.assertEqual(sweep_batch(sweep_cutoff()), [])
+
+    def test_batches_take_inactive_rooms_first(self):
+        self.assertEqual(sweep_batch(sweep_cutoff(), batch_size=1), [self.closed.code])
+        self.assertEqual(sweep_batch(sweep_cutoff(), batch_size=1), [self.expired.code])
+        self.assertEqual(sweep_batch(sweep_cutoff(), batch_size=1), [])
+
+    def test_dry_run_file_and_delete_only_modes(self):
+        self.assertCountEqual(sweep_batch(sweep_cutoff(), dry_run=True), [self.closed.code, self.expired.code])
+        self.assertEqual(Room.objects.count(), 3)
+
+        out = io.StringIO()
+        sweep_batch(sweep_cutoff(), batch_size=1, archive_file=out)
+        record = json.loads(out.getvalue())
+        self.assertEqual((record['code'], record['chat']), (self.closed.code, []))
+        sweep_batch(sweep_cutoff(), archive=False)
+        self.assertFalse(ArchivedRoom.objects.exists())
+        self.assertEqual(Room.objects.count(), 1)
+
+    async def test_swept_rooms_close_their_sockets_with_4000(self):
+        application = AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        communicator = WebsocketCommunicator(application, f'/ws/game/{self.fresh.code}/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        try:
+            await close_rooms([self.fresh.code])
+            while True:
+                output = await communicator.receive_output(timeout=2)
+                if output['type'] == 'websocket.close':
+                    break
+            self.assertEqual(output['code'], 4000)
+            self.assertNotIn(self.fresh.code, room_states.rooms)
+        finally:
+            await communicator.disconnect()
+
+
+class RoomActivityTests(TransactionTestCase):
+    async def stored_activity(self, room):
+        return (await Room.objects.aget(pk=room.pk)).last_activity
+
+    async def test_activity_writes_are_coalesced(self):
+        room = await database_sync_to_async(Room.objects.create)(game_type='TIC_TAC_TOE')
+        created = room.last_activity
+        manager = RoomStateManager()
+        with self.settings(ROOM_ACTIVITY_WRITE_INTERVAL=30):
+            live = await manager.attach(room.code)
+            for _ in range(3):
+                manager.touch(live)
+                await manager.flush()
+            # Not due yet and nothing else to write.
+            self.assertEqual(await self.stored_activity(room), created)
+
+            # A state write carries the activity along.
+            manager.mark_dirty(live)
+            await manager.flush()
+            self.assertEqual(await self.stored_activity(room), live.last_activity)
+
+            # On its own it is written once the interval has passed.
+            manager.touch(live)
+            live.activity_written -= datetime.timedelta(seconds=31)
+            await manager.flush()
+            self.assertEqual(await self.stored_activity(room), live.last_activity)
+
+            # The last socket leaving always writes it.
+            manager.touch(live)
+            touched = live.last_activity
+            await manager.detach(room.code)
+            self.assertEqual(await self.stored_activity(room), touched)
+            self.assertNotIn(room.code, manager.rooms)
+
+    async def test_expiry_follows_last_activity_not_creation(self):
+        idle = await database_sync_to_async(Room.objects.create)(game_type='TIC_TAC_TOE')
+        old = await database_sync_to_async(Room.objects.create)(game_type='TIC_TAC_TOE')
+        long_ago = timezone.now() - datetime.timedelta(days=1)
+        await Room.objects.filter(pk=idle.pk).aupdate(last_activity=long_ago)
+        await Room.objects.filter(pk=old.pk).aupdate(created_at=long_ago)
+        self.assertTrue((await Room.objects.aget(pk=idle.pk)).is_expired)
+        self.assertFalse((await Room.objects.aget(pk=old.pk)).is_expired)
+
+        application = AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        refused = WebsocketCommunicator(application, f'/ws/game/{idle.code}/')
+        self.assertEqual(await refused.connect(), (False, 4000))
+        accepted = WebsocketCommunicator(application, f'/ws/game/{old.code}/')
+        connected, _ = await accepted.connect()
+        self.assertTrue(connected)
+        await accepted.disconnect()
+
+        manager = RoomStateManager()
+        live = await manager.attach(old.code)
+        live.last_activity = long_ago
+        self.assertTrue(live.is_expired)
+        manager.touch(live)
+        self.assertFalse(live.is_expired)
+        await manager.detach(old.code)
+
+
+class RoomCacheTests(TransactionTestCase):
+    def test_lookups_are_served_from_the_cache_until_the_ttl(self):
+        room = Room.objects.create(game_type='LUDO', player_count=4)
+        cache = RoomCache()
+        with self.assertNumQueries(1):
+            info = cache.get(room.code)
+            self.assertIs(cache.get(room.code), info)
+        self.assertEqual((info.pk, info.game_type, info.player_count), (room.pk, 'LUDO', 4))
+
+        info.cached_until = time.monotonic() - 1
+        self.assertIsNone(cache.lookup(room.code))
+        with self.assertNumQueries(1):
+            self.assertIsNot(cache.get(room.code), info)
+        with self.assertRaises(Room.DoesNotExist):
+            cache.get('NOROOM')
+
+    def test_least_recently_used_rooms_are_evicted(self):
+        a, b, c = (Room.objects.create(game_type='TIC_TAC_TOE') for _ in range(3))
+        cache = RoomCache()
+        with self.settings(ROOM_CACHE_SIZE=2):
+            cache.get(a.code)
+            cache.get(b.code)
+            cache.get(a.code)
+            cache.get(c.code)
+        self.assertEqual(list(cache.entries), [a.code, c.code])
+
+    def test_expired_entries_are_read_again(self):
+        room = Room.objects.create(game_type='TIC_TAC_TOE')
+        cache = RoomCache()
+        cache.get(room.code).last_activity = timezone.now() - datetime.timedelta(days=1)
+        with self.assertNumQueries(1):
+            info = cache.get(room.code)
+        self.assertFalse(cache.is_expired(info))
+
+    def test_saving_or_deleting_a_room_drops_its_entry(self):
+        room = Room.objects.create(game_type='TIC_TAC_TOE')
+        room_cache.get(room.code)
+        room.mode = 'COMPUTER'
+        room.save()
+        self.assertIsNone(room_cache.lookup(room.code))
+        self.assertEqual(room_cache.get(room.code).mode, 'COMPUTER')
+        room.delete()
+        self.assertIsNone(room_cache.lookup(room.code))
+        with self.assertRaises(Room.DoesNotExist):
+            room_cache.get(room.code)
+
+
+class StickerSearchTests(SimpleTestCase):
+    def test_normalize_matches_the_client(self):
+        # See normalizeStickerQuery in game.js: lower case, single spaces,
+        # cut to 64 code points.
+        self.assertEqual(normalize('  Funny \t CAT\n'), 'funny cat')
+        self.assertEqual(normalize(''), '')
+        self.assertEqual(normalize(42), '42')
+        self.assertEqual(normalize('😂' * 100), '😂' * MAX_QUERY_LENGTH)
+        self.assertEqual(normalize('a ' * 40), 'a ' * 32)
+
+    def test_results_are_ranked_and_deterministic(self):
+        catalog = StickerCatalog([
+            ('cat cute', 'cat'), ('funny cat', 'funny-cat'), ('category', 'category'), ('scatter', 'scatter'),
+        ])
+        # Exact tag, then prefix, then substring; ties in catalog order.
+        self.assertEqual(catalog.results('cat')[:4], ('cat', 'funny-cat', 'category', 'scatter'))
+        self.assertEqual(catalog.results('cat funny')[:1], ('funny-cat',))
+        self.assertEqual(catalog.results('Cat   FUNNY'), catalog.results('cat funny'))
+        self.assertEqual(catalog.results('cat funny')[1:], generated('cat funny'))
+        self.assertEqual(catalog.results('dog'), generated('dog'))
+        self.assertEqual(catalog.results(''), ('cat', 'funny-cat', 'category', 'scatter'))
+
+        # A fresh process (empty cache, rebuilt index) answers the same.
+        for query in ('funny', 'meme cool', 'ca', 'xyz'):
+            with self.subTest(query=query):
+                self.assertEqual(StickerCatalog().results(query), StickerCatalog().results(query))
+
+    def test_pages_cover_the_results_once(self):
+        catalog = StickerCatalog([(f'tag{i}', f'url{i}') for i in range(10)])
+        with self.settings(STICKER_PAGE_SIZE=4):
+            pages, more, page = [], True, 0
+            while more:
+                urls, more = catalog.page('tag', page)
+                pages.append(urls)
+                page += 1
+        self.assertEqual([len(p) for p in pages], [4, 4, 4, 1])
+        self.assertEqual(sum(pages, []), list(catalog.results('tag')))
+
+
+class RateLimitTests(SimpleTestCase):
+    def test_token_bucket_refills_over_time(self):
+        bucket = TokenBucket(rate=2, capacity=3, now=0)
+        self.assertEqual([bucket.allow(now=0) for _ in range(4)], [True, True, True, False])
+        self.assertAlmostEqual(bucket.retry_after(), 0.5)
+        self.assertFalse(bucket.allow(now=0.25))
+        self.assertTrue(bucket.allow(now=0.5))
+        self.assertFalse(bucket.is_full(now=1))
+        self.assertTrue(bucket.is_full(now=10))
+        self.assertEqual(bucket.tokens, 3)
+
+    def test_keyed_buckets_are_independent_and_pruned(self):
+        buckets = KeyedBuckets(rate=0.001, capacity=1, max_keys=2)
+        self.assertTrue(buckets.allow('a'))
+        self.assertFalse(buckets.allow('a'))
+        self.assertTrue(buckets.allow('b'))
+        buckets.buckets['b'].tokens = 1  # refilled
+        self.assertTrue(buckets.allow('c'))
+        self.assertEqual(sorted(buckets.buckets), ['a', 'c'])
+
+    def test_message_limiter_charges_the_total_only_for_sent_messages(self):
+        limiter = MessageLimiter(0.001, 3, {'chat_message': (0.001, 1)})
+        self.assertEqual(limiter.check('chat_message'), 0)
+        self.assertGreater(limiter.check('chat_message'), 0)
+        self.assertEqual(limiter.check('make_move'), 0)
+        self.assertEqual(limiter.check('make_move'), 0)
+        self.assertGreater(limiter.check('make_move'), 0)
+
+
+class ProtocolTests(SimpleTestCase):
+    def test_valid_messages_parse(self):
+        move = parse({'type': 'make_move', 'index': 4, 'player': 'X', 'extra': 1}, 1)
+        self.assertEqual((move.index, move.player), (4, 'X'))
+        chat = parse({'type': 'chat_message', 'message': 'hi'}, 1)
+        self.assertEqual(chat.sender, 'Anonymous')
+        self.assertIsNone(parse({'type': 'no_such_message'}, 1))
+
+    def test_bad_frames_are_rejected(self):
+        for data in (
+            [],
+            {'type': 'make_move', 'player': 'X'},
+            {'type': 'make_move', 'index': 'four', 'player': 'X'},
+            {'type': 'make_move', 'index': True, 'player': 'X'},
+            {'type': 'make_move', 'index': 256, 'player': 'X'},
+            {'type': 'roll_dice', 'player': 'X' * 17},
+            {'type': 'chat_message', 'message': 'x' * 2001},
+            {'type': 'search_stickers', 'query': 'cat', 'page': -1},
+            {'type': 'load_older_chat', 'before': '2020-01-01'},
+            {'type': 'join_game', 'protocol': 'two'},
+        ):
+            with self.subTest(data=data), self.assertRaises(ProtocolError):
+                parse(data, 2)
+
+    def test_versions(self):
+        self.assertEqual(negotiate(None), 1)
+        self.assertEqual(negotiate(99), 2)
+        with self.assertRaises(ProtocolError):
+            negotiate(0)
+
+
+class ConsumerTests(TransactionTestCase):
+    def tearDown(self):
+        # Disconnects leave chat to the periodic flush; write it while the
+        # test tables still exist.
+        chat_sink.flush_sync()
+        scheduler.cancel('chat', 'flush')
+
+    async def connect(self, code):
+        application = AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        communicator = WebsocketCommunicator(application, f'/ws/game/{code}/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive(self, communicator, kind):
+        """The next message of type ``kind``, skipping the others."""
+        while True:
+            data = await communicator.receive_json_from(timeout=2)
+            if data['type'] == kind:
+                return data
+
+    async def test_join_move_and_patch_broadcast(self):
+        room = await database_sync_to_async(Room.objects.create)(game_type='TIC_TAC_TOE')
+        x = await self.connect(room.code)
+        o = await self.connect(room.code)
+        try:
+            await x.send_json_to({'type': 'join_game'})
+            start_x = await self.receive(x, 'game_start')
+            self.assertEqual(start_x['side'], 'X')
+            chat = await self.receive(x, 'chat_history')
+            self.assertEqual(chat['messages'], [])
+            await o.send_json_to({'type': 'join_game'})
+            start_o = await self.receive(o, 'game_start')
+            self.assertEqual(start_o['side'], 'O')
+            self.assertEqual(start_o['version'], start_x['version'] + 1)
+
+            # X sees O's join as a patch on its snapshot.
+            state = start_x['game_state']
+            patch = await self.receive(x, 'game_patch')
+            while patch['version'] <= start_x['version']:
+                patch = await self.receive(x, 'game_patch')
+            state = apply_patch(state, patch['ops'])
+            self.assertEqual(state, start_o['game_state'])
+
+            await x.send_json_to({'type': 'make_move', 'index': 4, 'player': 'X'})
+            for communicator in (x, o):
+                patch = await self.receive(communicator, 'game_patch')
+                while patch['version'] <= start_o['version']:
+                    patch = await self.receive(communicator, 'game_patch')
+                self.assertEqual(patch['version'], start_o['version'] + 1)
+                self.assertCountEqual(patch['ops'], [[['board', 4], 'X'], [['turn'], 'O']])
+
+            await o.send_json_to({'type': 'make_move', 'index': 4, 'player': 'O'})
+            error = await self.receive(o, 'error')
+            self.assertEqual(error['message'], 'Invalid move or not your turn')
+            await o.send_json_to({'type': 'make_move', 'index': 'centre', 'player': 'O'})
+            error = await self.receive(o, 'error')
+            self.assertTrue(error['message'].startswith('Invalid message'))
+        finally:
+            await x.disconnect()
+            await o.disconnect()
+        stored = await database_sync_to_async(Room.objects.get)(pk=room.pk)
+        self.assertEqual(stored.game_state['board'][4], 'X')
+
+    async def test_binary_frames_only_for_rooms_with_a_msgpack_socket(self):
+        room = await database_sync_to_async(Room.objects.create)(game_type='TIC_TAC_TOE')
+        x = await self.connect(room.code)
+        o = await self.connect(room.code)
+        try:
+            await x.send_json_to({'type': 'join_game'})
+            await self.receive(x, 'chat_history')
+            live = room_states.rooms[room.code]
+            self.assertEqual(live.binary_subscribers, 0)
+
+            # Frames sent before o negotiated MessagePack are still text.
+            join = {'type': 'join_game', 'protocol': 2, 'encoding': wire.MSGPACK}
+            await o.send_json_to(join)
+            frame = await o.receive_from(timeout=2)
+            while not isinstance(frame, bytes):
+                frame = await o.receive_from(timeout=2)
+            self.assertEqual(wire.unpack(frame)['encoding'], wire.MSGPACK)
+            self.assertEqual(live.binary_subscribers, 1)
+            # Joining again does not count the socket twice.
+            await o.send_json_to(join)
+            histories = 0
+            while histories < 2:  # one per join
+                histories += wire.unpack(await o.receive_from(timeout=2))['type'] == 'chat_history'
+            self.assertEqual(live.binary_subscribers, 1)
+
+            await x.send_json_to({'type': 'make_move', 'index': 0, 'player': 'X'})
+            while True:
+                frame = await o.receive_from(timeout=2)
+                self.assertIsInstance(frame, bytes)
+                data = wire.unpack(frame)
+                if data['type'] == 'game_patch' and [['board', 0], 'X'] in data['ops']:
+                    break
+        finally:
+            await o.disconnect()
+        self.assertEqual(live.binary_subscribers, 0)
+        await x.disconnect()
+
+    async def test_unreadable_frames_are_charged_to_the_connection(self):
+        room = await database_sync_to_async(Room.objects.create)(game_type='TIC_TAC_TOE')
+        with self.settings(WS_MESSAGE_RATE=0.001, WS_MESSAGE_BURST=2, WS_MAX_FRAME_SIZE=64):
+            communicator = await self.connect(room.code)
+        try:
+            for frame in ('x' * 65, '{"type": "sync_state"', '[' * 20 + ']' * 20):
+                await communicator.send_to(text_data=frame)
+            replies = [(await communicator.receive_json_from(timeout=2))['type'] for _ in range(3)]
+            self.assertEqual(replies, ['error', 'error', 'rate_limited'])
+        finally:
+            await communicator.disconnect()
+
+    async def test_ai_request_waits_for_the_pending_reply(self):
+        room = await database_sync_to_async(Room.objects.create)(game_type='TIC_TAC_TOE')
+        communicator = await self.connect(room.code)
+
+        async def reply(message):
+            pass
+
+        # A reply for this room is already waiting to run.
+        scheduler.schedule(room.code, 'ai', 60, reply, '@ai meme')
+        try:
+            await communicator.send_json_to({'type': 'chat_message', 'message': '@ai meme', 'sender': 'A'})
+            error = await self.receive(communicator, 'error')
+            self.assertIn('still answering', error['message'])
+            # The refused request did not touch the room's reply budget.
+            self.assertNotIn(room.code, media_service.limits.buckets)
+        finally:
+            scheduler.cancel(room.code, 'ai')
+            await communicator.disconnect()
+
+
+class MetricsViewTests(SimpleTestCase):
+    def test_metrics_are_off_by_default(self):
+        with self.settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    def test_token_or_allowed_address_opens_them(self):
+        with self.settings(METRICS_TOKEN='s3cret', METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+            self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 404)
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'# TYPE', response.content)
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+
+class LifespanTests(SimpleTestCase):
+    async def test_shutdown_closes_the_media_session(self):
+        media_service._bind_loop()
+        session = media_service._get_session()
+        messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        await lifespan({'type': 'lifespan'}, receive, send)
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertTrue(session.closed)
+        self.assertIsNone(media_service._session)
+
+
+class LoadBenchmarkTests(TransactionTestCase):
+    def test_next_action_follows_the_game(self):
+        rng = random.Random(1)
+        engine, state = seated('TIC_TAC_TOE')
+        action = bench_ws_load.next_action('TIC_TAC_TOE', state, engine, rng)
+        self.assertEqual((action['type'], action['player']), ('make_move', 'X'))
+        self.assertIn(action['index'], range(9))
+        engine, state = seated('LUDO')
+        self.assertEqual(bench_ws_load.next_action('LUDO', state, engine, rng), {'type': 'roll_dice', 'player': 'RED'})
+        state, _ = engine.apply(state, {'type': 'roll', 'player': 'RED', 'value': 3})
+        # The server's auto-pass timer has the turn.
+        self.assertIsNone(bench_ws_load.next_action('LUDO', state, engine, rng))
+
+    def test_percentile(self):
+        values = [i / 1000 for i in range(1, 101)]
+        self.assertEqual(bench_ws_load.percentile(values, 0.5), 51.0)
+        self.assertEqual(bench_ws_load.percentile(values, 1), 100.0)
+        self.assertIsNone(bench_ws_load.percentile([], 0.5))
+
+    def test_scripted_games_run_end_to_end(self):
+        rooms = []
+        for _ in range(2):
+            room = Room.objects.create(game_type='TIC_TAC_TOE')
+            keys = []
+            for p in range(2):
+                session = SessionStore()
+                session['player_name'] = f'Player {p}'
+                session.create()
+                keys.append(session.session_key)
+            rooms.append((room.code, keys))
+        application = AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        counter = bench_ws_load.QueryCounter()
+        result = asyncio.run(bench_ws_load.run_game(application, 'TIC_TAC_TOE', rooms, 6, counter, seed=1))
+        self.assertEqual((result['rooms'], result['actions'], result['errors']), (2, 12, 0))
+        self.assertGreater(result['actions_per_s'], 0)
+        self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['max'])
@@ -4,5 +4,6 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('room/<str:room_code>/', views.room, name='room'),
+    path('metrics', views.metrics, name='metrics'),
     path('debug-save/', views.debug_save_chat, name='debug_save'),
 ]
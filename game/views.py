@@ -1,6 +1,12 @@
+import hmac
+
+from django.conf import settings
 from django.shortcuts import render, redirect
-from .models import Room, ChatLog
-from django.http import HttpResponse
+from . import metrics as metrics_registry
+from .engines import ENGINES
+from .models import Room, ChatLog, get_room_ttl
+from .room_cache import room_cache
+from django.http import Http404, HttpResponse
 
 def index(request):
     if not request.session.session_key:
@@ -19,9 +25,10 @@ def index(request):
         if action == 'join':
             room_code = request.POST.get('room_code')
             try:
-                room = Room.objects.get(code=room_code)
-                if room.is_expired:
-                    return render(request, 'game/index.html', {'error': 'Room code expired (valid for 5 mins)'})
+                room = room_cache.get(room_code)
+                if room_cache.is_expired(room):
+                    minutes = int(get_room_ttl().total_seconds() // 60)
+                    return render(request, 'game/index.html', {'error': f'Room code expired (inactive for over {minutes} mins)'})
                 return redirect('room', room_code=room.code)
             except Room.DoesNotExist:
                 return render(request, 'game/index.html', {'error': 'Room not found'})
@@ -34,14 +41,20 @@ def index(request):
             except ValueError:
                 player_count = 2
                 
-            room = Room.objects.create(game_type=game_type, mode=mode, player_count=player_count)
+            engine = ENGINES.get(game_type)
+            game_state = engine.initial_state(
+                mode, player_count,
+                layout=request.POST.get('layout'),
+                difficulty=request.POST.get('difficulty'),
+            ) if engine else {}
+            room = Room.objects.create(game_type=game_type, mode=mode, player_count=player_count, game_state=game_state)
             return redirect('room', room_code=room.code)
             
     return render(request, 'game/index.html')
 
 def room(request, room_code):
     try:
-        room = Room.objects.get(code=room_code)
+        room = room_cache.get(room_code)
         return render(request, 'game/room.html', {
             'room_code': room_code,
             'game_type': room.game_type
@@ -49,6 +62,27 @@ def room(request, room_code):
     except Room.DoesNotExist:
         return redirect('index')
 
+def get_metrics_token():
+    return getattr(settings, 'METRICS_TOKEN', '')
+
+def get_metrics_allowed_ips():
+    return getattr(settings, 'METRICS_ALLOWED_IPS', ())
+
+def metrics_allowed(request):
+    token = get_metrics_token()
+    if token:
+        scheme, _, sent = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(sent.encode(), token.encode()):
+            return True
+    return request.META.get('REMOTE_ADDR') in get_metrics_allowed_ips()
+
+def metrics(request):
+    # Not public: the counters reveal traffic and room activity.
+    if not metrics_allowed(request):
+        raise Http404
+    # Prometheus text exposition format
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def debug_save_chat(request):
     room = Room.objects.first()
     if not room:
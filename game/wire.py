@@ -0,0 +1,73 @@
+"""
+Encodings for WebSocket frames.
+
+Group broadcasts are encoded once by the sender and every consumer in the
+group forwards the finished frame (see ``GameConsumer.room_frame``),
+instead of each socket re-encoding the same dict. ``orjson`` is used when it
+is installed; the stdlib encoder is the fallback.
+
+Connections that ask for it at ``join_game`` get MessagePack binary frames
+instead of JSON text (``pack``/``unpack``). That is only offered when
+``msgpack`` is installed. Board arrays need no special packing, because
+cells and piece positions are small integers or None and MessagePack
+stores each of them in a single byte.
+
+``too_deep`` rejects absurdly nested frames before they reach the parser.
+"""
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional binary frames
+    msgpack = None
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+ENCODINGS = (JSON, MSGPACK) if msgpack is not None else (JSON,)
+
+
+if orjson is not None:
+    def dumps(obj):
+        return orjson.dumps(obj).decode()
+
+    loads = orjson.loads
+else:
+    def dumps(obj):
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+    loads = json.loads
+
+
+def pack(obj):
+    return msgpack.packb(obj)
+
+
+def unpack(data):
+    # Raises ValueError subclasses on bad input, like loads.
+    return msgpack.unpackb(data)
+
+
+STRINGS = re.compile(r'"(?:[^"\\]|\\.)*"')
+BRACKETS = re.compile(r'[\[\]{}]')
+
+
+def too_deep(text, limit):
+    """Whether arrays and objects in ``text`` nest more than ``limit`` levels."""
+    # Protocol messages are flat objects; only count when it could matter.
+    if text.count('{') + text.count('[') <= limit:
+        return False
+    depth = 0
+    for match in BRACKETS.finditer(STRINGS.sub('', text)):
+        if match.group() in '[{':
+            depth += 1
+            if depth > limit:
+                return True
+        else:
+            depth -= 1
+    return False